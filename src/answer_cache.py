@@ -0,0 +1,279 @@
+"""
+Answer cache for the RAG system.
+Generated answers are keyed by the normalized query, the ids and content
+hashes of the retrieved chunks, LANGUAGE_MODEL, a hash of INSTRUCTION_PROMPT
+and the context packing settings. Re-ingesting a changed note, switching
+models or editing the prompt therefore simply misses, so stale answers are
+never returned. Answers live in a memory LRU with a TTL, written through to a SQLite file.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+from lru import LRUCache
+from embedder import embed_query
+from embedding_cache import text_hash
+from generator import generate_answer, format_context
+from retriever import normalize_query
+import config
+from config import (
+    LANGUAGE_MODEL,
+    INSTRUCTION_PROMPT,
+    ANSWER_CACHE_PATH,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_SEMANTIC_THRESHOLD,
+)
+
+# Settings that change the packed context, and so the answer
+PACKING_SETTINGS = (
+    'CONTEXT_PACKING', 'CONTEXT_MAX_TOKENS', 'CONTEXT_MAX_CHUNK_TOKENS',
+    'CONTEXT_DEDUP_THRESHOLD', 'CONTEXT_TOKENIZER',
+)
+
+# Split points before each word that follows whitespace, so the pieces join back exactly
+_REPLAY_SPLIT_RE = re.compile(r'(?<=\s)(?=\S)')
+
+
+def replay(answer: str):
+    """
+    Yield a cached answer in word-sized pieces, like a streamed LLM response.
+
+    Args:
+        answer: The complete answer text
+
+    Yields:
+        Consecutive pieces of `answer`
+    """
+    for piece in _REPLAY_SPLIT_RE.split(answer):
+        if piece:
+            yield piece
+
+
+class AnswerCache:
+    """Two-level (memory LRU + SQLite) cache of generated answers."""
+
+    def __init__(self, path=ANSWER_CACHE_PATH, maxsize: int = ANSWER_CACHE_SIZE,
+                 ttl: float = ANSWER_CACHE_TTL,
+                 semantic_threshold: float = ANSWER_CACHE_SEMANTIC_THRESHOLD,
+                 model: str = LANGUAGE_MODEL, prompt: str = INSTRUCTION_PROMPT):
+        """
+        Args:
+            path: SQLite database file (None keeps answers in memory only)
+            maxsize: Maximum number of answers kept
+            ttl: Seconds an answer stays valid (None never expires)
+            semantic_threshold: Minimum cosine similarity between query
+                                embeddings to reuse the answer of a differently
+                                worded query over the same chunks (None disables)
+            model: Language model the answers belong to
+            prompt: Prompt template the answers were generated with
+        """
+        self.model = model
+        self.prompt_hash = text_hash(prompt)
+        self.packing = [getattr(config, name) for name in PACKING_SETTINGS]
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.semantic_threshold = semantic_threshold
+        self.memory = LRUCache(maxsize, ttl=ttl)
+        self.semantic_hits = 0
+        # context key -> {answer key: unit-length query embedding}, for semantic lookups
+        self._similar = {}
+        self._lock = threading.Lock()
+
+        self._conn = None
+        if path is not None:
+            path = Path(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(path), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " key TEXT PRIMARY KEY,"
+                " context_key TEXT NOT NULL,"
+                " answer TEXT NOT NULL,"
+                " stored_at REAL NOT NULL,"
+                " embedding BLOB"
+                ") WITHOUT ROWID"
+            )
+            self._conn.commit()
+            self._load()
+
+    def _load(self):
+        """Drop expired rows and restore the most recent answers into memory."""
+        with self._lock:
+            if self.ttl is not None:
+                self._conn.execute("DELETE FROM answers WHERE stored_at <= ?", (time.time() - self.ttl,))
+                self._conn.commit()
+            rows = self._conn.execute(
+                "SELECT key, context_key, answer, stored_at, embedding FROM answers"
+                " ORDER BY stored_at DESC LIMIT ?",
+                (self.maxsize,),
+            ).fetchall()
+        # Oldest first, so the most recent answers end up most recently used
+        for key, context_key, answer, stored_at, blob in reversed(rows):
+            self.memory.put(key, answer, stored_at=stored_at)
+            if blob is not None:
+                self._similar.setdefault(context_key, {})[key] = np.frombuffer(blob, dtype=np.float32)
+
+    def context_key(self, chunk_ids: list, documents: list) -> str:
+        """
+        Hash the retrieved chunks together with the model, prompt and packing settings.
+
+        Args:
+            chunk_ids: Ids of the retrieved chunks, in result order
+            documents: Texts of the retrieved chunks, aligned with `chunk_ids`
+
+        Returns:
+            Hex digest identifying the generation context
+        """
+        chunks = [[chunk_id, text_hash(doc)] for chunk_id, doc in zip(chunk_ids, documents)]
+        encoded = json.dumps([self.model, self.prompt_hash, self.packing, chunks]).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    @staticmethod
+    def key(query: str, context_key: str) -> str:
+        """Return the cache key of a query within a generation context."""
+        return hashlib.sha256(f"{context_key}\n{normalize_query(query)}".encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, query: str, chunk_ids: list, documents: list, query_embedding=None):
+        """
+        Look up the answer for a query over the given chunks.
+
+        Args:
+            query: The user's question
+            chunk_ids: Ids of the retrieved chunks, in result order
+            documents: Texts of the retrieved chunks, aligned with `chunk_ids`
+            query_embedding: The query's embedding, for semantic lookups
+
+        Returns:
+            Tuple (answer, hit): the cached answer and 'exact' or 'semantic',
+            or (None, None)
+        """
+        context_key = self.context_key(chunk_ids, documents)
+        answer = self.memory.get(self.key(query, context_key))
+        if answer is not None:
+            return answer, 'exact'
+        if self.semantic_threshold is None or query_embedding is None:
+            return None, None
+
+        vector = self._unit(query_embedding)
+        with self._lock:
+            candidates = list(self._similar.get(context_key, {}).items())
+        for similarity, key in sorted(((float(vector @ other), key) for key, other in candidates), reverse=True):
+            if similarity < self.semantic_threshold:
+                break
+            answer = self.memory.get(key)
+            if answer is not None:
+                with self._lock:
+                    self.semantic_hits += 1
+                return answer, 'semantic'
+            with self._lock:  # evicted or expired
+                self._similar.get(context_key, {}).pop(key, None)
+        return None, None
+
+    def put(self, query: str, chunk_ids: list, documents: list, answer: str, query_embedding=None):
+        """
+        Store the answer for a query over the given chunks.
+
+        Args:
+            query: The user's question
+            chunk_ids: Ids of the retrieved chunks, in result order
+            documents: Texts of the retrieved chunks, aligned with `chunk_ids`
+            answer: The generated answer
+            query_embedding: The query's embedding, kept for semantic lookups
+        """
+        context_key = self.context_key(chunk_ids, documents)
+        key = self.key(query, context_key)
+        stored_at = time.time()
+        self.memory.put(key, answer, stored_at=stored_at)
+        vector = None if query_embedding is None else self._unit(query_embedding)
+        with self._lock:
+            if vector is not None:
+                self._similar.setdefault(context_key, {})[key] = vector
+                if sum(len(keys) for keys in self._similar.values()) > 2 * self.maxsize:
+                    self._prune_similar()
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO answers (key, context_key, answer, stored_at, embedding)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, context_key, answer, stored_at,
+                     None if vector is None else array('f', vector).tobytes()),
+                )
+                self._conn.execute(
+                    "DELETE FROM answers WHERE key NOT IN"
+                    " (SELECT key FROM answers ORDER BY stored_at DESC LIMIT ?)",
+                    (self.maxsize,),
+                )
+                self._conn.commit()
+
+    def _prune_similar(self):
+        """Forget embeddings of answers no longer in memory (caller holds the lock)."""
+        for context_key in list(self._similar):
+            keys = {key: vector for key, vector in self._similar[context_key].items() if key in self.memory}
+            if keys:
+                self._similar[context_key] = keys
+            else:
+                del self._similar[context_key]
+
+    def generate_answer(self, query: str, retrieved_chunks: list, chunk_ids: list,
+                        stream: bool = True):
+        """
+        Answer from the cache, or generate (and cache) the answer with the LLM.
+
+        The response is that of `generator.generate_answer`: a cached answer
+        is replayed in pieces when streaming. A streamed answer is stored only
+        once it has been consumed completely.
+
+        Args:
+            query: The user's question
+            retrieved_chunks: List of tuples (document, score) from the retriever
+            chunk_ids: Ids of the retrieved chunks (the `Retrieval.ids` of the query)
+            stream: Whether to stream the response (default: True)
+
+        Returns:
+            Tuple (response, hit): a generator that yields response chunks
+            (stream=True) or the complete response as a string (stream=False),
+            and 'exact' or 'semantic' if the answer came from the cache, else None
+        """
+        documents = [doc for doc, _ in retrieved_chunks]
+        # Already in the embedding cache from retrieval, so this costs no Ollama call
+        embedding = embed_query(query) if self.semantic_threshold is not None else None
+        answer, hit = self.get(query, chunk_ids, documents, query_embedding=embedding)
+        if answer is not None:
+            return (replay(answer) if stream else answer), hit
+
+        response = generate_answer(format_context(retrieved_chunks, query), query, stream=stream)
+        if not stream:
+            self.put(query, chunk_ids, documents, response, query_embedding=embedding)
+            return response, None
+        return self._store_when_done(response, query, chunk_ids, documents, embedding), None
+
+    def _store_when_done(self, response, query, chunk_ids, documents, embedding):
+        pieces = []
+        for piece in response:
+            pieces.append(piece)
+            yield piece
+        self.put(query, chunk_ids, documents, ''.join(pieces), query_embedding=embedding)
+
+    def stats(self) -> dict:
+        """Return the hit/miss counters and current size."""
+        return dict(self.memory.stats(), semantic_hits=self.semantic_hits)
+
+    def close(self):
+        """Close the underlying SQLite connection."""
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
@@ -0,0 +1,105 @@
+"""
+Asyncio front end for the Retriever.
+Embeds queries with the async Ollama client and runs the CPU-bound search and
+rerank in a thread pool, so concurrent requests overlap instead of queueing
+behind one another.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import ollama
+from retriever import Retriever
+from embedder import acached_embed_batch
+from pipeline import AsyncLimiter
+from tracing import span
+from config import TOP_N, ASYNC_EMBED_CONCURRENCY, ASYNC_RERANK_CONCURRENCY
+
+
+class AsyncRetriever:
+    """Async counterpart of Retriever with per-stage concurrency limits."""
+
+    def __init__(self, retriever: Retriever = None, executor=None):
+        """
+        Args:
+            retriever: The Retriever to wrap (a new one is created if omitted)
+            executor: Executor for the rerank stage (a thread pool sized to
+                      ASYNC_RERANK_CONCURRENCY is created if omitted)
+        """
+        self.retriever = retriever if retriever is not None else Retriever()
+        self.executor = executor or ThreadPoolExecutor(max_workers=ASYNC_RERANK_CONCURRENCY)
+        self.client = ollama.AsyncClient()
+        self.embed_limiter = AsyncLimiter(ASYNC_EMBED_CONCURRENCY)
+        self.rerank_limiter = AsyncLimiter(ASYNC_RERANK_CONCURRENCY)
+
+    async def embed_queries(self, queries: list) -> list:
+        """
+        Embed queries with the async Ollama client (through the embedding cache).
+
+        Args:
+            queries: The search queries
+
+        Returns:
+            List of query embeddings aligned with `queries`
+        """
+        async with self.embed_limiter:
+            with span("query_embed", queries=len(queries)):
+                return await acached_embed_batch(self.client, list(queries))
+
+    async def retrieve_and_rerank(self, query: str, top_n: int = TOP_N,
+                                  tags=None, links_to=None) -> list:
+        """
+        Async version of `Retriever.retrieve_and_rerank`.
+
+        Args:
+            query: The search query
+            top_n: Number of final results to return
+            tags: Only consider chunks carrying one of these tags
+            links_to: Only consider chunks linking to one of these notes
+
+        Returns:
+            List of tuples (document, reranker_score) sorted by relevance
+        """
+        return (await self.retrieve_and_rerank_batch(
+            [query], top_n=top_n, tags=tags, links_to=links_to
+        ))[0]
+
+    async def retrieve_and_rerank_batch(self, queries: list, top_n: int = TOP_N,
+                                        tags=None, links_to=None, with_stats: bool = False) -> list:
+        """
+        Async version of `Retriever.retrieve_and_rerank_batch`.
+
+        Args:
+            queries: The search queries
+            top_n: Number of final results to return per query
+            tags: Only consider chunks carrying one of these tags
+            links_to: Only consider chunks linking to one of these notes
+            with_stats: Return a `Retrieval` per query instead of its results only
+
+        Returns:
+            List aligned with `queries` of lists of (document, score) tuples
+            (or of `Retrieval`s, with `with_stats`)
+        """
+        if not queries:
+            return []
+        query_embeddings = await self.embed_queries(queries)
+
+        loop = asyncio.get_running_loop()
+        async with self.rerank_limiter:
+            return await loop.run_in_executor(
+                self.executor,
+                partial(
+                    self.retriever.retrieve_and_rerank_batch,
+                    list(queries),
+                    top_n=top_n,
+                    query_embeddings=query_embeddings,
+                    tags=tags,
+                    links_to=links_to,
+                    with_stats=with_stats,
+                ),
+            )
+
+    def close(self):
+        """Shut down the rerank executor."""
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,251 @@
+"""
+Offline batch mode for the RAG system (`python main.py --batch`).
+Streams questions from a JSONL file, embeds and reranks them in batches,
+generates answers on a bounded pool of concurrent Ollama calls, and appends
+the results to a JSONL file in input order. Questions already answered in
+the output file are skipped, so an interrupted run resumes where it stopped.
+
+Input lines are JSON objects with a "question" (or "query") field, or bare
+JSON strings. Each output line is the input object plus "index" (line number
+in the input), "answer", "chunk_ids", "stage" (the reranking stage, see
+`Retriever.retrieve_and_rerank_batch`) and "timings".
+"""
+
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from embedder import cached_embed_batch
+from generator import generate_answer, format_context
+from pipeline import batched
+from config import (
+    TOP_N,
+    BATCH_RETRIEVE_SIZE,
+    BATCH_GENERATE_WORKERS,
+    BATCH_MAX_IN_FLIGHT,
+)
+
+# Stages reported in the time split, in pipeline order
+STAGES = ('read', 'embed', 'retrieve', 'generate', 'write')
+
+
+def read_questions(path, done: set, stats: dict):
+    """
+    Stream the questions of a JSONL file, skipping those already answered.
+
+    Args:
+        path: Input JSONL file
+        done: (index, question) pairs found in the output file
+        stats: Counters; 'read_s', 'skipped' and 'invalid' are updated
+
+    Yields:
+        Dicts with the input fields plus 'index' and 'question'
+    """
+    with open(path, encoding='utf-8') as f:
+        start = time.perf_counter()
+        for index, line in enumerate(f):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                if isinstance(item, str):
+                    item = {'question': item}
+                question = str(item.get('question', item.get('query', ''))).strip()
+            except (ValueError, AttributeError):
+                question = ''
+            if not question:
+                print(f"Skipping line {index + 1}: expected a JSON object with a 'question' field")
+                stats['invalid'] += 1
+                continue
+            if (index, question) in done:
+                stats['skipped'] += 1
+                continue
+            stats['read_s'] += time.perf_counter() - start
+            yield dict(item, index=index, question=question)
+            start = time.perf_counter()
+
+
+def answered(path) -> set:
+    """
+    Return the (index, question) pairs already written to an output file.
+
+    A line cut short by an interrupted run is ignored (and answered again).
+    """
+    done = set()
+    path = Path(path)
+    if not path.exists():
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                done.add((record['index'], record['question']))
+            except (ValueError, KeyError, TypeError):
+                continue
+    return done
+
+
+class BatchAnswerer:
+    """Retrieves in batches and generates answers concurrently, yielding results in input order."""
+
+    def __init__(self, retriever, answer_cache=None, top_n: int = TOP_N,
+                 batch_size: int = BATCH_RETRIEVE_SIZE, workers: int = BATCH_GENERATE_WORKERS,
+                 max_in_flight: int = BATCH_MAX_IN_FLIGHT):
+        """
+        Args:
+            retriever: The Retriever
+            answer_cache: Optional AnswerCache to answer repeated questions from
+            top_n: Chunks retrieved per question
+            batch_size: Questions embedded and reranked together
+            workers: Concurrent answer generations
+            max_in_flight: Questions retrieved but not yet yielded
+        """
+        self.retriever = retriever
+        self.answer_cache = answer_cache
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_in_flight = max(max_in_flight, batch_size)
+        # Busy seconds per stage (generation is summed over the workers)
+        self.stage_s = dict.fromkeys(STAGES, 0.0)
+        self.failed = 0
+
+    def _generate(self, item: dict, chunks: list, chunk_ids: list):
+        """Answer one question from its reranked chunks (runs on a worker thread)."""
+        start = time.perf_counter()
+        if not chunks:
+            answer = None
+        elif self.answer_cache is not None:
+            answer, _ = self.answer_cache.generate_answer(item['question'], chunks, chunk_ids, stream=False)
+        else:
+            answer = generate_answer(format_context(chunks, item['question']), item['question'], stream=False)
+        return answer, time.perf_counter() - start
+
+    def run(self, items):
+        """
+        Answer a stream of questions.
+
+        Retrieval of the next batch overlaps with the generations still
+        running for earlier batches; at most `max_in_flight` questions are
+        held at once. Results are yielded in input order, each as soon as it
+        and every question before it have finished. A failed generation is
+        reported and left out (so a resumed run retries it).
+
+        Args:
+            items: Iterable of dicts with 'index' and 'question'
+
+        Yields:
+            Result dicts: the item plus 'answer', 'chunk_ids', 'stage' and 'timings'
+        """
+        pending = deque()  # (item, chunk ids, stage, retrieve seconds, future), in input order
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch-generate") as pool:
+            for batch in batched(items, self.batch_size):
+                # Make room for the batch before retrieving it
+                while pending and (len(pending) + len(batch) > self.max_in_flight or pending[0][4].done()):
+                    result = self._finish(*pending.popleft())
+                    if result is not None:
+                        yield result
+
+                questions = [item['question'] for item in batch]
+                start = time.perf_counter()
+                embeddings = cached_embed_batch(questions)
+                embedded = time.perf_counter()
+                results = self.retriever.retrieve_and_rerank_batch(
+                    questions, top_n=self.top_n, query_embeddings=embeddings, with_stats=True
+                )
+                retrieved = time.perf_counter()
+                self.stage_s['embed'] += embedded - start
+                self.stage_s['retrieve'] += retrieved - embedded
+                retrieve_s = (retrieved - start) / len(batch)
+
+                for item, (chunks, chunk_ids, stats) in zip(batch, results):
+                    future = pool.submit(self._generate, item, chunks, chunk_ids)
+                    pending.append((item, chunk_ids, stats['stage'], retrieve_s, future))
+
+            while pending:
+                result = self._finish(*pending.popleft())
+                if result is not None:
+                    yield result
+
+    def _finish(self, item: dict, chunk_ids: list, stage: str, retrieve_s: float, future):
+        """Wait for one generation and build its result (None if it failed)."""
+        try:
+            answer, generate_s = future.result()
+        except Exception as e:
+            self.failed += 1
+            print(f"Error answering line {item['index'] + 1} ('{item['question'][:50]}...'): {e}")
+            return None
+        self.stage_s['generate'] += generate_s
+        return dict(item, answer=answer, chunk_ids=chunk_ids, stage=stage,
+                    timings={'retrieve_s': retrieve_s, 'generate_s': generate_s})
+
+
+def run_batch(retriever, input_path, output_path, answer_cache=None,
+              workers: int = BATCH_GENERATE_WORKERS, top_n: int = TOP_N) -> dict:
+    """
+    Answer every question of `input_path` not yet in `output_path`.
+
+    Args:
+        retriever: The Retriever
+        input_path: JSONL file of questions
+        output_path: JSONL file results are appended to (and resumed from)
+        answer_cache: Optional AnswerCache
+        workers: Concurrent answer generations
+        top_n: Chunks retrieved per question
+
+    Returns:
+        Dict with 'answered', 'failed', 'skipped', 'invalid', 'wall_s',
+        'queries_per_s' and the busy seconds per stage ('<stage>_s')
+    """
+    done = answered(output_path)
+    if done:
+        print(f"Resuming: {len(done)} questions already answered in {output_path}.")
+    counters = {'read_s': 0.0, 'skipped': 0, 'invalid': 0}
+    answerer = BatchAnswerer(retriever, answer_cache=answer_cache, top_n=top_n, workers=workers)
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    start = time.perf_counter()
+    with open(output_path, 'a', encoding='utf-8') as out:
+        for result in answerer.run(read_questions(input_path, done, counters)):
+            write_start = time.perf_counter()
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+            out.flush()
+            answerer.stage_s['write'] += time.perf_counter() - write_start
+            written += 1
+            if written % 10 == 0:
+                elapsed = time.perf_counter() - start
+                print(f"Answered {written} questions ({written / elapsed:.2f} queries/s)")
+    wall_s = time.perf_counter() - start
+
+    answerer.stage_s['read'] = counters['read_s']
+    return {
+        'answered': written,
+        'failed': answerer.failed,
+        'skipped': counters['skipped'],
+        'invalid': counters['invalid'],
+        'wall_s': wall_s,
+        'queries_per_s': written / wall_s if wall_s > 0 else 0.0,
+        **{f"{stage}_s": seconds for stage, seconds in answerer.stage_s.items()},
+    }
+
+
+def format_report(report: dict) -> str:
+    """Format `run_batch`'s report: throughput and the per-stage time split."""
+    busy = sum(report[f"{stage}_s"] for stage in STAGES) or 1.0
+    lines = [
+        "=" * 60,
+        f"Answered {report['answered']} questions in {report['wall_s']:.1f}s "
+        f"({report['queries_per_s']:.2f} queries/s); {report['skipped']} already done, "
+        f"{report['failed']} failed, {report['invalid']} invalid lines.",
+        f"{'stage':<10} {'busy s':>9} {'share':>7}",
+    ]
+    for stage in STAGES:
+        seconds = report[f"{stage}_s"]
+        lines.append(f"{stage:<10} {seconds:>9.2f} {100 * seconds / busy:>6.1f}%")
+    lines.append("(generation time is summed over concurrent workers)")
+    lines.append("=" * 60)
+    return "\n".join(lines)
@@ -0,0 +1,8 @@
+"""
+Offline benchmarks for the RAG system. Run from src/, e.g.:
+
+    python -m bench.chunker                 # chunker micro-benchmark
+    python -m bench.run --fake-reranker     # end-to-end suite against a fake Ollama
+    python -m bench.fake_ollama             # the fake Ollama server on its own
+    python -m bench.startup                 # main.py import times and start-up timeline
+"""
@@ -0,0 +1,109 @@
+"""
+Micro-benchmark: `chunk_by_headers_obsidian` vs the streaming `iter_chunks_obsidian`.
+
+Builds a multi-megabyte note by repeating the bundled dataset, checks that both
+chunkers produce identical output, and reports throughput and peak Python
+memory for each.
+
+Usage (from src/):
+    python -m bench.chunker [--size-mb 8] [--repeats 3]
+"""
+
+import argparse
+import mmap
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from obsidian import chunk_by_headers_obsidian, iter_chunks_obsidian
+
+BUNDLED_DATASET_PATH = Path(__file__).resolve().parents[2] / "assets" / "dataset.txt"
+
+
+def build_note(size_mb: float) -> str:
+    """Repeat the bundled dataset (with numbered headers) up to `size_mb` megabytes."""
+    base = BUNDLED_DATASET_PATH.read_text(encoding="utf-8")
+    target = int(size_mb * 1024 * 1024)
+    parts = []
+    total = 0
+    i = 0
+    while total < target:
+        part = base.replace("## ", f"## [{i}] ") + f"\n#copy{i} [[Note {i}]] https://example.com/{i}#s\n"
+        parts.append(part)
+        total += len(part.encode("utf-8"))
+        i += 1
+    return "".join(parts)
+
+
+def measure(fn, repeats: int):
+    """Return (result, best seconds, peak traced bytes) over `repeats` runs."""
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Obsidian chunkers.")
+    parser.add_argument("--size-mb", type=float, default=8.0, help="size of the generated note")
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per chunker")
+    args = parser.parse_args()
+
+    note = build_note(args.size_mb)
+    size_mb = len(note.encode("utf-8")) / (1024 * 1024)
+
+    fd, path = tempfile.mkstemp(suffix=".md")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(note)
+        del note
+
+        def current():
+            with open(path, encoding="utf-8", newline="") as f:
+                return chunk_by_headers_obsidian(f.read())
+
+        def streaming_file():
+            with open(path, "rb") as f:
+                return sum(1 for _ in iter_chunks_obsidian(f))
+
+        def streaming_mmap():
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return sum(1 for _ in iter_chunks_obsidian(mm))
+
+        reference, current_time, current_peak = measure(current, args.repeats)
+
+        with open(path, "rb") as f:
+            streamed = list(iter_chunks_obsidian(f))
+        assert streamed == reference, "iter_chunks_obsidian output differs from chunk_by_headers_obsidian"
+        del streamed
+
+        rows = [("chunk_by_headers_obsidian", current_time, current_peak)]
+        for name, fn in (("iter_chunks_obsidian (file)", streaming_file),
+                         ("iter_chunks_obsidian (mmap)", streaming_mmap)):
+            count, elapsed, peak = measure(fn, args.repeats)
+            assert count == len(reference)
+            rows.append((name, elapsed, peak))
+    finally:
+        os.remove(path)
+
+    print(f"Note: {size_mb:.1f} MB, {len(reference)} chunks - outputs identical")
+    print(f"{'chunker':<30} {'time (s)':>9} {'MB/s':>8} {'peak MB':>8} {'speedup':>8}")
+    for name, elapsed, peak in rows:
+        print(
+            f"{name:<30} {elapsed:>9.3f} {size_mb / elapsed:>8.1f} "
+            f"{peak / (1024 * 1024):>8.1f} {current_time / elapsed:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
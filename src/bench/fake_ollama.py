@@ -0,0 +1,277 @@
+"""
+Local stand-in for the Ollama HTTP API, for offline and reproducible benchmarks.
+
+Serves /api/embed (deterministic feature-hashed embeddings, so texts sharing
+words are similar) and /api/chat (a fixed token stream as NDJSON, or a single
+response), with configurable latencies. Point the ollama client at it through
+OLLAMA_HOST, which must be set before `ollama` is imported.
+
+Usage (from src/):
+    python -m bench.fake_ollama --port 11435 --token-latency 0.01
+    OLLAMA_HOST=http://127.0.0.1:11435 python main.py
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+_WORD_RE = re.compile(r'\w+')
+
+ANSWER_TOKENS = (
+    "The", " answer", " is", " in", " the", " provided", " notes", ":", " see",
+    " the", " section", " above", " for", " the", " details", ".",
+)
+
+
+def fake_embedding(text: str, dim: int) -> list:
+    """
+    Deterministic bag-of-words embedding (feature hashing with signed buckets).
+
+    Args:
+        text: The text to embed
+        dim: Embedding dimension
+
+    Returns:
+        Unit-length embedding as a list of floats
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in _WORD_RE.findall(text.lower()):
+        h = zlib.crc32(word.encode('utf-8'))
+        vector[h % dim] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[zlib.crc32(text.encode('utf-8')) % dim] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+
+class FakeOllama:
+    """Threaded HTTP server implementing the parts of the Ollama API we use."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, dim: int = 256,
+                 embed_latency: float = 0.0, embed_latency_per_text: float = 0.0,
+                 first_token_latency: float = 0.0, token_latency: float = 0.0,
+                 tokens: int = 32):
+        """
+        Args:
+            host: Interface to bind
+            port: TCP port (0 picks a free one)
+            dim: Embedding dimension
+            embed_latency: Seconds added to every /api/embed request
+            embed_latency_per_text: Seconds added per embedded text
+            first_token_latency: Seconds before the first chat token (prefill)
+            token_latency: Seconds between chat tokens
+            tokens: Tokens per chat answer
+        """
+        self.dim = dim
+        self.embed_latency = embed_latency
+        self.embed_latency_per_text = embed_latency_per_text
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.tokens = tokens
+        self.counts = {'embed_requests': 0, 'embedded_texts': 0, 'chat_requests': 0}
+        self._lock = threading.Lock()
+
+        self.httpd = ThreadingHTTPServer((host, port), _FakeOllamaHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllama":
+        """Serve from a daemon thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def count(self, key: str, n: int = 1):
+        with self._lock:
+            self.counts[key] += n
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class _FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send each streamed token immediately instead of coalescing small writes
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        elif self.path == "/api/tags":
+            self._send_json({"models": []})
+        elif self.path == "/":
+            self._send_text("Ollama is running")
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json({"error": "invalid JSON"}, status=400)
+            return
+        if self.path == "/api/embed":
+            self._embed(body)
+        elif self.path == "/api/chat":
+            self._chat(body)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _embed(self, body: dict):
+        fake = self.server.fake
+        texts = body.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        fake.count('embed_requests')
+        fake.count('embedded_texts', len(texts))
+        delay = fake.embed_latency + fake.embed_latency_per_text * len(texts)
+        if delay:
+            time.sleep(delay)
+        self._send_json({
+            "model": body.get("model", ""),
+            "embeddings": [fake_embedding(text, fake.dim) for text in texts],
+        })
+
+    def _chat(self, body: dict):
+        fake = self.server.fake
+        if not body.get("messages"):
+            # Ollama only loads the model for a request without messages
+            self._send_json({
+                "model": body.get("model", ""),
+                "created_at": _now(),
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "done_reason": "load",
+            })
+            return
+        fake.count('chat_requests')
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in body.get("messages", []))
+        tokens = [ANSWER_TOKENS[i % len(ANSWER_TOKENS)] for i in range(fake.tokens)]
+        final = {
+            "model": body.get("model", ""),
+            "created_at": _now(),
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(fake.first_token_latency * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int(fake.token_latency * len(tokens) * 1e9),
+        }
+
+        if fake.first_token_latency:
+            time.sleep(fake.first_token_latency)
+        if not body.get("stream", True):
+            if fake.token_latency:
+                time.sleep(fake.token_latency * len(tokens))
+            final["message"]["content"] = "".join(tokens)
+            self._send_json(final)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i, token in enumerate(tokens):
+                if i and fake.token_latency:
+                    time.sleep(fake.token_latency)
+                self._write_chunk({
+                    "model": body.get("model", ""),
+                    "created_at": _now(),
+                    "message": {"role": "assistant", "content": token},
+                    "done": False,
+                })
+            self._write_chunk(final)
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _write_chunk(self, payload: dict):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, payload: dict, status: int = 200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_text(self, text: str):
+        data = text.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server for offline benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--dim", type=int, default=256, help="embedding dimension")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds per embed request")
+    parser.add_argument("--embed-latency-per-text", type=float, default=0.0, help="seconds per embedded text")
+    parser.add_argument("--first-token-latency", type=float, default=0.0, help="seconds before the first token")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds between tokens")
+    parser.add_argument("--tokens", type=int, default=32, help="tokens per answer")
+    args = parser.parse_args()
+
+    fake = FakeOllama(
+        host=args.host, port=args.port, dim=args.dim,
+        embed_latency=args.embed_latency, embed_latency_per_text=args.embed_latency_per_text,
+        first_token_latency=args.first_token_latency, token_latency=args.token_latency,
+        tokens=args.tokens,
+    )
+    print(f"Fake Ollama listening on {fake.url} (set OLLAMA_HOST={fake.url})")
+    try:
+        fake.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+"""
+Offline end-to-end benchmark suite.
+
+Starts a fake Ollama server (see bench.fake_ollama), generates synthetic notes
+and vaults (see bench.synthetic) and measures, each in a fresh process so
+start-up time and peak RSS are not shared between scenarios:
+
+    startup   import + Retriever() + background loads + first query, cold
+              (index built) and warm
+    query     concurrent query mixes through Retriever.retrieve_and_rerank
+    generate  concurrent streamed generate_answer calls (time to first token)
+    ingest    ingest.py over a synthetic vault into ChromaDB
+
+Results are written as JSON tagged with the git commit, so runs can be
+compared across commits.
+
+Usage (from src/):
+    python -m bench.run --fake-reranker
+    python -m bench.run --chunks 1000,100000,1000000 --concurrency 1,8,32
+    python -m bench.run --compare before.json after.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+from bench.fake_ollama import FakeOllama
+from bench.synthetic import Corpus, write_note, write_vault
+
+SRC_DIR = Path(__file__).resolve().parents[1]
+SCENARIOS = ("startup", "query", "generate", "ingest")
+
+
+# --- Measurement helpers ---
+
+def peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    """Peak resident set size of this process (or its waited-for children) in MB."""
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def latency_summary(seconds: list) -> dict:
+    """Summarize latencies as count, mean and p50/p95/p99/max in milliseconds."""
+    from tracing import percentile
+
+    values = sorted(seconds)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean_ms': 1000 * sum(values) / len(values),
+        'p50_ms': 1000 * percentile(values, 50),
+        'p95_ms': 1000 * percentile(values, 95),
+        'p99_ms': 1000 * percentile(values, 99),
+        'max_ms': 1000 * values[-1],
+    }
+
+
+def git_commit() -> dict:
+    """Return the current commit and whether the work tree has local changes."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=SRC_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=SRC_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': dirty}
+
+
+class OverlapReranker:
+    """Stand-in for the cross-encoder: scores word overlap, with optional per-pair latency."""
+
+    def __init__(self, latency_per_pair: float = 0.0):
+        self.latency_per_pair = latency_per_pair
+
+    def predict(self, sentence_pairs, batch_size: int = 32, **kwargs):
+        import numpy as np
+
+        if self.latency_per_pair:
+            time.sleep(self.latency_per_pair * len(sentence_pairs))
+        scores = []
+        for query, document in sentence_pairs:
+            query_words = set(query.lower().split())
+            scores.append(len(query_words & set(document.lower().split())) / (len(query_words) or 1))
+        return np.array(scores, dtype=np.float32)
+
+
+# --- Scenarios (run inside worker processes, with cwd = the bench workspace) ---
+
+def _make_retriever(spec: dict, background: bool = False):
+    from retriever import Retriever
+
+    reranker = OverlapReranker(spec['rerank_latency']) if spec['fake_reranker'] else None
+    return Retriever(reranker=reranker, background=background)
+
+
+def run_startup(spec: dict) -> dict:
+    """Time imports, Retriever construction (background loading, as in main.py) and the first query."""
+    start = time.perf_counter()
+    import retriever  # noqa: F401 (timed import of the retrieval stack)
+    imported = time.perf_counter()
+    instance = _make_retriever(spec, background=True)
+    initialized = time.perf_counter()
+    instance.wait_ready()
+    ready = time.perf_counter()
+    instance.retrieve_and_rerank(Corpus(spec['seed']).queries(1, spec['chunks'])[0][1])
+    first_query = time.perf_counter()
+    return {
+        'import_s': imported - start,
+        'init_s': initialized - imported,
+        'ready_s': ready - imported,
+        'first_query_s': first_query - ready,
+        'total_s': first_query - start,
+    }
+
+
+def run_query(spec: dict) -> dict:
+    """Run the query mix at each concurrency level and report latency and throughput."""
+    retriever = _make_retriever(spec)
+    corpus = Corpus(spec['seed'])
+    retriever.retrieve_and_rerank(corpus.queries(1, spec['chunks'])[0][1])  # build/load the index
+
+    levels = []
+    for stream, concurrency in enumerate(spec['concurrency'], start=1):
+        mix = corpus.queries(spec['queries'], spec['chunks'], stream=stream)
+
+        def timed(query):
+            t = time.perf_counter()
+            retriever.retrieve_and_rerank(query)
+            return time.perf_counter() - t
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(timed, [query for _, query in mix]))
+        wall = time.perf_counter() - start
+        levels.append({
+            'concurrency': concurrency,
+            'queries': len(mix),
+            'wall_s': wall,
+            'qps': len(mix) / wall,
+            'latency': latency_summary(latencies),
+        })
+    return {'levels': levels}
+
+
+def run_generate(spec: dict) -> dict:
+    """Stream answers concurrently and report time to first token and total latency."""
+    from generator import generate_answer
+
+    corpus = Corpus(spec['seed'])
+    levels = []
+    for concurrency in spec['concurrency']:
+        def answer(i):
+            context = "\n".join(corpus.section(i * 3 + j) for j in range(3))
+            t = time.perf_counter()
+            first = None
+            tokens = 0
+            for _ in generate_answer(context, f"question {i}", stream=True):
+                if first is None:
+                    first = time.perf_counter() - t
+                tokens += 1
+            return first, time.perf_counter() - t, tokens
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(answer, range(spec['answers'])))
+        wall = time.perf_counter() - start
+        levels.append({
+            'concurrency': concurrency,
+            'answers': len(results),
+            'wall_s': wall,
+            'answers_per_s': len(results) / wall,
+            'tokens_per_s': sum(tokens for _, _, tokens in results) / wall,
+            'first_token': latency_summary([first for first, _, _ in results if first is not None]),
+            'latency': latency_summary([total for _, total, _ in results]),
+        })
+    return {'levels': levels}
+
+
+def run_ingest(spec: dict) -> dict:
+    """Ingest the synthetic vault into a fresh collection."""
+    import ingest
+
+    start = time.perf_counter()
+    report = ingest.main(full=True, vault="vault")
+    wall = time.perf_counter() - start
+    if report is None:
+        raise RuntimeError("ingestion failed")
+    return {
+        'wall_s': wall,
+        'chunks': report['added'],
+        'chunks_per_s': report['added'] / wall,
+        'children_peak_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+RUNNERS = {
+    'startup': run_startup,
+    'query': run_query,
+    'generate': run_generate,
+    'ingest': run_ingest,
+}
+
+
+def worker(spec: dict):
+    """Entry point of a worker process: run one scenario and write its result."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        result = RUNNERS[spec['scenario']](spec)
+    result['peak_rss_mb'] = peak_rss_mb()
+    Path(spec['result_path']).write_text(json.dumps(result), encoding="utf-8")
+
+
+# --- Orchestration ---
+
+def run_in_worker(spec: dict, workdir: Path, env: dict) -> dict:
+    """Run one scenario in a fresh Python process inside `workdir`."""
+    spec = dict(spec, result_path=str(workdir / "result.json"))
+    proc = subprocess.run(
+        [sys.executable, "-m", "bench.run", "--worker", json.dumps(spec)],
+        cwd=workdir, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        return {'error': proc.stderr.strip().splitlines()[-1:] or [f"exit code {proc.returncode}"]}
+    return json.loads((workdir / "result.json").read_text(encoding="utf-8"))
+
+
+def prepare_workspace(chunks: int, scenarios: list, seed: int) -> Path:
+    """Create a scratch directory holding the synthetic note and vault."""
+    from config import DATASET_PATH
+
+    workdir = Path(tempfile.mkdtemp(prefix=f"rag-bench-{chunks}-"))
+    corpus = Corpus(seed)
+    if DATASET_PATH and not Path(DATASET_PATH).is_absolute():
+        write_note(workdir / DATASET_PATH, chunks, corpus)
+    else:
+        raise SystemExit("bench.run needs a relative DATASET_PATH in config.py")
+    if "ingest" in scenarios:
+        write_vault(workdir / "vault", chunks, corpus)
+    return workdir
+
+
+def run_suite(args) -> dict:
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    sizes = [int(n) for n in args.chunks.split(",")]
+    concurrency = [int(n) for n in args.concurrency.split(",")]
+
+    fake = FakeOllama(
+        dim=args.dim,
+        embed_latency=args.embed_latency,
+        embed_latency_per_text=args.embed_latency_per_text,
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency,
+        tokens=args.tokens,
+    ).start()
+    env = dict(os.environ, OLLAMA_HOST=fake.url, PYTHONPATH=os.pathsep.join(
+        p for p in (str(SRC_DIR), os.environ.get("PYTHONPATH")) if p
+    ))
+
+    results = []
+    try:
+        for chunks in sizes:
+            print(f"Preparing {chunks} synthetic chunks...")
+            setup_start = time.perf_counter()
+            workdir = prepare_workspace(chunks, scenarios, args.seed)
+            print(f"  written in {time.perf_counter() - setup_start:.1f}s to {workdir}")
+            base = {
+                'chunks': chunks,
+                'seed': args.seed,
+                'fake_reranker': args.fake_reranker,
+                'rerank_latency': args.rerank_latency,
+                'concurrency': concurrency,
+                'queries': args.queries,
+                'answers': args.answers,
+            }
+            runs = []
+            if "startup" in scenarios:
+                runs += [("startup", "cold"), ("startup", "warm")]
+            runs += [(s, None) for s in scenarios if s != "startup"]
+            try:
+                for scenario, label in runs:
+                    print(f"  {scenario}{f' ({label})' if label else ''}...")
+                    result = run_in_worker(dict(base, scenario=scenario), workdir, env)
+                    result.update(scenario=scenario, chunks=chunks)
+                    if label:
+                        result['label'] = label
+                    results.append(result)
+            finally:
+                if args.keep:
+                    print(f"  kept workspace {workdir}")
+                else:
+                    shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        fake.stop()
+
+    return {
+        **git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': {k: v for k, v in vars(args).items() if k not in ("compare", "worker", "out", "keep")},
+        'fake_ollama': fake.counts,
+        'results': results,
+    }
+
+
+def flatten(result: dict) -> dict:
+    """Flatten one scenario result into {(key, metric): value} rows for tables and comparisons."""
+    key = (result['scenario'], result['chunks'], result.get('label'))
+    rows = {}
+
+    def add(prefix, value, level_key):
+        if isinstance(value, dict):
+            for name, inner in value.items():
+                add(f"{prefix}.{name}" if prefix else name, inner, level_key)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            rows[(level_key, prefix)] = value
+
+    for name, value in result.items():
+        if name == 'levels':
+            for level in value:
+                level_key = key + (level['concurrency'],)
+                add("", {k: v for k, v in level.items() if k != 'concurrency'}, level_key)
+        elif name not in ('chunks',):
+            add(name, value, key + (None,))
+    return rows
+
+
+def describe(level_key) -> str:
+    scenario, chunks, label, concurrency = level_key
+    text = f"{scenario} {chunks}"
+    if label:
+        text += f" {label}"
+    if concurrency is not None:
+        text += f" c={concurrency}"
+    return text
+
+
+def print_report(report: dict):
+    for result in report['results']:
+        if 'error' in result:
+            print(f"{result['scenario']} {result['chunks']}: ERROR {result['error']}")
+    rows = {}
+    for result in report['results']:
+        rows.update(flatten(result))
+    for (level_key, metric), value in rows.items():
+        if metric.endswith(("_s", "qps", "p50_ms", "p95_ms", "p99_ms", "rss_mb")):
+            print(f"{describe(level_key):<28} {metric:<28} {value:>12.3f}")
+
+
+def compare(old_path: str, new_path: str):
+    """Print the metrics of two result files side by side with relative change."""
+    old = json.loads(Path(old_path).read_text(encoding="utf-8"))
+    new = json.loads(Path(new_path).read_text(encoding="utf-8"))
+    print(f"old: {old.get('commit')}{' (dirty)' if old.get('dirty') else ''}")
+    print(f"new: {new.get('commit')}{' (dirty)' if new.get('dirty') else ''}")
+    old_rows, new_rows = {}, {}
+    for result in old['results']:
+        old_rows.update(flatten(result))
+    for result in new['results']:
+        new_rows.update(flatten(result))
+    print(f"{'case':<28} {'metric':<28} {'old':>12} {'new':>12} {'change':>8}")
+    for row_key, new_value in new_rows.items():
+        if row_key not in old_rows:
+            continue
+        level_key, metric = row_key
+        old_value = old_rows[row_key]
+        change = f"{100 * (new_value - old_value) / old_value:+.1f}%" if old_value else "n/a"
+        print(f"{describe(level_key):<28} {metric:<28} {old_value:>12.3f} {new_value:>12.3f} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline RAG benchmark suite.")
+    parser.add_argument("--chunks", default="1000,10000", help="comma-separated synthetic sizes")
+    parser.add_argument("--concurrency", default="1,8", help="comma-separated concurrency levels")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="subset of " + ",".join(SCENARIOS))
+    parser.add_argument("--queries", type=int, default=200, help="queries per concurrency level")
+    parser.add_argument("--answers", type=int, default=20, help="answers per concurrency level")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic data")
+    parser.add_argument("--fake-reranker", action="store_true",
+                        help="use a word-overlap stand-in instead of the cross-encoder")
+    parser.add_argument("--rerank-latency", type=float, default=0.0,
+                        help="seconds per pair for the stand-in reranker")
+    parser.add_argument("--dim", type=int, default=256, help="fake embedding dimension")
+    parser.add_argument("--embed-latency", type=float, default=0.002, help="seconds per embed request")
+    parser.add_argument("--embed-latency-per-text", type=float, default=0.0002, help="seconds per embedded text")
+    parser.add_argument("--first-token-latency", type=float, default=0.05, help="seconds before the first token")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="seconds between tokens")
+    parser.add_argument("--tokens", type=int, default=32, help="tokens per fake answer")
+    parser.add_argument("--out", help="result file (default: bench-<commit>.json)")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch workspaces")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(json.loads(args.worker))
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run_suite(args)
+    print_report(report)
+    out = Path(args.out or f"bench-{(report['commit'] or 'unknown')[:12]}.json")
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
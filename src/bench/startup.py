@@ -0,0 +1,125 @@
+"""
+Start-up report for main.py: module import times and background loading.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter and lists
+the slowest imports by cumulative time, then times, in this process, how long
+main.py takes until its prompt appears and until each background load (reranker,
+ChromaDB collection or local index, Ollama warm-up) has finished.
+
+Usage (from src/, where config's relative paths resolve):
+    python -m bench.startup
+    python -m bench.startup --imports-only --top 25
+    python -m bench.startup --max-import-ms 1500   # exit 1 above this budget
+"""
+
+import argparse
+import json
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parents[1]
+
+# "import time:       self [us] |  cumulative | imported package"
+_IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)')
+
+
+def import_times(module: str = "main") -> list:
+    """
+    Import `module` in a fresh interpreter with `-X importtime`.
+
+    Args:
+        module: The module to import (resolved from src/)
+
+    Returns:
+        List of dicts with 'module', 'self_ms', 'cumulative_ms' and 'depth'
+        (0 for imports made directly by the top-level import), in import order
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    rows = []
+    for line in completed.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append({
+                'module': name,
+                'self_ms': int(self_us) / 1000,
+                'cumulative_ms': int(cumulative_us) / 1000,
+                'depth': len(indent) // 2,
+            })
+    return rows
+
+
+def startup_timeline() -> dict:
+    """
+    Time main.py's start-up steps in this process.
+
+    Returns:
+        Dict of seconds since the start: 'import_s' (main's imports),
+        'prompt_ready_s' (the retriever constructor returned), and one
+        '<task>_s' entry per background load, or '<task>_error' if it failed
+    """
+    start = time.perf_counter()
+    import main
+    from config import BACKGROUND_LOAD
+    from retriever import Retriever
+
+    timeline = {'import_s': time.perf_counter() - start}
+    tasks = main.start_warm_up()
+    retriever = Retriever(background=BACKGROUND_LOAD)
+    timeline['prompt_ready_s'] = time.perf_counter() - start
+    for task in tasks + retriever.loading:
+        try:
+            task.result()
+            timeline[f"{task.name}_s"] = time.perf_counter() - start
+        except Exception as e:
+            timeline[f"{task.name}_error"] = str(e)
+    return timeline
+
+
+def print_imports(rows: list, top: int, total_ms: float):
+    print(f"{'module':<48} {'self ms':>10} {'cumulative ms':>14}")
+    for row in sorted(rows, key=lambda row: row['cumulative_ms'], reverse=True)[:top]:
+        print(f"{'  ' * row['depth'] + row['module']:<48} {row['self_ms']:>10.1f} {row['cumulative_ms']:>14.1f}")
+    print(f"{'total (all top-level imports)':<48} {'':>10} {total_ms:>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report main.py start-up time.")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--imports-only", action="store_true",
+                        help="skip the background loading timeline (no models or Ollama needed)")
+    parser.add_argument("--max-import-ms", type=float,
+                        help="exit with status 1 if importing main takes longer")
+    parser.add_argument("--out", help="also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    rows = import_times("main")
+    total_ms = sum(row['cumulative_ms'] for row in rows if row['depth'] == 0)
+    print_imports(rows, args.top, total_ms)
+    report = {'import_total_ms': total_ms, 'imports': rows}
+
+    if not args.imports_only:
+        timeline = startup_timeline()
+        report['timeline'] = timeline
+        print("\nStart-up timeline (seconds since start):")
+        for name, value in timeline.items():
+            text = f"{value:.3f}" if isinstance(value, float) else f"FAILED: {value}"
+            print(f"  {name:<28} {text}")
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if args.max_import_ms is not None and total_ms > args.max_import_ms:
+        print(f"Importing main took {total_ms:.0f}ms, over the {args.max_import_ms:.0f}ms budget.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
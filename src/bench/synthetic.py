@@ -0,0 +1,147 @@
+"""
+Deterministic synthetic Obsidian notes, vaults and query mixes for benchmarks.
+
+Sections are built from a fixed pseudo-word vocabulary with a Zipf-like word
+distribution, plus #tags and [[links]], so keyword search, the fake embeddings
+and the metadata filters all have something realistic to work on.
+"""
+
+import random
+from itertools import accumulate
+from pathlib import Path
+
+SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "sa", "te", "vi", "zo", "pa", "qu", "de", "fi", "go", "hu")
+QUESTION_STARTS = ("what is", "how does", "why did", "when was", "where can i find", "explain")
+
+
+def vocabulary(size: int = 5000, seed: int = 0) -> list:
+    """Return `size` distinct pseudo-words, always the same for a given seed."""
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+class Corpus:
+    """Generates sections and queries from one vocabulary and seed."""
+
+    def __init__(self, seed: int = 0, vocab_size: int = 5000, tags: int = 50,
+                 words_per_section: int = 60):
+        """
+        Args:
+            seed: Random seed; the same seed always produces the same text
+            vocab_size: Number of distinct words
+            tags: Number of distinct #tags
+            words_per_section: Average words per section body
+        """
+        self.seed = seed
+        self.words = vocabulary(vocab_size, seed)
+        random.Random(seed).shuffle(self.words)
+        self.tags = [f"topic{i}" for i in range(tags)]
+        self.words_per_section = words_per_section
+        # Zipf-like weights so a few words are common and most are rare
+        self.cum_weights = list(accumulate(1.0 / (rank + 1) for rank in range(len(self.words))))
+
+    def _words(self, rng: random.Random, n: int) -> list:
+        return rng.choices(self.words, cum_weights=self.cum_weights, k=n)
+
+    def section(self, index: int, notes: int = 1) -> str:
+        """
+        Return the markdown for section `index` (an H2 header and its body).
+
+        Args:
+            index: Section number; the text depends only on seed and index
+            notes: Number of notes in the vault, for [[Note N]] links
+        """
+        rng = random.Random(f"{self.seed}-{index}")
+        n = max(5, int(rng.gauss(self.words_per_section, self.words_per_section / 4)))
+        body = " ".join(self._words(rng, n))
+        extras = [f"#{rng.choice(self.tags)}"]
+        if rng.random() < 0.3:
+            extras.append(f"[[Note {rng.randrange(max(notes, 1))}]]")
+        if rng.random() < 0.1:
+            extras.append(f"https://example.com/{index}")
+        return f"## Section {index} {' '.join(self._words(rng, 2))}\n{body}\n{' '.join(extras)}\n"
+
+    def queries(self, count: int, chunks: int, stream: int = 0) -> list:
+        """
+        Return a reproducible mix of queries.
+
+        The mix is 40% short keyword queries, 30% questions, 10% queries naming
+        a #tag, and 20% repeats of earlier queries (to exercise the caches).
+        Keyword queries and questions reuse words of an existing section.
+
+        Args:
+            count: Number of queries
+            chunks: Number of sections the queries may refer to
+            stream: Selects an independent mix (e.g. one per benchmark run)
+
+        Returns:
+            List of (kind, query) tuples
+        """
+        rng = random.Random(f"{self.seed}-queries-{stream}")
+        mix = []
+        for _ in range(count):
+            roll = rng.random()
+            if mix and roll < 0.2:
+                mix.append(("repeat", rng.choice(mix)[1]))
+                continue
+            words = self.section(rng.randrange(max(chunks, 1))).split("\n")[1].split()
+            sample = rng.sample(words, min(len(words), rng.randint(3, 8)))
+            if roll < 0.6:
+                mix.append(("keyword", " ".join(sample[:3])))
+            elif roll < 0.9:
+                mix.append(("question", f"{rng.choice(QUESTION_STARTS)} {' '.join(sample)}?"))
+            else:
+                mix.append(("tag", f"#{rng.choice(self.tags)} {' '.join(sample[:3])}"))
+        return mix
+
+
+def write_note(path, chunks: int, corpus: Corpus) -> Path:
+    """
+    Write one note with `chunks` header sections.
+
+    Args:
+        path: Destination file
+        chunks: Number of sections
+        corpus: Text generator
+
+    Returns:
+        The written path
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# Synthetic Note\n")
+        for i in range(chunks):
+            f.write(corpus.section(i))
+    return path
+
+
+def write_vault(root, chunks: int, corpus: Corpus, chunks_per_note: int = 50,
+                notes_per_folder: int = 100) -> Path:
+    """
+    Write a vault of notes totalling `chunks` sections, spread over folders.
+
+    Args:
+        root: Vault directory
+        chunks: Total number of sections
+        corpus: Text generator
+        chunks_per_note: Sections per note
+        notes_per_folder: Notes per sub-folder
+
+    Returns:
+        The vault root
+    """
+    root = Path(root)
+    notes = (chunks + chunks_per_note - 1) // chunks_per_note
+    for note in range(notes):
+        folder = root / f"folder{note // notes_per_folder}"
+        folder.mkdir(parents=True, exist_ok=True)
+        first = note * chunks_per_note
+        with open(folder / f"Note {note}.md", "w", encoding="utf-8") as f:
+            f.write(f"# Note {note}\n")
+            for i in range(first, min(first + chunks_per_note, chunks)):
+                f.write(corpus.section(i, notes=notes))
+    return root
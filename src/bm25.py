@@ -0,0 +1,86 @@
+"""
+In-memory BM25 keyword index for the RAG system.
+Uses an inverted index of sparse postings, so a query only touches the
+documents that contain at least one of its terms.
+"""
+
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from operator import itemgetter
+
+from config import BM25_K1, BM25_B
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> list:
+    """Lowercase `text` and split it into word tokens."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 scorer over a fixed list of documents."""
+
+    def __init__(self, documents: list, k1: float = BM25_K1, b: float = BM25_B):
+        """
+        Build the inverted index.
+
+        Args:
+            documents: List of document strings; results refer to their positions
+            k1: Term-frequency saturation parameter
+            b: Document-length normalization parameter
+        """
+        self.k1 = k1
+        self.b = b
+        self.num_docs = len(documents)
+
+        term_freqs = [Counter(tokenize(doc)) for doc in documents]
+        doc_lens = [sum(tf.values()) for tf in term_freqs]
+        avg_len = (sum(doc_lens) / self.num_docs) if self.num_docs else 0.0
+
+        # Postings hold the precomputed term-frequency part of the BM25 score,
+        # so a query only multiplies by idf and sums.
+        self.postings = defaultdict(list)
+        for doc_id, (tf, doc_len) in enumerate(zip(term_freqs, doc_lens)):
+            norm = k1 * (1 - b + b * doc_len / avg_len) if avg_len else k1
+            for term, freq in tf.items():
+                self.postings[term].append((doc_id, freq * (k1 + 1) / (freq + norm)))
+        self.postings = dict(self.postings)
+
+        self.idf = {
+            term: math.log(1 + (self.num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def search(self, query: str, k: int, docs=None) -> list:
+        """
+        Score the documents that share terms with the query.
+
+        Args:
+            query: The search query
+            k: Number of results to return
+            docs: Optional set of doc indices to restrict the search to
+
+        Returns:
+            List of tuples (doc_index, bm25_score) sorted by score
+        """
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            if docs is None:
+                for doc_id, weight in postings:
+                    scores[doc_id] += idf * weight
+            else:
+                for doc_id, weight in postings:
+                    if doc_id in docs:
+                        scores[doc_id] += idf * weight
+
+        return heapq.nlargest(k, scores.items(), key=itemgetter(1))
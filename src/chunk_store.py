@@ -0,0 +1,173 @@
+"""
+In-memory chunk store for the RAG system.
+Parses the dataset note once and keeps the chunks in memory, reloading only
+when the file on disk actually changes.
+"""
+
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from obsidian import iter_chunks_obsidian, header_path, chunk_id
+from tracing import span
+from config import CHUNK_STORE_CHECK_INTERVAL
+
+
+class ChunkStore:
+    """Parse-once cache of the header chunks of a single Obsidian note.
+
+    The file is re-read only when its mtime or size changes, and re-chunked
+    only when its content hash changes. Between checks (at most once every
+    `check_interval` seconds) lookups are served purely from memory.
+    """
+
+    def __init__(self, path, check_interval: float = CHUNK_STORE_CHECK_INTERVAL):
+        """
+        Args:
+            path: Path to the markdown/text note to chunk
+            check_interval: Minimum number of seconds between stat() calls
+        """
+        self.path = Path(path)
+        self.check_interval = check_interval
+
+        self.chunks = []
+        self.contents = []
+        self.metadatas = []
+        self.ids = []
+        self.content_hash = None
+        self.version = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+        self._signature = None
+        self._last_check = None
+        self._lock = threading.Lock()
+
+    def exists(self) -> bool:
+        """Return True if the note is loaded or present on disk."""
+        return self.content_hash is not None or self.path.exists()
+
+    def get(self) -> list:
+        """
+        Return the current chunks, reloading them first if the file changed.
+
+        Returns:
+            List of chunk dicts as produced by `chunk_by_headers_obsidian`
+        """
+        self._refresh()
+        return self.chunks
+
+    def get_contents(self) -> list:
+        """
+        Return the chunk texts, ready to be paired with a query for the reranker.
+
+        Returns:
+            List of chunk content strings, in chunk order
+        """
+        self._refresh()
+        return self.contents
+
+    def get_ids(self) -> list:
+        """
+        Return stable chunk ids (header path + content hash), in chunk order.
+
+        Returns:
+            List of chunk id strings aligned with `get_contents()`
+        """
+        self._refresh()
+        return self.ids
+
+    def snapshot(self) -> tuple:
+        """
+        Return a consistent view of the current state, reloading first if needed.
+
+        Returns:
+            Tuple (version, content_hash, contents, ids, metadatas) from the
+            same reload
+        """
+        self._refresh()
+        with self._lock:
+            return self.version, self.content_hash, self.contents, self.ids, self.metadatas
+
+    def stats(self) -> dict:
+        """Return the cache counters and the current version."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'reloads': self.reloads,
+            'version': self.version,
+            'chunks': len(self.chunks),
+        }
+
+    def _refresh(self):
+        """Check the file on disk (rate limited) and reload it if it changed."""
+        now = time.monotonic()
+        if self._last_check is not None and now - self._last_check < self.check_interval:
+            with self._lock:
+                self.hits += 1
+            return
+
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                # Keep serving the last good copy if the file disappears mid-edit.
+                self._last_check = now
+                self.misses += 1
+                return
+
+            signature = (stat.st_mtime_ns, stat.st_size)
+            self._last_check = now
+            if signature == self._signature:
+                self.hits += 1
+                return
+
+            self.misses += 1
+            with span("chunk_load", path=str(self.path)) as s:
+                data = self.path.read_bytes()
+                content_hash = hashlib.sha256(data).hexdigest()
+                self._signature = signature
+                if content_hash == self.content_hash:
+                    # Touched but not modified (e.g. saved without changes).
+                    s.set(changed=False)
+                    return
+
+                # Build the new state fully before publishing it. Decode with
+                # universal newlines, as ingestion does, so CRLF notes get the same ids.
+                text = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8', errors='replace')
+                chunks = list(iter_chunks_obsidian(text))
+                ids = chunk_ids(chunks)
+                s.set(changed=True, bytes=len(data), chunks=len(chunks))
+            self.chunks = chunks
+            self.contents = [c['content'] for c in chunks]
+            self.metadatas = [c['metadata'] for c in chunks]
+            self.ids = ids
+            self.content_hash = content_hash
+            self.version += 1
+            self.reloads += 1
+
+
+def chunk_ids(chunks: list) -> list:
+    """
+    Compute stable ids for header chunks.
+
+    Args:
+        chunks: List of chunk dicts as produced by `chunk_by_headers_obsidian`
+
+    Returns:
+        List of ids built by `obsidian.chunk_id`, one per chunk
+    """
+    ids = []
+    occurrences = Counter()
+    for chunk in chunks:
+        path = header_path(chunk['headers'])
+        key = (path, chunk['content'])
+        ids.append(chunk_id(path, chunk['content'], occurrences[key]))
+        occurrences[key] += 1
+    return ids
@@ -7,29 +7,216 @@ Contains all model names, file paths, and retrieval parameters.
 EMBEDDING_MODEL = 'hf.co/Fishkaras/embedic-large-Q8_0-GGUF:Q8_0'
 LANGUAGE_MODEL = 'Mistral-7B-Instruct-v0.2-Q4_K_M:latest'
 RERANKER_MODEL_NAME = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+# Reranker inference backend: "torch" (fp32), "torch-int8" or "onnx"
+RERANKER_BACKEND = "torch"
+# Optional ONNX file inside the model repo, e.g. "onnx/model_qint8_avx512_vnni.onnx"
+RERANKER_ONNX_FILE = None
+# Intra-op CPU threads for the reranker (None keeps the library default)
+RERANKER_NUM_THREADS = None
+# Maximum tokens per (query, chunk) pair (None keeps the model default)
+RERANKER_MAX_LENGTH = None
 
 # --- FILE PATHS ---
 CHROMA_DB_PATH = "./my_rag_db"
 DATASET_PATH = "./obsidian_assets/main_discovery.txt"
+# Vault directory walked by ingest.py
+VAULT_PATH = "./obsidian_assets"
+VAULT_EXTENSIONS = (".md", ".txt")
+LOCAL_INDEX_PATH = "./my_rag_db/local_index.npy"
 
 # --- RETRIEVAL PARAMETERS ---
 TOP_N = 3
 CANDIDATES_TO_RETRIEVE = 10
+# (query, chunk) pairs per cross-encoder forward pass
+RERANKER_BATCH_SIZE = 64
+
+# --- SHARDS ---
+# Search several corpora at once, e.g. one collection per team. Each entry:
+#   {"name": "team-a", "type": "chroma", "path": "./team_a_db", "collection": "notes"}
+#   {"name": "papers", "type": "local", "path": "./papers.md"}
+#   {"name": "archive", "type": "quantized", "path": "./my_rag_db/archive"}
+#   {"name": "live", "type": "vault", "path": "./obsidian_assets"}  (re-indexed on edits)
+# None searches the single default corpus (DATASET_PATH, the quantized store
+# or COLLECTION_NAME). With several shards, chunk ids are prefixed "<name>/"
+# and the shards' candidate lists are merged by rank (reciprocal rank fusion).
+SHARDS = None
+# Seconds to wait for the shards of one search; slower shards are left out
+SHARD_TIMEOUT = 5.0
+# Threads searching shards in parallel
+SHARD_MAX_WORKERS = 8
+
+# --- CASCADE RERANKING ---
+# "full" reranks every candidate; "cascade" reranks a head first and extends only if needed
+RERANK_MODE = "full"
+# Candidates reranked in the first cascade step (should exceed TOP_N)
+CASCADE_HEAD_SIZE = 5
+# Extend to all candidates when the reranker score gap at the TOP_N cutoff is below this
+CASCADE_EXTEND_MARGIN = 1.0
+# Rerank only the first TOP_N candidates when the first-stage gap at the TOP_N cutoff,
+# as a fraction of the spread of first-stage scores, is at least this (None never skips)
+CASCADE_SKIP_MARGIN = 0.5
+
+# --- HYBRID SEARCH ---
+# Fuse BM25 keyword results with vector results for the local dataset
+HYBRID_SEARCH = True
+# Reciprocal rank fusion smoothing constant
+RRF_K = 60
+# BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# --- METADATA FILTERS ---
+# Restrict candidates to chunks carrying a #tag or linking to a [[Note]] that
+# the query mentions (falls back to the full search if none match)
+QUERY_METADATA_FILTERS = True
+
+# --- CONTEXT PACKING ---
+# Pack the reranked chunks into a token budget before prompting the LLM
+CONTEXT_PACKING = True
+# Token budget for all retrieved context in the prompt (None: unlimited)
+CONTEXT_MAX_TOKENS = 1500
+# Longer chunks are trimmed to their sentences with the most query words (None: never)
+CONTEXT_MAX_CHUNK_TOKENS = 400
+# Drop a chunk when this fraction of its word trigrams is already in the context (None: keep all)
+CONTEXT_DEDUP_THRESHOLD = 0.8
+# Hugging Face tokenizer for token counts, e.g. "mistralai/Mistral-7B-Instruct-v0.2"
+# (None estimates the count from words and punctuation)
+CONTEXT_TOKENIZER = None
+
+# --- ASYNC PIPELINE ---
+# Concurrent requests allowed per stage in AsyncRetriever / agenerate_answer
+ASYNC_EMBED_CONCURRENCY = 8
+ASYNC_RERANK_CONCURRENCY = 1
+ASYNC_GENERATE_CONCURRENCY = 2
+
+# --- QUERY SERVER ---
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+# Seconds the scheduler waits for more requests to join a batch
+SERVER_BATCH_WINDOW = 0.01
+SERVER_MAX_BATCH = 32
+# Pending requests beyond this are rejected with 503
+SERVER_QUEUE_SIZE = 256
+# Default per-request deadline in seconds (504 when exceeded)
+SERVER_REQUEST_TIMEOUT = 30.0
+# Concurrent /answer generations against Ollama
+SERVER_GENERATE_CONCURRENCY = 2
+
+# --- INGESTION PARAMETERS ---
+# Texts sent to Ollama per embedding request
+EMBED_BATCH_SIZE = 32
+# Embedding requests in flight at once
+EMBED_MAX_WORKERS = 4
+# Retries per failed batch, with exponential backoff starting at this many seconds
+EMBED_MAX_RETRIES = 3
+EMBED_RETRY_BACKOFF = 1.0
+# Documents written to ChromaDB per collection.upsert call
+CHROMA_WRITE_BATCH_SIZE = 256
+# Worker processes chunking vault files (None uses every CPU)
+INGEST_PROCESSES = None
+# Chunks buffered between the chunking and embedding stages
+INGEST_QUEUE_SIZE = 1024
+
+# --- CACHING ---
+# Seconds between checks of the dataset file (or the quantized store's current version) for changes
+CHUNK_STORE_CHECK_INTERVAL = 1.0
+# Embeddings keyed by (EMBEDDING_MODEL, sha256(text)), shared by ingestion and queries
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = "./my_rag_db/embedding_cache.sqlite"
+EMBEDDING_CACHE_MEMORY_ITEMS = 4096
+# Cross-encoder scores keyed by (normalized query, chunk id)
+RERANK_CACHE_SIZE = 50000
+# Generated answers keyed by normalized query, the retrieved chunks (ids and
+# content hashes), LANGUAGE_MODEL and a hash of INSTRUCTION_PROMPT
+ANSWER_CACHE_ENABLED = True
+# SQLite file the answers persist in (None keeps them in memory only)
+ANSWER_CACHE_PATH = "./my_rag_db/answer_cache.sqlite"
+ANSWER_CACHE_SIZE = 1000
+# Seconds an answer stays valid (None never expires)
+ANSWER_CACHE_TTL = 7 * 24 * 3600
+# Reuse the answer of a differently worded query over the same chunks when the
+# query embeddings have at least this cosine similarity (None: exact queries only)
+ANSWER_CACHE_SEMANTIC_THRESHOLD = None
+
+# --- EVALUATION ---
+# Answers generated concurrently by evaluate.py
+EVAL_WORKERS = 4
+# Questions retrieved and reranked together by evaluate.py
+EVAL_RETRIEVE_BATCH = 32
+# Per-question results, keyed by question and configuration hash, so reruns
+# skip completed items
+EVAL_CACHE_PATH = "./my_rag_db/eval_cache.jsonl"
+
+# --- BATCH MODE ---
+# `python main.py --batch questions.jsonl --out answers.jsonl`
+# Questions embedded and reranked together
+BATCH_RETRIEVE_SIZE = 32
+# Concurrent answer generations against Ollama
+BATCH_GENERATE_WORKERS = 4
+# Questions retrieved but not yet written (bounds memory and look-ahead)
+BATCH_MAX_IN_FLIGHT = 64
+
+# --- TRACING ---
+# Per-stage timing spans (off by default; `python main.py --trace` turns them on)
+TRACE_ENABLED = False
+# JSONL file receiving one line per finished span (None to disable)
+TRACE_FILE = None
+# Port for a Prometheus-text /metrics endpoint (None to disable)
+TRACE_METRICS_PORT = None
+# Most recent durations kept per stage for the percentile summary
+TRACE_HISTOGRAM_SAMPLES = 10000
+# Prometheus histogram bucket upper bounds, in seconds
+TRACE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# --- STARTUP ---
+# Load the reranker and the ChromaDB collection (or local index) on background
+# threads in main.py, so the prompt appears before they are ready
+BACKGROUND_LOAD = True
+# Preload the embedding and language models in Ollama when main.py starts
+OLLAMA_WARMUP = True
+# How long Ollama keeps a model loaded after a request (None keeps Ollama's default)
+OLLAMA_KEEP_ALIVE = "30m"
+
+# --- CHAT SESSIONS ---
+# Earlier (question, answer) turns kept in a chat session's messages
+# (`python main.py --chat`); older turns are dropped
+CHAT_HISTORY_TURNS = 4
+
+# --- VAULT WATCHER ---
+# Index VAULT_PATH in memory and re-index edited notes while running, instead
+# of searching the ingested collection (`python main.py --watch` turns it on)
+WATCH_VAULT = False
+# Seconds between scans of the vault for changed notes (mtime polling)
+WATCH_INTERVAL = 2.0
+
+# --- QUANTIZED STORE ---
+# Compact, memory-mapped copy of the collection (`python quantized_store.py --export`)
+QUANTIZED_STORE_PATH = "./my_rag_db/quantized"
+# Search the quantized store instead of ChromaDB when it exists for EMBEDDING_MODEL
+USE_QUANTIZED_STORE = True
+# "int8" (per-vector scale, 4x smaller than float32) or "float16" (2x smaller)
+QUANTIZED_DTYPE = "int8"
+# Keep a float32 copy on disk for rescoring the best quantized hits
+QUANTIZED_KEEP_FP32 = True
+# Rescore the best CANDIDATES_TO_RETRIEVE * factor hits with float32 vectors (0: off)
+QUANTIZED_RESCORE_FACTOR = 4
 
 # --- COLLECTION SETTINGS ---
 COLLECTION_NAME = "my_presentation_docs"
 COLLECTION_METADATA = {"hnsw:space": "cosine"}
 
 # --- PROMPT TEMPLATE ---
-INSTRUCTION_PROMPT = """You are a specialized Q&A assistant for a personal research document. Your sole purpose is to answer questions by extracting and synthesizing information ONLY from the provided context.
+# Static instructions: the system message of a chat session
+SYSTEM_PROMPT = """You are a specialized Q&A assistant for a personal research document. Your sole purpose is to answer questions by extracting and synthesizing information ONLY from the provided context.
 
 Follow these rules strictly:
 1.  **Grounding:** Base your answer exclusively on the text within the 'Context' section. Do not use any outside knowledge.
 2.  **Extraction:** If the question asks for a link, list, or specific piece of information, extract it directly.
 3.  **Honesty:** If the context does not contain the answer, you MUST state: "The answer is not available in the provided notes."
-4.  **Conciseness:** Be direct and to the point. Avoid conversational filler.
+4.  **Conciseness:** Be direct and to the point. Avoid conversational filler."""
 
-Context:
+# Per-question part: the user message of each chat turn
+TURN_PROMPT = """Context:
 {retrieved_chunks}
 
 Question:
@@ -37,3 +224,6 @@ Question:
 
 Answer:
 """
+
+# Single-shot prompt (generate_answer, evaluation): both parts in one message
+INSTRUCTION_PROMPT = SYSTEM_PROMPT + "\n\n" + TURN_PROMPT
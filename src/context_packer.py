@@ -0,0 +1,192 @@
+"""
+Token-budgeted context packing for the RAG system.
+Turns the reranked (chunk, score) list into the prompt context: chunks that
+mostly repeat an already packed chunk are dropped, sections longer than
+CONTEXT_MAX_CHUNK_TOKENS are trimmed to the sentences sharing the most words
+with the query, and chunks are packed in score order until CONTEXT_MAX_TOKENS
+is reached. Fewer prompt tokens means less prefill time before the first
+answer token.
+"""
+
+import re
+import threading
+from typing import NamedTuple
+
+from bm25 import tokenize
+from config import (
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_MAX_CHUNK_TOKENS,
+    CONTEXT_DEDUP_THRESHOLD,
+    CONTEXT_TOKENIZER,
+)
+
+_PIECE_RE = re.compile(r'\w+|[^\w\s]')
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+# Word n-gram length used to measure how much two chunks overlap
+_SHINGLE_SIZE = 3
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def approximate_token_count(text: str) -> int:
+    """
+    Estimate the number of LLM tokens in `text` without a tokenizer.
+
+    Every punctuation mark counts as one token and every word as one token
+    per four characters, which slightly overestimates subword tokenizers on
+    English prose.
+    """
+    return sum((len(piece) + 3) // 4 for piece in _PIECE_RE.findall(text))
+
+
+def _load_tokenizer():
+    """Return the CONTEXT_TOKENIZER tokenizer, or None to use the estimate."""
+    global _tokenizer
+    if CONTEXT_TOKENIZER is None:
+        return None
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            try:
+                from transformers import AutoTokenizer
+                _tokenizer = AutoTokenizer.from_pretrained(CONTEXT_TOKENIZER)
+            except Exception as e:
+                print(f"Could not load tokenizer '{CONTEXT_TOKENIZER}' ({e}); estimating token counts.")
+                _tokenizer = False
+    return _tokenizer or None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the LLM tokens in `text`.
+
+    Uses the Hugging Face tokenizer named by CONTEXT_TOKENIZER if set (and
+    available), otherwise `approximate_token_count`.
+    """
+    tokenizer = _load_tokenizer()
+    if tokenizer is None:
+        return approximate_token_count(text)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def _shingles(text: str) -> set:
+    """Return the word n-grams of `text` (its words, if it is shorter)."""
+    words = tokenize(text)
+    if len(words) < _SHINGLE_SIZE:
+        return set(words)
+    return {tuple(words[i:i + _SHINGLE_SIZE]) for i in range(len(words) - _SHINGLE_SIZE + 1)}
+
+
+def trim_to_query(text: str, query: str, max_tokens: int) -> str:
+    """
+    Shorten a section to its sentences with the highest query-word overlap.
+
+    Header lines are kept first. Sentences are then chosen by the number of
+    distinct query words they contain (earlier sentences win ties) while
+    they fit in `max_tokens`, and are returned in their original order.
+
+    Args:
+        text: The section text
+        query: The user's question
+        max_tokens: Token limit for the result
+
+    Returns:
+        The trimmed section ('' if not even one sentence fits)
+    """
+    query_terms = set(tokenize(query))
+    sentences = []  # (line number, sentence)
+    for line_number, line in enumerate(text.splitlines()):
+        if line.strip():
+            sentences.extend((line_number, s) for s in _SENTENCE_END_RE.split(line.strip()) if s)
+
+    def priority(item):
+        position, (_, sentence) = item
+        is_header = sentence.startswith('#')
+        return (not is_header, -len(query_terms.intersection(tokenize(sentence))), position)
+
+    chosen = set()
+    used = 0
+    for position, (_, sentence) in sorted(enumerate(sentences), key=priority):
+        tokens = count_tokens(sentence) + 1  # plus a separator
+        if used + tokens <= max_tokens:
+            chosen.add(position)
+            used += tokens
+
+    lines = {}
+    for position in sorted(chosen):
+        line_number, sentence = sentences[position]
+        lines.setdefault(line_number, []).append(sentence)
+    return "\n".join(" ".join(parts) for parts in lines.values())
+
+
+class PackedContext(NamedTuple):
+    """The packed prompt context and what packing did to it."""
+    text: str
+    documents: list        # the packed (deduplicated, trimmed) chunk texts, best first
+    chunks: int            # chunks included
+    duplicates: int        # chunks dropped as near-duplicates
+    trimmed: int           # chunks shortened to fit
+    tokens: int            # tokens in `text`
+    tokens_before: int     # tokens of all chunks joined without packing
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens
+
+
+def pack_context(retrieved_chunks: list, query: str, max_tokens: int = CONTEXT_MAX_TOKENS,
+                 max_chunk_tokens: int = CONTEXT_MAX_CHUNK_TOKENS,
+                 dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD) -> PackedContext:
+    """
+    Pack reranked chunks into a context of at most `max_tokens` tokens.
+
+    Args:
+        retrieved_chunks: List of tuples (document, score)
+        query: The user's question (guides trimming)
+        max_tokens: Token budget for the whole context (None: unlimited)
+        max_chunk_tokens: Longer chunks are trimmed to this many tokens (None: never)
+        dedup_threshold: Drop a chunk when at least this fraction of its word
+                         trigrams already appears in one packed chunk (None: keep all)
+
+    Returns:
+        PackedContext with the newline-joined chunks, best first
+    """
+    ranked = sorted(retrieved_chunks, key=lambda chunk: chunk[1], reverse=True)
+    packed = []
+    packed_shingles = []
+    duplicates = trimmed = used = 0
+    for doc, _ in ranked:
+        remaining = None if max_tokens is None else max_tokens - used
+        if remaining is not None and remaining <= 0:
+            break
+        shingles = _shingles(doc)
+        if dedup_threshold is not None and shingles and any(
+            len(shingles & other) / len(shingles) >= dedup_threshold for other in packed_shingles
+        ):
+            duplicates += 1
+            continue
+
+        limits = [limit for limit in (remaining, max_chunk_tokens) if limit is not None]
+        limit = min(limits) if limits else None
+        tokens = count_tokens(doc)
+        if limit is not None and tokens > limit:
+            doc = trim_to_query(doc, query, limit)
+            if not doc:
+                continue
+            trimmed += 1
+            tokens = count_tokens(doc)
+            shingles = _shingles(doc)
+        packed.append(doc)
+        packed_shingles.append(shingles)
+        used += tokens + 1  # plus the newline separator
+
+    text = "\n".join(packed)
+    return PackedContext(
+        text=text,
+        documents=packed,
+        chunks=len(packed),
+        duplicates=duplicates,
+        trimmed=trimmed,
+        tokens=count_tokens(text),
+        tokens_before=count_tokens("\n".join(doc for doc, _ in retrieved_chunks)),
+    )
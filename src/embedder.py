@@ -0,0 +1,215 @@
+"""
+Batched embedding helpers for the RAG system.
+Sends lists of texts to Ollama in batches, with retries and a bounded number
+of concurrent requests. Texts already in the embedding cache are not re-sent.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ollama
+from embedding_cache import EmbeddingCache
+from pipeline import batched, bounded_map
+from tracing import span
+from config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_CACHE_ENABLED,
+    EMBED_BATCH_SIZE,
+    EMBED_MAX_WORKERS,
+    EMBED_MAX_RETRIES,
+    EMBED_RETRY_BACKOFF,
+    OLLAMA_KEEP_ALIVE,
+)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """
+    Return the process-wide embedding cache, creating it on first use.
+
+    Returns:
+        The shared EmbeddingCache, or None if caching is disabled
+    """
+    global _cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+    return _cache
+
+
+def embed_batch(texts: list, model: str = EMBEDDING_MODEL) -> list:
+    """
+    Embed a list of texts with a single Ollama request, retrying on failure.
+
+    Args:
+        texts: The texts to embed
+        model: The embedding model name
+
+    Returns:
+        List of embedding vectors, one per text
+
+    Raises:
+        The last exception if every attempt fails
+    """
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            embeddings = ollama.embed(model=model, input=texts, keep_alive=OLLAMA_KEEP_ALIVE)['embeddings']
+            if len(embeddings) != len(texts):
+                raise RuntimeError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+            return embeddings
+        except Exception as e:
+            if attempt == EMBED_MAX_RETRIES:
+                raise
+            delay = EMBED_RETRY_BACKOFF * (2 ** attempt)
+            print(f"Embedding batch of {len(texts)} failed ({e}); retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+
+def cached_embed_batch(texts: list) -> list:
+    """
+    Embed a list of texts, only sending the ones missing from the cache to Ollama.
+
+    Args:
+        texts: The texts to embed
+
+    Returns:
+        List of embedding vectors, one per text
+    """
+    cache = get_embedding_cache()
+    if cache is None:
+        return embed_batch(texts)
+
+    vectors = cache.get_many(texts)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        fresh = embed_batch(missing_texts)
+        cache.put_many(missing_texts, fresh)
+        for i, vector in zip(missing, fresh):
+            vectors[i] = vector
+    return vectors
+
+
+def embed_query(query: str) -> list:
+    """
+    Embed a single query string, using the cache for repeated queries.
+
+    Args:
+        query: The search query
+
+    Returns:
+        The query embedding vector
+    """
+    with span("query_embed", queries=1):
+        return cached_embed_batch([query])[0]
+
+
+def warm_up_embedder(model: str = EMBEDDING_MODEL):
+    """
+    Load the embedding model in Ollama ahead of the first query.
+
+    Sends one tiny uncached request with OLLAMA_KEEP_ALIVE, so Ollama keeps
+    the model in memory.
+
+    Args:
+        model: The embedding model name
+    """
+    ollama.embed(model=model, input=["warm-up"], keep_alive=OLLAMA_KEEP_ALIVE)
+
+
+async def aembed_batch(client, texts: list, model: str = EMBEDDING_MODEL) -> list:
+    """
+    Async counterpart of `embed_batch` using an `ollama.AsyncClient`.
+
+    Args:
+        client: The ollama.AsyncClient to use
+        texts: The texts to embed
+        model: The embedding model name
+
+    Returns:
+        List of embedding vectors, one per text
+    """
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            embeddings = (await client.embed(
+                model=model, input=texts, keep_alive=OLLAMA_KEEP_ALIVE
+            ))['embeddings']
+            if len(embeddings) != len(texts):
+                raise RuntimeError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+            return embeddings
+        except Exception as e:
+            if attempt == EMBED_MAX_RETRIES:
+                raise
+            delay = EMBED_RETRY_BACKOFF * (2 ** attempt)
+            print(f"Embedding batch of {len(texts)} failed ({e}); retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
+
+async def acached_embed_batch(client, texts: list) -> list:
+    """
+    Async counterpart of `cached_embed_batch`. The SQLite lookups and writes
+    run on worker threads, so they do not block the event loop.
+
+    Args:
+        client: The ollama.AsyncClient to use
+        texts: The texts to embed
+
+    Returns:
+        List of embedding vectors, one per text
+    """
+    cache = await asyncio.to_thread(get_embedding_cache)
+    if cache is None:
+        return await aembed_batch(client, texts)
+
+    vectors = await asyncio.to_thread(cache.get_many, texts)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        fresh = await aembed_batch(client, missing_texts)
+        await asyncio.to_thread(cache.put_many, missing_texts, fresh)
+        for i, vector in zip(missing, fresh):
+            vectors[i] = vector
+    return vectors
+
+
+def iter_embedded_batches(records, batch_size: int = EMBED_BATCH_SIZE,
+                          max_workers: int = EMBED_MAX_WORKERS):
+    """
+    Embed a stream of records in batches using a bounded thread pool.
+
+    Args:
+        records: Iterable of dicts with a 'document' key, consumed lazily
+        batch_size: Number of texts per Ollama request
+        max_workers: Number of batches in flight at once
+
+    Yields:
+        Tuples (batch_records, embeddings) in input order
+    """
+    def embed_records(batch):
+        return batch, cached_embed_batch([record['document'] for record in batch])
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield from bounded_map(executor, embed_records, batched(records, batch_size), max_workers)
+
+
+def embed_texts(texts: list) -> list:
+    """
+    Embed a list of texts, batching and parallelizing the requests.
+
+    Args:
+        texts: The texts to embed
+
+    Returns:
+        List of embedding vectors in the same order as `texts`
+    """
+    records = ({'document': text} for text in texts)
+    embeddings = []
+    for _, batch_embeddings in iter_embedded_batches(records):
+        embeddings.extend(batch_embeddings)
+    return embeddings
@@ -0,0 +1,122 @@
+"""
+Persistent embedding cache for the RAG system.
+Embeddings are stored in a local SQLite file keyed by (embedding model,
+sha256 of the text), behind a bounded in-memory LRU. Changing
+EMBEDDING_MODEL simply misses, so stale vectors are never returned.
+"""
+
+import hashlib
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+
+from lru import LRUCache
+from config import EMBEDDING_MODEL, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MEMORY_ITEMS
+
+
+def text_hash(text: str) -> str:
+    """Return the sha256 hex digest used as the cache key for `text`."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-level (memory LRU + SQLite) cache of embedding vectors."""
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, model: str = EMBEDDING_MODEL,
+                 memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS):
+        """
+        Args:
+            path: SQLite database file
+            model: Embedding model the cached vectors belong to
+            memory_items: Maximum number of vectors kept in memory
+        """
+        self.model = model
+        self.memory = LRUCache(memory_items)
+        self.disk_hits = 0
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, text_hash)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def get_many(self, texts: list) -> list:
+        """
+        Look up embeddings for several texts.
+
+        Args:
+            texts: The texts to look up
+
+        Returns:
+            List aligned with `texts` holding a vector (list of floats) or None
+        """
+        hashes = [text_hash(text) for text in texts]
+        results = [self.memory.get(h) for h in hashes]
+        missing = [h for h, vector in zip(hashes, results) if vector is None]
+        if not missing:
+            return results
+
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(missing), 500):
+                part = missing[start:start + 500]
+                placeholders = ','.join('?' * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings"
+                    f" WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model, *part],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = array('f', blob).tolist()
+
+        for i, h in enumerate(hashes):
+            if results[i] is None and h in found:
+                results[i] = found[h]
+                self.memory.put(h, found[h])
+                self.disk_hits += 1
+        return results
+
+    def put_many(self, texts: list, vectors: list):
+        """
+        Store embeddings for several texts.
+
+        Args:
+            texts: The embedded texts
+            vectors: Embedding vectors aligned with `texts`
+        """
+        rows = []
+        for text, vector in zip(texts, vectors):
+            h = text_hash(text)
+            self.memory.put(h, vector)
+            rows.append((self.model, h, array('f', vector).tobytes()))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """Return memory and disk hit counters."""
+        memory = self.memory.stats()
+        return {
+            'memory_hits': memory['hits'],
+            'disk_hits': self.disk_hits,
+            'misses': memory['misses'] - self.disk_hits,
+            'memory_size': memory['size'],
+        }
+
+    def close(self):
+        """Close the underlying SQLite connection."""
+        with self._lock:
+            self._conn.close()
@@ -3,133 +3,263 @@
 Standalone evaluation script for the RAG pipeline.
 Evaluates the system's performance using the ragas framework.
 
+Answers are generated by a pool of EVAL_WORKERS threads. Each question's
+contexts, answer and timings are checkpointed to EVAL_CACHE_PATH (JSONL),
+keyed by the question and a hash of the configuration, so an interrupted or
+partially failed run resumes where it stopped.
+
 Usage:
-    python evaluate.py
+    python evaluate.py                    # answers + ragas metrics
+    python evaluate.py --retrieval-only   # hit rate / MRR, no LLM calls
+    python evaluate.py --workers 8 --fresh
 """
 
-from datasets import Dataset
-from ragas import evaluate
-from ragas.metrics import (
-    faithfulness,
-    answer_relevancy,
-    context_precision,
-    context_recall,
-)
-from langchain_ollama import ChatOllama, OllamaEmbeddings
+import argparse
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 
 from retriever import Retriever
-from generator import generate_answer, format_context
-from config import LANGUAGE_MODEL, EMBEDDING_MODEL
-
-
-# Evaluation dataset
-EVALUATION_DATASET = [
-    {
-        "question": "How long did it take to build the D&D agent?",
-        "ground_truth_context": ["Time: 7 hours from zero to working product"],
-        "ground_truth_answer": "It took 7 hours to build the D&D agent from zero to a working product."
-    },
-    {
-        "question": "What analogy is used to explain a neural network?",
-        "ground_truth_context": ['## Neural Network + KV Cache – "The Messy Library With a Map"'],
-        "ground_truth_answer": "A neural network is compared to a 'messy library with a map'."
-    },
-    {
-        "question": "What is the primary risk of the 'good enough' trap?",
-        "ground_truth_context": ["\"Good enough\" trap: fast bootstrap can lead to tech debt if not revisited"],
-        "ground_truth_answer": "The 'good enough' trap is that a fast bootstrap can lead to technical debt if the code is not revisited."
-    },
-    {
-        "question": "According to the presentation, who is likely to take a developer's job?",
-        "ground_truth_context": ["\"AI won't take your job. But the person who learns to pair program with it probably will.\""],
-        "ground_truth_answer": "The presentation states that AI won't take your job, but a person who learns to pair program with it probably will."
-    },
-    {
-        "question": "List three pitfalls of AI-assisted coding mentioned in the document.",
-        "ground_truth_context": ["Maintainability: AI ≠ magic, code can rot without proper refactors", "Scalability: Not automatic; requires deliberate engineering", "Vulnerabilities: security, compliance, privacy"],
-        "ground_truth_answer": "Three pitfalls mentioned are maintainability issues leading to code rot, scalability not being automatic, and security vulnerabilities."
-    },
-    {
-        "question": "How did the narrative generation improve for the D&D agent?",
-        "ground_truth_context": ["I made a move from Mistral dense to Mistral MoE → narrative generation was much better."],
-        "ground_truth_answer": "The narrative generation improved by switching the model from a Mistral dense model to a Mistral MoE model."
-    },
-    {
-        "question": "What is the presenter's call to action?",
-        "ground_truth_context": ["Try one small feature or internal tool with AI this week", "Share your results & lessons with the team"],
-        "ground_truth_answer": "The call to action is to try building a small feature or internal tool with AI this week and share the results and lessons with the team."
-    },
-    {
-        "question": "How does the document describe the difference in output between GPT-5 and Claude?",
-        "ground_truth_context": ["GPT-5 → more \"thinking aloud,\" creative detours", "Claude → more structured, but sometimes refused steps"],
-        "ground_truth_answer": "GPT-5's output is described as more 'thinking aloud' with creative detours, while Claude's is more structured but sometimes refuses steps."
-    },
-    {
-        "question": "What percentage of work does AI handle, and what is required for the rest?",
-        "ground_truth_context": ["AI gets you ~80%, last 20% requires engineering judgment"],
-        "ground_truth_answer": "AI gets you approximately 80% of the way, but the last 20% requires engineering judgment."
-    },
-    {
-        "question": "What tasks was AI used for in the hotel booking project?",
-        "ground_truth_context": ["AI used for: scaffolding, UI generation, copy tweaks"],
-        "ground_truth_answer": "In the hotel booking project, AI was used for scaffolding, UI generation, and copy tweaks."
-    },
-    {
-        "question": "Why is prompting described as a 'model-specific skill'?",
-        "ground_truth_context": ["Prompting is model-specific skill — not portable 1:1"],
-        "ground_truth_answer": "Prompting is described as a model-specific skill because it is not portable 1:1; what works in one model might fail in another."
-    },
-    {
-        "question": "What features are explicitly mentioned as missing from the D&D agent?",
-        "ground_truth_context": ["Missing: persistence layer (save/quit), multiplayer"],
-        "ground_truth_answer": "The D&D agent is missing a persistence layer for saving and quitting, as well as a multiplayer feature."
-    }
-]
-
-
-def main():
-    """Main evaluation function."""
-    print("Starting RAG system evaluation...")
-    
-    # Initialize components
-    print("Initializing retriever...")
-    try:
-        retriever = Retriever()
-    except RuntimeError as e:
-        print(f"Error: {e}")
-        return
-    
+from generator import generate_answer, context_documents
+from pipeline import batched
+import config
+from config import (
+    LANGUAGE_MODEL,
+    EMBEDDING_MODEL,
+    TOP_N,
+    EVAL_RETRIEVE_BATCH,
+    EVAL_WORKERS,
+    EVAL_CACHE_PATH,
+)
+from eval_dataset import EVALUATION_DATASET
+
+# Layout of checkpoint records; part of the cache key (bump when it changes)
+CHECKPOINT_FORMAT = 2
+# Settings that change retrieved contexts or answers; part of the cache key
+FINGERPRINT_SETTINGS = (
+    'EMBEDDING_MODEL', 'LANGUAGE_MODEL', 'RERANKER_MODEL_NAME', 'RERANKER_BACKEND',
+    'TOP_N', 'CANDIDATES_TO_RETRIEVE', 'HYBRID_SEARCH', 'RRF_K', 'BM25_K1', 'BM25_B',
+    'RERANK_MODE', 'CASCADE_HEAD_SIZE', 'CASCADE_EXTEND_MARGIN', 'CASCADE_SKIP_MARGIN',
+    'QUERY_METADATA_FILTERS', 'INSTRUCTION_PROMPT', 'CONTEXT_PACKING', 'CONTEXT_MAX_TOKENS',
+    'CONTEXT_MAX_CHUNK_TOKENS', 'CONTEXT_DEDUP_THRESHOLD', 'CONTEXT_TOKENIZER',
+)
+
+
+def config_hash(retriever: Retriever, top_n: int = TOP_N) -> str:
+    """
+    Hash the settings and corpus that determine an evaluation result.
+
+    Args:
+        retriever: The retriever (the content or size of each shard is included)
+        top_n: Contexts retrieved per question
+
+    Returns:
+        Hex digest identifying the configuration
+    """
+    settings = {name: getattr(config, name, None) for name in FINGERPRINT_SETTINGS}
+    settings['TOP_N'] = top_n
+    settings['checkpoint_format'] = CHECKPOINT_FORMAT
+    corpus = [shard.fingerprint() for shard in retriever.shards]
+    settings['corpus'] = corpus[0] if len(corpus) == 1 else dict(
+        zip((shard.name for shard in retriever.shards), corpus)
+    )
+    encoded = json.dumps(settings, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class EvalCheckpoint:
+    """Append-only JSONL store of per-question results for one configuration."""
+
+    def __init__(self, path, fingerprint: str):
+        """
+        Args:
+            path: JSONL file (None keeps results in memory only)
+            fingerprint: Configuration hash; records of other configurations are ignored
+        """
+        self.path = Path(path) if path else None
+        self.fingerprint = fingerprint
+        self.records = {}
+        self._lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by an interrupted run
+                    if record.get('config') == fingerprint:
+                        self.records[record['key']] = record
+
+    def key(self, question: str) -> str:
+        return hashlib.sha256(f"{self.fingerprint}\n{question}".encode('utf-8')).hexdigest()
+
+    def get(self, question: str):
+        """Return the latest record for `question`, or None."""
+        return self.records.get(self.key(question))
+
+    def put(self, record: dict):
+        """Store a record (thread-safe) and append it to the file immediately."""
+        record = dict(record, key=self.key(record['question']), config=self.fingerprint)
+        with self._lock:
+            self.records[record['key']] = record
+            if self.path is not None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record) + '\n')
+
+
+def retrieval_metrics(contexts: list, ground_truth_context: list) -> dict:
+    """
+    Score retrieved contexts against the ground-truth snippets.
+
+    A retrieved chunk is relevant if it contains any ground-truth snippet
+    (ignoring case and whitespace).
+
+    Args:
+        contexts: Retrieved chunk texts, best first
+        ground_truth_context: Snippets that a relevant chunk contains
+
+    Returns:
+        Dict with 'hit' (bool) and 'rank' (1-based rank of the first relevant
+        chunk, or None)
+    """
+    snippets = [' '.join(s.lower().split()) for s in ground_truth_context]
+    for rank, context in enumerate(contexts, start=1):
+        text = ' '.join(context.lower().split())
+        if any(snippet in text for snippet in snippets):
+            return {'hit': True, 'rank': rank}
+    return {'hit': False, 'rank': None}
+
+
+def retrieve_pending(retriever: Retriever, items: list, checkpoint: EvalCheckpoint,
+                     top_n: int) -> int:
+    """
+    Retrieve contexts for the items not yet in the checkpoint, in batches.
+
+    Args:
+        retriever: The retriever
+        items: Evaluation items to process
+        checkpoint: Result store; new records are added to it
+        top_n: Contexts retrieved per question
+
+    Returns:
+        Number of questions retrieved
+    """
+    pending = [item for item in items if checkpoint.get(item['question']) is None]
+    pairs_scored = candidates = 0
+    for batch in batched(pending, EVAL_RETRIEVE_BATCH):
+        start = time.perf_counter()
+        results = retriever.retrieve_and_rerank_batch(
+            [item['question'] for item in batch], top_n=top_n, with_stats=True
+        )
+        elapsed = (time.perf_counter() - start) / len(batch)
+        pairs_scored += sum(retrieval.stats['pairs_scored'] for retrieval in results)
+        candidates += sum(retrieval.stats['candidates'] for retrieval in results)
+        for item, (chunks, _, _) in zip(batch, results):
+            contexts = [doc for doc, _ in chunks]
+            checkpoint.put({
+                'question': item['question'],
+                'contexts': contexts,
+                'scores': [float(score) for _, score in chunks],
+                'answer': None,
+                'retrieval': retrieval_metrics(contexts, item.get('ground_truth_context', [])),
+                'timings': {'retrieve_s': elapsed},
+            })
+    if pending:
+        print(f"Reranker scored {pairs_scored} of {candidates} candidate pairs.")
+    return len(pending)
+
+
+def generate_pending(items: list, checkpoint: EvalCheckpoint, workers: int) -> list:
+    """
+    Generate answers concurrently for items whose record has no answer yet.
+
+    Each answer is checkpointed as soon as it completes; a failing question
+    is reported and skipped so the rest of the run continues.
+
+    Args:
+        items: Evaluation items (already retrieved)
+        checkpoint: Result store
+        workers: Concurrent generations
+
+    Returns:
+        List of questions that failed
+    """
+    pending = [item for item in items if checkpoint.get(item['question'])['answer'] is None]
+    if not pending:
+        return []
+    print(f"Generating {len(pending)} answers with {workers} workers...")
+
+    def answer(item):
+        record = checkpoint.get(item['question'])
+        start = time.perf_counter()
+        # The chunks as packed into the prompt, so ragas judges the context the model saw
+        prompt_contexts = context_documents(
+            list(zip(record['contexts'], record['scores'])), item['question']
+        )
+        text = generate_answer("\n".join(prompt_contexts), item['question'], stream=False)
+        timings = dict(record['timings'], generate_s=time.perf_counter() - start)
+        checkpoint.put(dict(record, answer=text, prompt_contexts=prompt_contexts, timings=timings))
+
+    failed = []
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(answer, item): item for item in pending}
+        for future in as_completed(futures):
+            question = futures[future]['question']
+            try:
+                future.result()
+                done += 1
+                print(f"Answered {done}/{len(pending)}: {question[:50]}...")
+            except Exception as e:
+                failed.append(question)
+                print(f"Error answering '{question[:50]}...': {e}")
+    return failed
+
+
+def report_retrieval(items: list, checkpoint: EvalCheckpoint, top_n: int):
+    """Print hit rate and MRR over the items."""
+    records = [checkpoint.get(item['question']) for item in items]
+    hits = sum(record['retrieval']['hit'] for record in records)
+    mrr = sum(1 / record['retrieval']['rank'] for record in records if record['retrieval']['rank'])
+    print("\n" + "="*60)
+    print("RETRIEVAL RESULTS")
+    print("="*60)
+    print(f"Questions: {len(records)}")
+    print(f"Hit rate@{top_n}: {hits / len(records):.3f}")
+    print(f"MRR@{top_n}: {mrr / len(records):.3f}")
+    print("="*60)
+
+
+def run_ragas(items: list, checkpoint: EvalCheckpoint):
+    """Score the answered items with ragas."""
+    from datasets import Dataset
+    from ragas import evaluate
+    from ragas.metrics import (
+        faithfulness,
+        answer_relevancy,
+        context_precision,
+        context_recall,
+    )
+    from langchain_ollama import ChatOllama, OllamaEmbeddings
+
     print("Initializing evaluation models...")
     judge_llm = ChatOllama(model=LANGUAGE_MODEL)
     ragas_embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL)
-    
-    # Generate responses for evaluation
-    print("Generating responses for evaluation...")
-    responses = []
-    contexts_list = []
-    
-    for i, item in enumerate(EVALUATION_DATASET):
-        question = item['question']
-        print(f"Processing question {i + 1}/{len(EVALUATION_DATASET)}: {question[:50]}...")
-        
-        # Retrieve relevant chunks
-        relevant_chunks_data = retriever.retrieve_and_rerank(question)
-        context = format_context(relevant_chunks_data)
-        contexts_list.append([chunk[0] for chunk in relevant_chunks_data])
-        
-        # Generate answer
-        response = generate_answer(context, question, stream=False)
-        responses.append(response)
-    
+
     # Create evaluation dataset
     print("Creating evaluation dataset...")
+    records = [checkpoint.get(item['question']) for item in items]
     eval_dataset = Dataset.from_dict({
-        'question': [item['question'] for item in EVALUATION_DATASET],
-        'answer': responses,
-        'contexts': contexts_list,
-        'ground_truth': [item['ground_truth_answer'] for item in EVALUATION_DATASET]
+        'question': [record['question'] for record in records],
+        'answer': [record['answer'] for record in records],
+        'contexts': [record['prompt_contexts'] for record in records],
+        'ground_truth': [item['ground_truth_answer'] for item in items]
     })
-    
+
     # Run evaluation
     print("Running RAGAS evaluation...")
     try:
@@ -139,16 +269,81 @@ def main():
             llm=judge_llm,
             embeddings=ragas_embeddings,
         )
-        
+
         print("\n" + "="*60)
         print("EVALUATION RESULTS")
         print("="*60)
         print(score)
         print("="*60)
-        
+
     except Exception as e:
         print(f"Error during evaluation: {e}")
 
 
+def main(retrieval_only: bool = False, workers: int = EVAL_WORKERS,
+         cache_path: str = EVAL_CACHE_PATH, top_n: int = TOP_N):
+    """
+    Main evaluation function.
+
+    Args:
+        retrieval_only: Only compute hit rate / MRR (no LLM calls)
+        workers: Concurrent answer generations
+        cache_path: JSONL checkpoint file (None to disable)
+        top_n: Contexts retrieved per question
+    """
+    print("Starting RAG system evaluation...")
+
+    # Initialize components
+    print("Initializing retriever...")
+    try:
+        retriever = Retriever()
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        return
+
+    fingerprint = config_hash(retriever, top_n)
+    checkpoint = EvalCheckpoint(cache_path, fingerprint)
+    items = EVALUATION_DATASET
+    cached = sum(checkpoint.get(item['question']) is not None for item in items)
+    print(f"Configuration {fingerprint}: {cached}/{len(items)} questions already retrieved.")
+
+    # Retrieve and rerank the remaining questions in batched passes
+    start = time.perf_counter()
+    retrieved = retrieve_pending(retriever, items, checkpoint, top_n)
+    print(f"Retrieved {retrieved} questions in {time.perf_counter() - start:.1f}s.")
+    if retrieved and len(retriever.shards) > 1:
+        print(retriever.shard_report())
+    report_retrieval(items, checkpoint, top_n)
+    if retrieval_only:
+        return
+
+    # Generate answers concurrently, checkpointing each one
+    start = time.perf_counter()
+    failed = generate_pending(items, checkpoint, workers)
+    print(f"Generation finished in {time.perf_counter() - start:.1f}s.")
+
+    answered = [item for item in items if checkpoint.get(item['question'])['answer'] is not None]
+    if failed:
+        print(f"{len(failed)} questions failed; re-run evaluate.py to retry them.")
+    if not answered:
+        print("No answers to evaluate.")
+        return
+    run_ragas(answered, checkpoint)
+
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Evaluate the RAG pipeline.")
+    parser.add_argument("--retrieval-only", action="store_true",
+                        help="report hit rate / MRR against ground_truth_context without calling the LLM")
+    parser.add_argument("--workers", type=int, default=EVAL_WORKERS,
+                        help="concurrent answer generations")
+    parser.add_argument("--top-n", type=int, default=TOP_N, help="contexts retrieved per question")
+    parser.add_argument("--fresh", action="store_true",
+                        help="ignore and do not write the results checkpoint")
+    args = parser.parse_args()
+    main(
+        retrieval_only=args.retrieval_only,
+        workers=args.workers,
+        cache_path=None if args.fresh else EVAL_CACHE_PATH,
+        top_n=args.top_n,
+    )
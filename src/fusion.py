@@ -0,0 +1,29 @@
+"""
+Helpers for combining ranked result lists from several retrievers.
+"""
+
+from collections import defaultdict
+
+from config import RRF_K
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = RRF_K) -> list:
+    """
+    Fuse several ranked lists with reciprocal rank fusion.
+
+    Each item scores sum(1 / (k + rank)) over the lists it appears in, so items
+    ranked well by several retrievers rise to the top regardless of how the
+    retrievers' raw scores are scaled.
+
+    Args:
+        rankings: List of ranked lists of (item, score) tuples, best first
+        k: Rank smoothing constant
+
+    Returns:
+        List of tuples (item, fused_score) sorted by fused score
+    """
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, (item, _) in enumerate(ranking, start=1):
+            fused[item] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda pair: pair[1], reverse=True)
@@ -1,10 +1,48 @@
 """
 Answer generation module for the RAG system.
-Contains the generate_answer function that formats prompts and calls the LLM.
+Contains the generate_answer function that formats prompts and calls the LLM,
+its async streaming counterpart agenerate_answer, and ChatSession for
+multi-turn conversations.
 """
 
+import time
+from collections import deque
+
 import ollama
-from config import LANGUAGE_MODEL, INSTRUCTION_PROMPT
+from pipeline import AsyncLimiter
+from context_packer import pack_context
+from tracing import span, record, enabled
+from config import (
+    LANGUAGE_MODEL,
+    INSTRUCTION_PROMPT,
+    SYSTEM_PROMPT,
+    TURN_PROMPT,
+    CHAT_HISTORY_TURNS,
+    ASYNC_GENERATE_CONCURRENCY,
+    OLLAMA_KEEP_ALIVE,
+    CONTEXT_PACKING,
+)
+
+# Limits concurrent async generations across the process
+_generate_limiter = AsyncLimiter(ASYNC_GENERATE_CONCURRENCY)
+
+
+def build_prompt(context: str, query: str) -> str:
+    """
+    Format the instruction prompt with the retrieved context and user query.
+    
+    Args:
+        context: The retrieved and reranked context chunks as a single string
+        query: The user's question
+        
+    Returns:
+        The complete prompt string
+    """
+    with span("prompt_format", context_chars=len(context)):
+        return INSTRUCTION_PROMPT.format(
+            retrieved_chunks=context,
+            user_query=query
+        )
 
 
 def generate_answer(context: str, query: str, stream: bool = True):
@@ -21,35 +59,292 @@ def generate_answer(context: str, query: str, stream: bool = True):
         If stream=False: Returns the complete response as a string
     """
     # Format the instruction prompt with context and query
-    formatted_prompt = INSTRUCTION_PROMPT.format(
-        retrieved_chunks=context,
-        user_query=query
-    )
+    formatted_prompt = build_prompt(context, query)
     
     # Call the language model
+    start = time.perf_counter()
     response = ollama.chat(
         model=LANGUAGE_MODEL,
         messages=[{'role': 'user', 'content': formatted_prompt}],
         stream=stream,
+        keep_alive=OLLAMA_KEEP_ALIVE,
     )
     
     if stream:
         # Return generator for streaming responses
-        for chunk in response:
-            yield chunk['message']['content']
-    else:
-        # Return complete response for evaluation
+        return _stream_response(response, start)
+    
+    # Return complete response for evaluation
+    record_completion(start, response)
+    return response['message']['content']
+
+
+def warm_up_llm(model: str = LANGUAGE_MODEL):
+    """
+    Load the language model in Ollama ahead of the first answer.
+
+    A chat request without messages only loads the model; OLLAMA_KEEP_ALIVE
+    keeps it in memory between questions.
+
+    Args:
+        model: The language model name
+    """
+    ollama.chat(model=model, messages=[], keep_alive=OLLAMA_KEEP_ALIVE)
+
+
+def _stream_response(response, start: float):
+    """Yield the text of each streamed chunk, recording first-token and completion times."""
+    final_chunk = None
+    for chunk in response:
+        if final_chunk is None:
+            record("llm_first_token", time.perf_counter() - start)
+        final_chunk = chunk
+        yield chunk['message']['content']
+    # The last (done) chunk carries Ollama's token counts
+    record_completion(start, final_chunk)
+
+
+async def agenerate_answer(context: str, query: str, stream: bool = True):
+    """
+    Async version of `generate_answer`, using the async Ollama client.
+    
+    At most ASYNC_GENERATE_CONCURRENCY generations run at once; further calls
+    wait for a slot.
+    
+    Args:
+        context: The retrieved and reranked context chunks as a single string
+        query: The user's question
+        stream: Whether to stream the response (default: True)
+        
+    Yields:
+        Response chunks as they arrive, or the complete response once if
+        stream=False
+    """
+    formatted_prompt = build_prompt(context, query)
+    client = ollama.AsyncClient()
+    
+    async with _generate_limiter:
+        start = time.perf_counter()
+        response = await client.chat(
+            model=LANGUAGE_MODEL,
+            messages=[{'role': 'user', 'content': formatted_prompt}],
+            stream=stream,
+            keep_alive=OLLAMA_KEEP_ALIVE,
+        )
+        if stream:
+            final_chunk = None
+            async for chunk in response:
+                if final_chunk is None:
+                    record("llm_first_token", time.perf_counter() - start)
+                final_chunk = chunk
+                yield chunk['message']['content']
+            # The last (done) chunk carries Ollama's token counts
+            record_completion(start, final_chunk)
+        else:
+            record_completion(start, response)
+            yield response['message']['content']
+
+
+class ChatSession:
+    """
+    A multi-turn conversation that keeps the LLM's prompt prefix stable.
+
+    The static instructions are the system message, and earlier turns are
+    kept as plain (question, answer) messages; only the newest user message
+    carries retrieved context. Consecutive requests therefore share a long,
+    unchanged prefix, which Ollama serves from its KV cache instead of
+    prefilling it again, and OLLAMA_KEEP_ALIVE keeps the model (and that
+    cache) loaded between turns. At most `history_turns` earlier turns are kept.
+    """
+
+    def __init__(self, model: str = LANGUAGE_MODEL, system_prompt: str = SYSTEM_PROMPT,
+                 history_turns: int = CHAT_HISTORY_TURNS, keep_alive=OLLAMA_KEEP_ALIVE):
+        """
+        Args:
+            model: The language model name
+            system_prompt: Static instructions sent as the system message
+            history_turns: Earlier turns kept in the messages
+            keep_alive: How long Ollama keeps the model loaded after each turn
+        """
+        self.model = model
+        self.system_prompt = system_prompt
+        self.keep_alive = keep_alive
+        self.history = deque(maxlen=history_turns)  # (question, answer) pairs
+        self.last_timings = None  # see `turn_timings`, for the latest turn
+
+    def messages(self, context: str, query: str) -> list:
+        """
+        Build the chat messages for a new turn.
+
+        Args:
+            context: The retrieved context for this turn
+            query: The user's question
+
+        Returns:
+            List of Ollama chat messages
+        """
+        messages = [{'role': 'system', 'content': self.system_prompt}]
+        for question, answer in self.history:
+            messages.append({'role': 'user', 'content': question})
+            messages.append({'role': 'assistant', 'content': answer})
+        with span("prompt_format", context_chars=len(context)):
+            turn = TURN_PROMPT.format(retrieved_chunks=context, user_query=query)
+        messages.append({'role': 'user', 'content': turn})
+        return messages
+
+    def ask(self, context: str, query: str, stream: bool = True):
+        """
+        Answer a question in this conversation.
+
+        The turn joins the history once its answer is complete (for a
+        stream, once it has been fully consumed).
+
+        Args:
+            context: The retrieved context for this turn
+            query: The user's question
+            stream: Whether to stream the response (default: True)
+
+        Returns:
+            If stream=True: Returns a generator that yields response chunks
+            If stream=False: Returns the complete response as a string
+        """
+        messages = self.messages(context, query)
+        start = time.perf_counter()
+        response = ollama.chat(
+            model=self.model,
+            messages=messages,
+            stream=stream,
+            keep_alive=self.keep_alive,
+        )
+        if stream:
+            return self._stream_turn(response, query, start)
+        self._finish_turn(query, response['message']['content'], response, start, None)
         return response['message']['content']
 
+    def _stream_turn(self, response, query: str, start: float):
+        pieces = []
+        final_chunk = None
+        first_token = None
+        for chunk in response:
+            if first_token is None:
+                first_token = time.perf_counter() - start
+                record("llm_first_token", first_token)
+            final_chunk = chunk
+            pieces.append(chunk['message']['content'])
+            yield pieces[-1]
+        self._finish_turn(query, ''.join(pieces), final_chunk, start, first_token)
+
+    def _finish_turn(self, query: str, answer: str, final_chunk, start: float, first_token):
+        record_completion(start, final_chunk)
+        self.last_timings = turn_timings(final_chunk, time.perf_counter() - start, first_token)
+        if self.last_timings['prefill_s']:
+            record("llm_prefill", self.last_timings['prefill_s'],
+                   tokens=self.last_timings['prompt_tokens'])
+        self.history.append((query, answer))
+
+    def reset(self):
+        """Forget the conversation history."""
+        self.history.clear()
+        self.last_timings = None
+
+
+def turn_timings(final_chunk, total_s: float, first_token_s: float = None) -> dict:
+    """
+    Split a response's time into prefill and generation using Ollama's counters.
+
+    `prompt_eval_count` counts only the prompt tokens Ollama had to evaluate,
+    so it drops when a prompt prefix was reused from the KV cache.
+
+    Args:
+        final_chunk: The final (done) response chunk or full response (may be None)
+        total_s: Wall time of the whole request
+        first_token_s: Wall time to the first streamed chunk, if streaming
+
+    Returns:
+        Dict with 'prompt_tokens', 'prefill_s', 'generated_tokens',
+        'generation_s', 'load_s', 'first_token_s' and 'total_s'
+    """
+    def get(key):
+        return (final_chunk.get(key) if final_chunk is not None else None) or 0
+
+    return {
+        'prompt_tokens': get('prompt_eval_count'),
+        'prefill_s': get('prompt_eval_duration') / 1e9,
+        'generated_tokens': get('eval_count'),
+        'generation_s': get('eval_duration') / 1e9,
+        'load_s': get('load_duration') / 1e9,
+        'first_token_s': first_token_s,
+        'total_s': total_s,
+    }
+
+
+def format_turn_timings(timings: dict) -> str:
+    """Format `turn_timings` as one line: prefill vs generation."""
+    line = (f"Prefill: {timings['prompt_tokens']} tokens in {timings['prefill_s']:.2f}s"
+            f" | Generation: {timings['generated_tokens']} tokens in {timings['generation_s']:.2f}s")
+    if timings['generation_s']:
+        line += f" ({timings['generated_tokens'] / timings['generation_s']:.1f} tok/s)"
+    if timings['load_s'] >= 0.01:
+        line += f" | Model load: {timings['load_s']:.2f}s"
+    if timings['first_token_s'] is not None:
+        line += f" | First token after {timings['first_token_s']:.2f}s"
+    return line
+
+
+def record_completion(start: float, final_chunk):
+    """
+    Record the `llm_completion` span, with token counts when Ollama reports them.
+    
+    Args:
+        start: perf_counter() value taken when the request was sent
+        final_chunk: The final (done) response chunk, the full response, or None
+    """
+    if not enabled():
+        return
+    attrs = {}
+    tokens = final_chunk.get('eval_count') if final_chunk is not None else None
+    if tokens:
+        attrs['tokens'] = tokens
+        eval_ns = final_chunk.get('eval_duration')
+        if eval_ns:
+            attrs['tokens_per_s'] = tokens / (eval_ns / 1e9)
+    record("llm_completion", time.perf_counter() - start, **attrs)
+
+
+def context_documents(retrieved_chunks: list, query: str = None) -> list:
+    """
+    Return the chunk texts that `format_context` puts in the prompt, in order.
+    
+    With a query (and CONTEXT_PACKING on), the chunks are packed into the
+    CONTEXT_MAX_TOKENS budget: near-duplicates are dropped and long sections
+    trimmed (see `context_packer.pack_context`). The `context_pack` span
+    records the tokens saved.
+    
+    Args:
+        retrieved_chunks: List of tuples (document, score)
+        query: The user's question
+        
+    Returns:
+        List of chunk texts
+    """
+    if query is None or not CONTEXT_PACKING:
+        return [chunk[0] for chunk in retrieved_chunks]
+    with span("context_pack", chunks=len(retrieved_chunks)) as s:
+        packed = pack_context(retrieved_chunks, query)
+        s.set(tokens=packed.tokens, tokens_saved=packed.tokens_saved,
+              duplicates=packed.duplicates, trimmed=packed.trimmed)
+    return packed.documents
+
 
-def format_context(retrieved_chunks: list) -> str:
+def format_context(retrieved_chunks: list, query: str = None) -> str:
     """
-    Format retrieved chunks into a single context string.
+    Format retrieved chunks into a single context string (see `context_documents`).
     
     Args:
         retrieved_chunks: List of tuples (document, score)
+        query: The user's question (packs the chunks into the token budget)
         
     Returns:
         Formatted context string
     """
-    return "\n".join([chunk[0] for chunk in retrieved_chunks])
+    return "\n".join(context_documents(retrieved_chunks, query))
@@ -1,87 +1,245 @@
 #!/usr/bin/env python3
 """
 Standalone data ingestion script for the RAG system.
-Run this script once to populate the ChromaDB database with embeddings.
+Walks an Obsidian vault, chunks every note by headers in a process pool and
+streams the chunks through the embedder into ChromaDB. Re-running it only
+embeds chunks that are new or changed and removes chunks that no longer exist.
 
 Usage:
-    python ingest.py
+    python ingest.py                  # incremental update of VAULT_PATH
+    python ingest.py --vault PATH     # ingest another vault (or a single note)
+    python ingest.py --full           # drop the collection and re-ingest everything
 """
 
-import ollama
+import argparse
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
 import chromadb
+from embedder import iter_embedded_batches
+from obsidian import chunk_path_key
+from pipeline import batched, bounded_map, threaded_stage
+from quantized_store import QuantizedStore, export_collection
+from vault import iter_vault_files, chunk_file
 from config import (
     CHROMA_DB_PATH,
-    EMBEDDING_MODEL,
-    DATASET_PATH,
+    VAULT_PATH,
     COLLECTION_NAME,
-    COLLECTION_METADATA
+    COLLECTION_METADATA,
+    EMBED_BATCH_SIZE,
+    EMBED_MAX_WORKERS,
+    CHROMA_WRITE_BATCH_SIZE,
+    INGEST_PROCESSES,
+    INGEST_QUEUE_SIZE,
+    QUANTIZED_STORE_PATH,
 )
 
 
-def main():
-    """Main ingestion function."""
+class StageStats:
+    """Item counters for the ingestion stages, reported as throughput."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.files = 0
+        self.chunks = 0
+        self.embeddings = 0
+        self.written = 0
+
+    def report(self) -> str:
+        """Format the per-stage counts and rates since the start of the run."""
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        return (
+            f"{self.files} files ({self.files / elapsed:.1f} files/s), "
+            f"{self.chunks} chunks ({self.chunks / elapsed:.1f} chunks/s), "
+            f"{self.embeddings} embeddings ({self.embeddings / elapsed:.1f} embeddings/s), "
+            f"{self.written} written in {elapsed:.1f}s"
+        )
+
+
+def main(full: bool = False, vault: str = VAULT_PATH):
+    """
+    Main ingestion function.
+
+    Args:
+        full: Drop the existing collection and re-ingest every chunk
+        vault: Vault directory (or single note) to ingest
+    """
+    if not Path(vault).exists():
+        print(f"Error: Vault not found at {vault}")
+        print("Please ensure the vault directory exists before running ingestion.")
+        return
+
     print("Initializing ChromaDB client...")
     client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
+    if full:
+        # Older chromadb raises ValueError for a missing collection, 1.x NotFoundError;
+        # anything else (a locked database, permissions) must stop the run
+        not_found = (ValueError, getattr(chromadb.errors, 'NotFoundError', ValueError))
+        try:
+            client.delete_collection(name=COLLECTION_NAME)
+            print(f"Dropped existing collection '{COLLECTION_NAME}'.")
+        except not_found:
+            pass
     collection = client.get_or_create_collection(
         name=COLLECTION_NAME,
         metadata=COLLECTION_METADATA
     )
-    
-    # Check if data already exists
-    if collection.count() > 0:
-        print(f"Database already contains {collection.count()} chunks. Skipping ingestion.")
-        print("To re-ingest data, delete the database directory first.")
-        return
-    
-    print("No existing data found in DB. Starting ingestion...")
-    
-    # Read and prepare documents
-    try:
-        with open(DATASET_PATH, "r", encoding="utf-8") as file:
-            dataset_lines = file.readlines()
-    except FileNotFoundError:
-        print(f"Error: Dataset file not found at {DATASET_PATH}")
-        print("Please ensure the dataset file exists before running ingestion.")
-        return
-    
-    documents = [chunk.strip() for chunk in dataset_lines if chunk.strip()]
-    
-    if not documents:
-        print("Error: No valid documents found in dataset file.")
-        return
-    
-    print(f"Found {len(documents)} documents to process...")
-    
-    # Generate embeddings
-    print("Generating embeddings...")
-    embeddings_list = []
-    ids = [str(i) for i in range(len(documents))]
-    
-    for i, doc in enumerate(documents):
-        if i % 10 == 0:  # Progress indicator
-            print(f"Processing document {i + 1}/{len(documents)}")
-        
-        try:
-            embedding = ollama.embed(model=EMBEDDING_MODEL, input=doc)['embeddings'][0]
-            embeddings_list.append(embedding)
-        except Exception as e:
-            print(f"Error generating embedding for document {i}: {e}")
-            return
-    
-    # Add to collection
-    print("Adding documents to ChromaDB...")
+
+    existing_ids = set(collection.get(include=[])['ids'])
+    print(f"Collection holds {len(existing_ids)} chunks. Scanning {vault}...")
+
+    stats = StageStats()
+    current_ids = set()
+    new_paths = Counter()
+
+    def new_records(records):
+        """Record every current id and pass on only those not stored yet."""
+        for record in records:
+            current_ids.add(record['id'])
+            if record['id'] not in existing_ids:
+                new_paths[chunk_path_key(record['id'])] += 1
+                yield record
+
+    # Stage 1: chunk files in worker processes; stage 2: embed; stage 3: write
+    pending_records = []
+    pending_embeddings = []
+    processes = INGEST_PROCESSES or os.cpu_count() or 1
+    print(
+        f"Chunking with {processes} processes; embedding in batches of "
+        f"{EMBED_BATCH_SIZE} with {EMBED_MAX_WORKERS} in flight..."
+    )
+
     try:
-        collection.add(
-            embeddings=embeddings_list,
-            documents=documents,
-            ids=ids
-        )
-        print(f"Successfully ingested {len(documents)} chunks into ChromaDB.")
-        print(f"Database saved to: {CHROMA_DB_PATH}")
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            records = threaded_stage(
+                iter_vault_records(pool, vault, processes, stats),
+                maxsize=INGEST_QUEUE_SIZE,
+                name="ingest-chunker",
+            )
+            for batch, embeddings in iter_embedded_batches(new_records(records)):
+                stats.embeddings += len(batch)
+                pending_records.extend(batch)
+                pending_embeddings.extend(embeddings)
+                if len(pending_records) >= CHROMA_WRITE_BATCH_SIZE:
+                    stats.written += write_batch(collection, pending_records, pending_embeddings)
+                    pending_records, pending_embeddings = [], []
+                    print(f"Progress: {stats.report()}")
+
+            if pending_records:
+                stats.written += write_batch(collection, pending_records, pending_embeddings)
     except Exception as e:
-        print(f"Error adding documents to collection: {e}")
+        print(f"Error during ingestion after {stats.written} chunks: {e}")
+        print("Re-run ingest.py to resume; completed batches are kept.")
         return
 
+    if not current_ids:
+        print("Error: No valid documents found in the vault.")
+        return
+
+    # Remove chunks that vanished or whose content changed, only once their
+    # replacements are safely written
+    stale_ids = sorted(existing_ids - current_ids)
+    for batch in batched(stale_ids, CHROMA_WRITE_BATCH_SIZE):
+        collection.delete(ids=batch)
+
+    report = summarize_changes(
+        new_paths, stale_ids, skipped=len(current_ids & existing_ids)
+    )
+    print(f"Throughput: {stats.report()}")
+    print(
+        f"Changes: {report['added']} added, {report['updated']} updated, "
+        f"{report['deleted']} deleted, {report['skipped']} unchanged."
+    )
+    print(f"Database saved to: {CHROMA_DB_PATH}")
+
+    # Keep an exported quantized store in step with the collection
+    store_meta = QuantizedStore.read_meta(QUANTIZED_STORE_PATH)
+    if store_meta is not None and (report['added'] or report['updated'] or report['deleted']):
+        store = export_collection(collection, QUANTIZED_STORE_PATH, dtype=store_meta['dtype'],
+                                  keep_fp32=store_meta['fp32'])
+        print(f"Re-exported quantized store ({len(store)} chunks) to {QUANTIZED_STORE_PATH}.")
+    return report
+
+
+def iter_vault_records(pool, vault, processes: int, stats: StageStats):
+    """
+    Chunk the vault's files in a process pool and stream the records.
+
+    At most two files per worker are in flight, so memory depends on the
+    largest note rather than on the size of the vault.
+
+    Args:
+        pool: ProcessPoolExecutor used for chunking
+        vault: Vault directory (or single note)
+        processes: Number of worker processes
+        stats: Counters updated as files and chunks are produced
+
+    Yields:
+        Record dicts with 'id', 'document' and 'metadata' keys
+    """
+    chunk = partial(chunk_file, vault=str(vault))
+    paths = (str(path) for path in iter_vault_files(vault))
+    for records in bounded_map(pool, chunk, paths, max_in_flight=processes * 2):
+        stats.files += 1
+        stats.chunks += len(records)
+        yield from records
+
+
+def summarize_changes(new_paths: Counter, stale_ids: list, skipped: int) -> dict:
+    """
+    Classify the ingestion diff into added, updated, deleted and skipped chunks.
+
+    A new chunk and a stale chunk under the same header path count as one
+    update rather than an add plus a delete.
+
+    Args:
+        new_paths: Count of new chunk ids per header-path key
+        stale_ids: Stored ids that are no longer current
+        skipped: Number of current chunks that were already stored
+
+    Returns:
+        Dict with 'added', 'updated', 'deleted' and 'skipped' counts
+    """
+    stale_paths = Counter(chunk_path_key(cid) for cid in stale_ids)
+    updated = sum((new_paths & stale_paths).values())
+    return {
+        'added': sum(new_paths.values()) - updated,
+        'updated': updated,
+        'deleted': len(stale_ids) - updated,
+        'skipped': skipped,
+    }
+
+
+def write_batch(collection, records: list, embeddings: list) -> int:
+    """
+    Upsert one batch of embedded records into the collection.
+
+    Args:
+        collection: The ChromaDB collection
+        records: List of dicts with 'id', 'document' and 'metadata' keys
+        embeddings: Embedding vectors aligned with `records`
+
+    Returns:
+        Number of records written
+    """
+    collection.upsert(
+        embeddings=embeddings,
+        documents=[record['document'] for record in records],
+        metadatas=[record['metadata'] for record in records],
+        ids=[record['id'] for record in records]
+    )
+    return len(records)
+
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Ingest an Obsidian vault into ChromaDB.")
+    parser.add_argument("--full", action="store_true",
+                        help="drop the collection and re-ingest every chunk")
+    parser.add_argument("--vault", default=VAULT_PATH,
+                        help="vault directory or single note to ingest")
+    args = parser.parse_args()
+    main(full=args.full, vault=args.vault)
@@ -0,0 +1,81 @@
+"""
+Thread-safe, size-bounded LRU cache used by the in-memory cache layers.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """A dict-like least-recently-used cache with hit/miss counters and optional expiry."""
+
+    def __init__(self, maxsize: int, ttl: float = None):
+        """
+        Args:
+            maxsize: Maximum number of entries; 0 disables caching
+            ttl: Seconds an entry stays valid after it was stored (None never expires)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._expires = {}  # key -> wall-clock expiry time (only with a ttl)
+        self._lock = threading.Lock()
+
+    def _expired(self, key) -> bool:
+        """Drop `key` if its ttl has passed (caller holds the lock)."""
+        if self.ttl is None or self._expires[key] > time.time():
+            return False
+        del self._data[key]
+        del self._expires[key]
+        return True
+
+    def get(self, key, default=None):
+        """Return the cached value for `key` (marking it recently used), or `default`."""
+        with self._lock:
+            if key not in self._data or self._expired(key):
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+    def put(self, key, value, stored_at: float = None):
+        """
+        Insert or refresh `key`, evicting the least recently used entry if full.
+
+        Args:
+            key: Cache key
+            value: Value to store
+            stored_at: Wall-clock time the value was created, for entries
+                       restored from disk (defaults to now); the ttl counts from it
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if self.ttl is not None:
+                self._expires[key] = (time.time() if stored_at is None else stored_at) + self.ttl
+            while len(self._data) > self.maxsize:
+                evicted, _ = self._data.popitem(last=False)
+                self._expires.pop(evicted, None)
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._data and not self._expired(key)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Return the hit/miss counters and current size."""
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
@@ -4,31 +4,186 @@ Main entry point for the interactive RAG chat application.
 Provides a command-line interface for asking questions and getting answers.
 
 Usage:
-    python main.py
+    python main.py [--chat] [--no-answer-cache] [--watch]
+    python main.py --serve [--host HOST] [--port PORT] [--watch]
+    python main.py --batch questions.jsonl --out answers.jsonl [--workers N]
+    python main.py --trace [--trace-file trace.jsonl] [--metrics-port 9100]
 """
 
+import argparse
+import time
+
+import tracing
 from retriever import Retriever
-from generator import generate_answer, format_context
+from shards import VaultShard
+from embedder import warm_up_embedder
+from generator import (
+    ChatSession,
+    generate_answer,
+    format_context,
+    format_turn_timings,
+    warm_up_llm,
+)
+from pipeline import BackgroundTask
+from answer_cache import AnswerCache
+from config import (
+    ANSWER_CACHE_ENABLED,
+    BACKGROUND_LOAD,
+    BATCH_GENERATE_WORKERS,
+    OLLAMA_WARMUP,
+    SERVER_HOST,
+    SERVER_PORT,
+    TRACE_ENABLED,
+    TRACE_FILE,
+    TRACE_METRICS_PORT,
+    WATCH_VAULT,
+)
+
+
+def setup_tracing(trace_file: str = None, metrics_port: int = None):
+    """
+    Turn on per-stage timing spans.
+
+    Args:
+        trace_file: Append every span to this JSONL file
+        metrics_port: Serve Prometheus-text metrics at /metrics on this port
+
+    Returns:
+        The in-memory HistogramSink used for the summaries
+    """
+    histogram = tracing.HistogramSink()
+    sinks = [histogram]
+    if trace_file:
+        sinks.append(tracing.JSONLSink(trace_file))
+        print(f"Writing trace spans to {trace_file}")
+    if metrics_port:
+        prometheus = tracing.PrometheusSink()
+        prometheus.serve(port=metrics_port)
+        sinks.append(prometheus)
+        print(f"Serving metrics on http://127.0.0.1:{metrics_port}/metrics")
+    tracing.enable(*sinks)
+    return histogram
+
+
+def format_timings(histogram) -> str:
+    """Format the latest span of each stage as one line of timings."""
+    parts = []
+    for name, (duration, attrs) in histogram.last.items():
+        part = f"{name} {duration * 1000:.0f}ms"
+        if 'tokens_per_s' in attrs:
+            part += f" ({attrs['tokens_per_s']:.1f} tok/s)"
+        if 'tokens_saved' in attrs:
+            part += f" ({attrs['tokens']} tokens, {attrs['tokens_saved']} saved)"
+        parts.append(part)
+    return "Timings: " + " | ".join(parts)
+
+
+def start_warm_up() -> list:
+    """
+    Preload the embedding and language models in Ollama on background threads.
+
+    Returns:
+        The warm-up BackgroundTasks (a failure only surfaces through `result()`)
+    """
+    if not OLLAMA_WARMUP:
+        return []
+    return [
+        BackgroundTask(warm_up_embedder, name="ollama-embedder"),
+        BackgroundTask(warm_up_llm, name="ollama-llm"),
+    ]
+
+
+def watched_vault(watch: bool, background: bool = False):
+    """Return the shards to search with --watch (None keeps the configured ones)."""
+    return [VaultShard(background=background)] if watch else None
+
+
+def serve(host: str, port: int, watch: bool = False):
+    """Run the long-lived HTTP query server (re-indexing the vault on edits with `watch`)."""
+    from server import RAGServer
+    
+    try:
+        retriever = Retriever(shards=watched_vault(watch))
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        print("Please run 'python ingest.py' first to set up the database.")
+        return
+    
+    try:
+        RAGServer(retriever, host=host, port=port).serve_forever()
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
+
 
+def run_batch(input_path: str, output_path: str, workers: int = BATCH_GENERATE_WORKERS,
+              use_answer_cache: bool = ANSWER_CACHE_ENABLED):
+    """Answer a JSONL file of questions offline (see batch.py)."""
+    from batch import run_batch as answer_file, format_report
+    
+    warm_up = start_warm_up()
+    try:
+        retriever = Retriever()
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        print("Please run 'python ingest.py' first to set up the database.")
+        return
+    for task in warm_up:
+        try:
+            task.result()
+        except Exception as e:
+            print(f"Warm-up of {task.name} failed: {e}")
+    
+    answer_cache = AnswerCache() if use_answer_cache else None
+    try:
+        report = answer_file(retriever, input_path, output_path,
+                             answer_cache=answer_cache, workers=workers)
+    except KeyboardInterrupt:
+        print(f"\nStopped; re-run the same command to resume from {output_path}.")
+        return
+    finally:
+        if answer_cache is not None:
+            answer_cache.close()
+    print(format_report(report))
 
-def main():
-    """Main interactive chat function."""
+
+def main(histogram=None, use_answer_cache: bool = ANSWER_CACHE_ENABLED, chat: bool = False,
+         watch: bool = False):
+    """
+    Main interactive chat function.
+    
+    Args:
+        histogram: HistogramSink to report stage timings from (tracing on)
+        use_answer_cache: Replay cached answers for repeated questions over
+                          the same retrieved chunks
+        chat: Keep a multi-turn ChatSession (answers depend on earlier turns,
+              so the answer cache is not used) and print prefill vs
+              generation time per turn
+        watch: Search the vault indexed in memory, re-indexing notes as
+               they are edited (see shards.VaultShard)
+    """
     print("="*60)
     print("PRESENTATION RAG SYSTEM")
     print("="*60)
     print("Initializing system...")
+    start = time.perf_counter()
+    start_warm_up()
     
-    # Initialize the retriever
+    # Initialize the retriever (models and indexes keep loading in the background)
     try:
-        retriever = Retriever()
+        retriever = Retriever(background=BACKGROUND_LOAD,
+                              shards=watched_vault(watch, background=BACKGROUND_LOAD))
     except RuntimeError as e:
         print(f"Error: {e}")
         print("Please run 'python ingest.py' first to set up the database.")
         return
+    session = ChatSession() if chat else None
+    answer_cache = AnswerCache() if use_answer_cache and session is None else None
     
-    print("System ready!")
+    print(f"System ready in {time.perf_counter() - start:.2f}s!")
     print("="*60)
     print("Ask me anything about the presentation! (type 'quit', 'exit', or 'q' to exit)")
+    if session is not None:
+        print("Chat mode: follow-up questions see earlier turns (type 'reset' to start over)")
     print("="*60)
     
     # Main interaction loop
@@ -45,25 +200,54 @@ def main():
             if not user_query:
                 continue
             
+            if session is not None and user_query.lower() == 'reset':
+                session.reset()
+                print("Conversation cleared.")
+                continue
+            
+            if histogram is not None:
+                histogram.clear_last()
+            
+            if not all(task.done() for task in retriever.loading):
+                print("Waiting for the models to finish loading...")
+            
             # Retrieve relevant context
             print("Searching for relevant information...")
-            relevant_chunks_data = retriever.retrieve_and_rerank(user_query)
+            relevant_chunks_data, chunk_ids, stats = retriever.retrieve_and_rerank_batch(
+                [user_query], with_stats=True
+            )[0]
+            skipped = [name for name, ms in stats['shards'].items() if isinstance(ms, str)]
+            if skipped:
+                print(f"Left out slow or failing shards: {', '.join(skipped)}")
             
             if not relevant_chunks_data:
                 print("No relevant information found for your query.")
                 continue
             
-            # Format context
-            context = format_context(relevant_chunks_data)
-            
-            # Generate and stream answer
+            # Generate and stream answer (replayed if this question was
+            # already answered from the same chunks)
             print("\nAnswer:")
             print("-" * 40)
             
             try:
-                for chunk in generate_answer(context, user_query, stream=True):
+                cache_hit = None
+                if session is not None:
+                    response = session.ask(format_context(relevant_chunks_data, user_query), user_query)
+                elif answer_cache is not None:
+                    response, cache_hit = answer_cache.generate_answer(user_query, relevant_chunks_data, chunk_ids)
+                else:
+                    response = generate_answer(
+                        format_context(relevant_chunks_data, user_query), user_query, stream=True
+                    )
+                for chunk in response:
                     print(chunk, end='', flush=True)
                 print("\n" + "-" * 40)
+                if cache_hit:
+                    print(f"(cached answer, {cache_hit} match)")
+                if session is not None:
+                    print(format_turn_timings(session.last_timings))
+                if histogram is not None:
+                    print(format_timings(histogram))
                 
             except Exception as e:
                 print(f"Error generating answer: {e}")
@@ -78,4 +262,47 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Presentation RAG system.")
+    parser.add_argument("--serve", action="store_true",
+                        help="run the HTTP query server instead of the interactive prompt")
+    parser.add_argument("--host", default=SERVER_HOST, help="server bind address")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="server port")
+    parser.add_argument("--batch", metavar="QUESTIONS_JSONL",
+                        help="answer every question in this JSONL file instead of prompting")
+    parser.add_argument("--out", metavar="ANSWERS_JSONL",
+                        help="batch output file (appended to; a re-run resumes from it)")
+    parser.add_argument("--workers", type=int, default=BATCH_GENERATE_WORKERS,
+                        help="concurrent answer generations in batch mode")
+    parser.add_argument("--chat", action="store_true",
+                        help="multi-turn conversation that reuses the prompt prefix between turns")
+    parser.add_argument("--no-answer-cache", action="store_true",
+                        help="always generate a fresh answer")
+    parser.add_argument("--watch", action="store_true", default=WATCH_VAULT,
+                        help="index the vault in memory and re-index notes as they are edited")
+    parser.add_argument("--trace", action="store_true", default=TRACE_ENABLED,
+                        help="time each pipeline stage and report latency percentiles")
+    parser.add_argument("--trace-file", default=TRACE_FILE,
+                        help="append trace spans to this JSONL file (implies --trace)")
+    parser.add_argument("--metrics-port", type=int, default=TRACE_METRICS_PORT,
+                        help="serve Prometheus metrics on this port (implies --trace)")
+    args = parser.parse_args()
+    if args.batch and not args.out:
+        parser.error("--batch requires --out")
+    
+    histogram = None
+    if args.trace or args.trace_file or args.metrics_port:
+        histogram = setup_tracing(args.trace_file, args.metrics_port)
+    
+    try:
+        if args.serve:
+            serve(args.host, args.port, watch=args.watch)
+        elif args.batch:
+            run_batch(args.batch, args.out, workers=args.workers,
+                      use_answer_cache=ANSWER_CACHE_ENABLED and not args.no_answer_cache)
+        else:
+            main(histogram, use_answer_cache=ANSWER_CACHE_ENABLED and not args.no_answer_cache,
+                 chat=args.chat, watch=args.watch)
+    finally:
+        if histogram is not None:
+            print(histogram.report())
+            tracing.disable()
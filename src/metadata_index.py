@@ -0,0 +1,122 @@
+"""
+Inverted index from Obsidian tags and internal links to chunk ids.
+Lets the retriever narrow the candidate set before vector search and
+reranking when a query is restricted to a #tag or to notes linking to [[Note]].
+Kept free of heavy imports so ingestion workers can use the helpers.
+"""
+
+from collections import defaultdict
+
+from obsidian import scan_metadata
+
+# ChromaDB metadata values must be scalars, so lists are stored joined
+LIST_SEPARATOR = '\n'
+
+
+def join_values(values) -> str:
+    """Join a list of tags, URLs or links into one metadata string (sorted)."""
+    return LIST_SEPARATOR.join(sorted(values))
+
+
+def split_values(value) -> list:
+    """Inverse of `join_values`; lists pass through unchanged."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return value.split(LIST_SEPARATOR)
+    return list(value)
+
+
+def normalize_tag(tag: str) -> str:
+    """Normalize a tag for lookups: 'Python', '#python' -> 'python'."""
+    return tag.strip().lstrip('#').lower()
+
+
+def normalize_link(link: str) -> str:
+    """
+    Normalize an internal link target for lookups.
+
+    Aliases, heading anchors, folders and the .md suffix are dropped, so
+    'Folder/Note.md#Heading|alias' and 'note' both become 'note'.
+    """
+    target = link.split('|', 1)[0].split('#', 1)[0].strip()
+    target = target.rsplit('/', 1)[-1]
+    if target.lower().endswith('.md'):
+        target = target[:-3]
+    return target.strip().lower()
+
+
+def query_filters(query: str) -> tuple:
+    """
+    Detect #tags and [[internal links]] mentioned in a query.
+
+    Args:
+        query: The search query
+
+    Returns:
+        Tuple (tags, links) of lists, empty when nothing was mentioned
+    """
+    metadata = scan_metadata(query)
+    return metadata['tags'], metadata['internal_links']
+
+
+class MetadataIndex:
+    """Maps normalized tags and link targets to the ids of the chunks using them."""
+
+    def __init__(self):
+        self.tags = defaultdict(set)
+        self.links = defaultdict(set)
+
+    @classmethod
+    def from_metadatas(cls, ids: list, metadatas: list) -> "MetadataIndex":
+        """
+        Build an index from chunk ids and their metadata dicts.
+
+        Args:
+            ids: Chunk ids
+            metadatas: Metadata dicts aligned with `ids`, with 'tags' and
+                       'internal_links' as lists or `join_values` strings
+
+        Returns:
+            A new MetadataIndex
+        """
+        index = cls()
+        for chunk_id, metadata in zip(ids, metadatas):
+            index.add(chunk_id, metadata or {})
+        return index
+
+    def add(self, chunk_id: str, metadata: dict):
+        """Index one chunk's tags and internal links."""
+        for tag in split_values(metadata.get('tags')):
+            self.tags[normalize_tag(tag)].add(chunk_id)
+        for link in split_values(metadata.get('internal_links')):
+            self.links[normalize_link(link)].add(chunk_id)
+
+    def match(self, tags=None, links_to=None):
+        """
+        Find the chunks carrying any of `tags` and linking to any of `links_to`.
+
+        Args:
+            tags: A tag or list of tags (with or without '#')
+            links_to: A note name or list of note names
+
+        Returns:
+            Set of chunk ids (possibly empty), or None if no filter was given
+        """
+        allowed = None
+        for values, postings, normalize in (
+            (tags, self.tags, normalize_tag),
+            (links_to, self.links, normalize_link),
+        ):
+            if not values:
+                continue
+            if isinstance(values, str):
+                values = [values]
+            ids = set()
+            for value in values:
+                ids.update(postings.get(normalize(value), ()))
+            allowed = ids if allowed is None else allowed & ids
+        return allowed
+
+    def __len__(self) -> int:
+        return len(set().union(*self.tags.values(), *self.links.values()))
@@ -1,7 +1,17 @@
+import hashlib
+import mmap
 import re
-from typing import Callable, Optional
+from typing import Callable, Iterator, Optional
 from pathlib import Path
 
+# Tags, external URLs and [[internal links]] in one scan. The leading character
+# class lets the regex engine skip ahead to candidate positions; the captures
+# are lookaheads so matches of different kinds may overlap (e.g. a #fragment
+# inside a URL), exactly as with three separate findall passes.
+_METADATA_RE = re.compile(
+    r'[#h\[](?:(?<=#)(?=(\w+))|(?<=h)(?=(ttps?://[^\s)]+))|(?<=\[)(?=\[([^\]]+)\]\]))'
+)
+
 
 def chunk_by_headers_obsidian(markdown_text: str, metadata_fn: Optional[Callable[[str], dict]] = None):
     """Split Obsidian markdown by headers, keeping each section intact.
@@ -99,6 +109,146 @@ def extract_metadata(chunk_text: str) -> dict:
         'urls': list(set(urls)),
         'internal_links': list(set(internal_links))
     }
+
+
+def scan_metadata(chunk_text: str) -> dict:
+    """Single-pass equivalent of `extract_metadata`.
+
+    Returns the same dict as `extract_metadata`, but finds tags, URLs and
+    internal links with one precompiled scan instead of three.
+    """
+    found = ([], [], [])
+    ends = [0, 0, 0]
+    for match in _METADATA_RE.finditer(chunk_text):
+        kind = match.lastindex - 1
+        start = match.start()
+        # findall never returns overlapping matches of the same pattern
+        if start < ends[kind]:
+            continue
+        value = match.group(kind + 1)
+        found[kind].append('h' + value if kind == 1 else value)
+        ends[kind] = match.end(kind + 1) + (2 if kind == 2 else 0)
+
+    return {
+        'tags': list(set(found[0])),
+        'urls': list(set(found[1])),
+        'internal_links': list(set(found[2]))
+    }
+
+
+def _iter_line_blocks(stream, block_size: int = 1 << 16) -> Iterator[list]:
+    """Yield lists of lines that together equal `text.split('\n')`.
+
+    Reads fixed-size blocks from text streams, binary streams or mmap objects
+    and splits on '\n' only; bytes are decoded as UTF-8 once per block, after
+    the last newline so multi-byte characters are never cut. Open text files
+    with newline='' so '\r' characters are not translated.
+    """
+    if isinstance(stream, mmap.mmap):
+        stream.seek(0)
+    pending = None
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        if pending:
+            block = pending + block
+        if isinstance(block, bytes):
+            cut = block.rfind(b'\n') + 1
+            pending = block[cut:]
+            if cut:
+                yield block[:cut - 1].decode('utf-8').split('\n')
+        else:
+            lines = block.split('\n')
+            pending = lines.pop()
+            if lines:
+                yield lines
+    if not pending:
+        yield ['']
+    else:
+        yield [pending.decode('utf-8') if isinstance(pending, bytes) else pending]
+
+
+def iter_chunks_obsidian(stream, metadata_fn: Optional[Callable[[str], dict]] = None):
+    """Streaming, single-pass version of `chunk_by_headers_obsidian`.
+
+    Reads `stream` (a file object or mmap) line by line and yields each chunk
+    as soon as the next chunk boundary is seen, so the whole note is never held
+    in memory. Chunk boundaries, headers and contents are identical to
+    `chunk_by_headers_obsidian`; metadata defaults to `scan_metadata`.
+    """
+    if metadata_fn is None:
+        metadata_fn = scan_metadata
+
+    current_chunk = []
+    current_headers = {}
+
+    for lines in _iter_line_blocks(stream):
+        for line in lines:
+            if '#' not in line or not line.strip().startswith('#'):
+                current_chunk.append(line)
+                continue
+
+            header_level = len(line) - len(line.lstrip('#'))
+            header_text = line.strip('#').strip()
+
+            if 1 <= header_level <= 3:
+                if current_chunk and current_headers:
+                    # previous chunk belongs to the previously-seen header -> emit it
+                    chunk_content = '\n'.join(current_chunk).strip()
+                    if chunk_content:
+                        yield {
+                            'content': chunk_content,
+                            'headers': current_headers.copy(),
+                            'metadata': metadata_fn(chunk_content)
+                        }
+                    current_chunk = [line]
+                else:
+                    # no header seen yet: the preface attaches to the first header
+                    current_chunk.append(line)
+            else:
+                current_chunk.append(line)
+
+            # Update header hierarchy for this header
+            current_headers[f'h{header_level}'] = header_text
+            for i in range(header_level + 1, 7):
+                current_headers.pop(f'h{i}', None)
+
+    if current_chunk:
+        chunk_content = '\n'.join(current_chunk).strip()
+        if chunk_content:
+            yield {
+                'content': chunk_content,
+                'headers': current_headers.copy(),
+                'metadata': metadata_fn(chunk_content)
+            }
+
+
+def header_path(headers: dict) -> str:
+    """Join a header hierarchy dict ({'h1': ..., 'h2': ...}) into 'H1 > H2 > ...'."""
+    return ' > '.join(headers[f'h{i}'] for i in range(1, 7) if f'h{i}' in headers)
+
+
+def chunk_id(path: str, content: str, occurrence: int = 0) -> str:
+    """Build a stable chunk id from its header path and a hash of its content.
+
+    The id has the form '<path digest>-<content digest>[-<occurrence>]', so any
+    edit to the content yields a new id while the prefix still identifies the
+    section it belongs to. `occurrence` disambiguates identical content repeated
+    under the same header path.
+    """
+    path_digest = hashlib.sha256(path.encode('utf-8')).hexdigest()[:12]
+    content_digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+    if occurrence:
+        return f'{path_digest}-{content_digest}-{occurrence}'
+    return f'{path_digest}-{content_digest}'
+
+
+def chunk_path_key(cid: str) -> str:
+    """Return the header-path digest prefix of an id built by `chunk_id`."""
+    return cid.split('-', 1)[0]
+
+
 if __name__ == '__main__':
     # load test note from obsidian_assets/main_discovery.txt next to the repo
     assets_path = Path(__file__).resolve().parent / 'obsidian_assets' / 'main_discovery.txt'
@@ -0,0 +1,213 @@
+"""
+Small streaming helpers shared by the ingestion and query pipelines.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+import weakref
+from collections import deque
+from itertools import islice
+
+
+def batched(iterable, size: int):
+    """
+    Group an iterable into lists of at most `size` items, lazily.
+
+    Args:
+        iterable: Any iterable
+        size: Maximum batch size (must be >= 1)
+
+    Yields:
+        Lists of consecutive items
+    """
+    if size < 1:
+        raise ValueError("Batch size must be at least 1")
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def bounded_map(executor, fn, iterable, max_in_flight: int):
+    """
+    Like `executor.map`, but never has more than `max_in_flight` tasks pending.
+
+    `executor.map` submits the whole input up front, so a slow consumer lets
+    results pile up in memory. This keeps a sliding window of futures and
+    yields results in input order.
+
+    Args:
+        executor: A concurrent.futures executor
+        fn: Callable applied to each item
+        iterable: Input items, consumed lazily
+        max_in_flight: Maximum number of submitted but unconsumed tasks
+
+    Yields:
+        fn(item) for each item, in input order
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+_STAGE_DONE = object()
+
+
+def threaded_stage(iterable, maxsize: int, name: str = "pipeline-stage"):
+    """
+    Run an iterable in a background thread, handing items over a bounded queue.
+
+    The producer blocks when `maxsize` items are waiting, so a slow consumer
+    applies backpressure instead of letting items pile up. Exceptions raised
+    by the producer are re-raised in the consumer.
+
+    Args:
+        iterable: The producing iterable (e.g. a generator stage)
+        maxsize: Maximum number of items buffered between the two stages
+        name: Thread name, for debugging
+
+    Yields:
+        The items of `iterable`, in order
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    error = []
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        buffer.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except BaseException as e:
+            error.append(e)
+        finally:
+            buffer.put(_STAGE_DONE)
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _STAGE_DONE:
+                break
+            yield item
+        if error:
+            raise error[0]
+    finally:
+        # Unblock the producer if the consumer stopped early
+        stop.set()
+        while thread.is_alive():
+            try:
+                buffer.get_nowait()
+            except queue.Empty:
+                thread.join(timeout=0.1)
+
+
+class BackgroundTask:
+    """
+    Run a function on a daemon thread and hand its result over on demand.
+
+    `result()` blocks until the function has finished and re-raises its
+    exception, so callers wait only when (and if) they need the value.
+    """
+
+    def __init__(self, fn, *args, name: str = "background-task", background: bool = True):
+        """
+        Args:
+            fn: The function to run
+            *args: Positional arguments for `fn`
+            name: Thread name, for debugging and start-up reports
+            background: Run on a thread; if False, run `fn` right away in the
+                        caller (its exception is raised immediately)
+        """
+        self.name = name
+        self.elapsed = None  # seconds `fn` took, once finished
+        self._value = None
+        self._error = None
+        self._done = threading.Event()
+        if background:
+            threading.Thread(target=self._run, args=(fn, args), name=name, daemon=True).start()
+        else:
+            self._run(fn, args)
+            self.result()
+
+    @classmethod
+    def completed(cls, value, name: str = "background-task") -> "BackgroundTask":
+        """Return a finished task holding `value`."""
+        return cls(lambda: value, name=name, background=False)
+
+    def _run(self, fn, args):
+        start = time.perf_counter()
+        try:
+            self._value = fn(*args)
+        except BaseException as e:
+            self._error = e
+        finally:
+            self.elapsed = time.perf_counter() - start
+            self._done.set()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def result(self, timeout: float = None):
+        """
+        Wait for the function to finish and return its value.
+
+        Args:
+            timeout: Maximum seconds to wait (None waits indefinitely)
+
+        Raises:
+            TimeoutError: If the function is still running after `timeout`
+            The function's own exception, if it raised one
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"{self.name} did not finish within {timeout}s")
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class AsyncLimiter:
+    """Concurrency limit for an async pipeline stage.
+
+    Wraps one asyncio.Semaphore per event loop, so a limiter can be created at
+    import time and shared by code that runs under several `asyncio.run` calls.
+    Use it as `async with limiter: ...`.
+    """
+
+    def __init__(self, limit: int):
+        """
+        Args:
+            limit: Maximum number of concurrent holders
+        """
+        self.limit = limit
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.limit)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def __aenter__(self):
+        await self._semaphore().acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphore().release()
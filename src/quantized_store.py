@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""
+Compact on-disk embedding store for the RAG system.
+Exports the ChromaDB collection to a directory of flat files that open by
+memory-mapping, instead of loading Chroma's float32 vectors, HNSW graph and
+SQLite tables:
+
+    vectors.npy          (n, dim) int8 with per-vector scales, or float16
+    scales.npy           float32 scale per row (int8 only)
+    vectors_fp32.npy     optional float32 copy, read only to rescore top hits
+    texts.bin            chunk texts (utf-8), with row offsets in texts.offsets.npy
+    ids.bin              chunk ids, with ids.offsets.npy
+    metadatas.bin        chunk metadata as JSON, with metadatas.offsets.npy
+    meta.json            dtype, dimension, row count and embedding model
+
+The store path is a symlink to a versioned directory next to it
+(<name>.v-<id>), so a re-export is swapped in with one atomic rename.
+Searches score the quantized vectors directly, block by block, and can
+rescore the best candidates with the float32 copy.
+
+Usage:
+    python quantized_store.py --export [--dtype float16] [--no-fp32]
+    python quantized_store.py --report [--queries 200]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from metadata_index import MetadataIndex
+from vector_index import top_k
+from config import (
+    CHROMA_DB_PATH,
+    COLLECTION_NAME,
+    EMBEDDING_MODEL,
+    CANDIDATES_TO_RETRIEVE,
+    CHROMA_WRITE_BATCH_SIZE,
+    QUANTIZED_STORE_PATH,
+    QUANTIZED_DTYPE,
+    QUANTIZED_KEEP_FP32,
+    QUANTIZED_RESCORE_FACTOR,
+)
+
+DTYPES = ("int8", "float16")
+FORMAT_VERSION = 1
+# Rows converted to float32 at a time while scoring, to bound temporary memory
+BLOCK_ROWS = 65536
+
+
+def quantize(vectors: np.ndarray, dtype: str):
+    """
+    Quantize L2-normalized float32 vectors.
+
+    Args:
+        vectors: (n, dim) float32 matrix
+        dtype: "int8" (symmetric, one scale per vector) or "float16"
+
+    Returns:
+        Tuple (quantized matrix, float32 scales or None)
+    """
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype != "int8":
+        raise ValueError(f"Unknown dtype '{dtype}'. Choose one of: {', '.join(DTYPES)}")
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class StringTable:
+    """Read-only list of strings stored as one utf-8 blob plus row offsets."""
+
+    def __init__(self, prefix):
+        """
+        Args:
+            prefix: Path without suffix (reads <prefix>.bin and <prefix>.offsets.npy)
+        """
+        prefix = Path(prefix)
+        self.offsets = np.load(prefix.with_suffix('.offsets.npy'), mmap_mode='r')
+        blob = prefix.with_suffix('.bin')
+        # numpy cannot memory-map an empty file
+        self.data = np.memmap(blob, dtype=np.uint8, mode='r') if blob.stat().st_size else b''
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return bytes(self.data[start:end]).decode('utf-8')
+
+
+class _StringTableWriter:
+    """Appends strings to <prefix>.bin and records their offsets."""
+
+    def __init__(self, prefix: Path):
+        self.prefix = prefix
+        self.file = open(prefix.with_suffix('.bin'), 'wb')
+        self.offsets = [0]
+
+    def extend(self, strings):
+        for string in strings:
+            data = string.encode('utf-8')
+            self.file.write(data)
+            self.offsets.append(self.offsets[-1] + len(data))
+
+    def close(self):
+        self.file.close()
+        np.save(self.prefix.with_suffix('.offsets.npy'), np.asarray(self.offsets, dtype=np.int64))
+
+
+class QuantizedStore:
+    """Memory-mapped, quantized embeddings with their chunk texts, ids and metadata."""
+
+    def __init__(self, path=QUANTIZED_STORE_PATH):
+        """
+        Open a store written by `QuantizedStore.write` or `export_collection`.
+
+        Args:
+            path: Store path (the symlink, or a plain directory)
+
+        Raises:
+            FileNotFoundError: If there is no store at `path`
+        """
+        self.path = Path(path)
+        while True:
+            # Read every file from the version the symlink points to now, so a
+            # concurrent re-export cannot mix files of two versions
+            self.directory = self.path.resolve()
+            try:
+                self._open()
+                break
+            except FileNotFoundError:
+                # Retry if a re-export replaced (and removed) that version meanwhile
+                if self.path.resolve() == self.directory:
+                    raise
+        self._rows = None
+
+    def _open(self):
+        self.meta = self.read_meta(self.directory)
+        if self.meta is None:
+            raise FileNotFoundError(f"No quantized store at {self.path}")
+        self.dtype = self.meta['dtype']
+        self.vectors = np.load(self.directory / 'vectors.npy', mmap_mode='r')
+        self.scales = np.load(self.directory / 'scales.npy') if self.dtype == "int8" else None
+        fp32_path = self.directory / 'vectors_fp32.npy'
+        self.fp32 = np.load(fp32_path, mmap_mode='r') if fp32_path.exists() else None
+        self.texts = StringTable(self.directory / 'texts')
+        self.ids = StringTable(self.directory / 'ids')
+        self.metadatas = StringTable(self.directory / 'metadatas')
+
+    @staticmethod
+    def read_meta(path):
+        """
+        Read a store's meta.json.
+
+        Returns:
+            The metadata dict, or None if there is no (complete) store at `path`
+        """
+        try:
+            meta = json.loads((Path(path) / 'meta.json').read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get('format') == FORMAT_VERSION else None
+
+    @classmethod
+    def write(cls, path, batches, dim: int, count: int, dtype: str = QUANTIZED_DTYPE,
+              keep_fp32: bool = QUANTIZED_KEEP_FP32, source: str = None) -> "QuantizedStore":
+        """
+        Write a store from batches of chunks, replacing any store at `path`.
+
+        The files are written to a new versioned directory next to `path`;
+        once complete, `path` is re-pointed at it by atomically replacing the
+        symlink, and the previous version is removed. Readers see either the
+        old or the new store, never a missing or partial one. (A store that
+        is still a plain directory, from before versioning, is moved aside
+        first, so that one swap is not atomic.)
+
+        Args:
+            path: Store path (a symlink to the current version)
+            batches: Iterable of (embeddings, texts, ids, metadatas) batches
+            dim: Embedding dimension
+            count: Total number of chunks in `batches`
+            dtype: One of DTYPES
+            keep_fp32: Also store float32 vectors for rescoring
+            source: Description of where the chunks came from (kept in meta.json)
+
+        Returns:
+            The opened store
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown dtype '{dtype}'. Choose one of: {', '.join(DTYPES)}")
+        path = Path(path)
+        tmp = path.with_name(f"{path.name}.v-{uuid.uuid4().hex[:8]}")
+        tmp.mkdir(parents=True)
+        try:
+            vectors = np.lib.format.open_memmap(
+                tmp / 'vectors.npy', mode='w+', dtype=np.int8 if dtype == "int8" else np.float16,
+                shape=(count, dim),
+            )
+            scales = np.ones(count, dtype=np.float32)
+            fp32 = None
+            if keep_fp32:
+                fp32 = np.lib.format.open_memmap(tmp / 'vectors_fp32.npy', mode='w+',
+                                                 dtype=np.float32, shape=(count, dim))
+            tables = {name: _StringTableWriter(tmp / name) for name in ('texts', 'ids', 'metadatas')}
+
+            row = 0
+            for embeddings, texts, ids, metadatas in batches:
+                normalized = _normalize(embeddings)
+                end = row + len(normalized)
+                if end > count or normalized.shape[1] != dim:
+                    raise ValueError(f"Batch of shape {normalized.shape} does not fit ({count}, {dim})")
+                quantized, batch_scales = quantize(normalized, dtype)
+                vectors[row:end] = quantized
+                if batch_scales is not None:
+                    scales[row:end] = batch_scales
+                if fp32 is not None:
+                    fp32[row:end] = normalized
+                tables['texts'].extend(texts)
+                tables['ids'].extend(ids)
+                tables['metadatas'].extend(json.dumps(m or {}) for m in (metadatas or [None] * len(ids)))
+                row = end
+            if row != count:
+                raise ValueError(f"Expected {count} chunks, got {row}")
+
+            vectors.flush()
+            del vectors
+            if fp32 is not None:
+                fp32.flush()
+                del fp32
+            if dtype == "int8":
+                np.save(tmp / 'scales.npy', scales)
+            for table in tables.values():
+                table.close()
+            meta = {
+                'format': FORMAT_VERSION, 'dtype': dtype, 'dim': dim, 'count': count,
+                'embedding_model': EMBEDDING_MODEL, 'fp32': keep_fp32, 'source': source,
+            }
+            (tmp / 'meta.json').write_text(json.dumps(meta), encoding='utf-8')
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        old = moved = None
+        if path.is_symlink():
+            old = path.resolve()
+        elif path.exists():
+            old = moved = path.with_name(f"{path.name}.old-{uuid.uuid4().hex[:8]}")
+            path.rename(moved)
+        link = path.with_name(f"{path.name}.link-{uuid.uuid4().hex[:8]}")
+        try:
+            link.symlink_to(tmp.name, target_is_directory=True)
+            os.replace(link, path)
+        except BaseException:
+            link.unlink(missing_ok=True)
+            shutil.rmtree(tmp, ignore_errors=True)
+            if moved is not None:
+                moved.rename(path)
+            raise
+        if old is not None and old != tmp:
+            shutil.rmtree(old, ignore_errors=True)
+        return cls(path)
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def rows(self) -> dict:
+        """Chunk id -> row (built on first use)."""
+        if self._rows is None:
+            self._rows = {self.ids[row]: row for row in range(len(self))}
+        return self._rows
+
+    def metadata_index(self) -> MetadataIndex:
+        """Build the tag/link index over the stored chunk metadata."""
+        return MetadataIndex.from_metadatas(
+            [self.ids[row] for row in range(len(self))],
+            [json.loads(self.metadatas[row]) for row in range(len(self))],
+        )
+
+    def size_bytes(self, include_fp32: bool = True) -> int:
+        """Total size of the store's files."""
+        return sum(
+            f.stat().st_size for f in self.directory.iterdir()
+            if include_fp32 or f.name != 'vectors_fp32.npy'
+        )
+
+    def scores(self, query_embedding, rows=None) -> np.ndarray:
+        """
+        Approximate cosine similarity of the query to every (or the given) row.
+
+        Args:
+            query_embedding: The query embedding (need not be normalized)
+            rows: Optional array of row indices to score
+
+        Returns:
+            float32 array of scores, aligned with `rows` (or all rows)
+        """
+        query = _normalize(query_embedding)[0]
+        source = self.vectors if rows is None else self.vectors[rows]
+        scores = np.empty(source.shape[0], dtype=np.float32)
+        for start in range(0, source.shape[0], BLOCK_ROWS):
+            block = np.asarray(source[start:start + BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        if self.scales is not None:
+            scores *= self.scales if rows is None else self.scales[rows]
+        return scores
+
+    def search(self, query_embedding, k: int, rows=None,
+               rescore_factor: int = QUANTIZED_RESCORE_FACTOR) -> list:
+        """
+        Find the k rows most similar to the query.
+
+        Args:
+            query_embedding: The query embedding (need not be normalized)
+            k: Number of results to return
+            rows: Optional row indices to restrict the search to
+            rescore_factor: Rescore the best k * rescore_factor quantized hits
+                            with the float32 vectors (None or 0: no rescoring;
+                            ignored if the store has no float32 copy)
+
+        Returns:
+            List of tuples (row_index, cosine_similarity) sorted by similarity
+        """
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.intp)
+        n = len(self) if rows is None else len(rows)
+        if n == 0 or k <= 0:
+            return []
+
+        scores = self.scores(query_embedding, rows)
+        rescore = bool(rescore_factor) and self.fp32 is not None
+        top = top_k(scores, k * rescore_factor if rescore else k)
+        candidates = top if rows is None else rows[top]
+        if not rescore:
+            return [(int(row), float(score)) for row, score in zip(candidates, scores[top])]
+
+        order = np.sort(candidates)  # read the float32 rows in file order
+        exact = np.asarray(self.fp32[order]) @ _normalize(query_embedding)[0]
+        best = top_k(exact, k)
+        return [(int(order[i]), float(exact[i])) for i in best]
+
+
+def export_collection(collection, path=QUANTIZED_STORE_PATH, dtype: str = QUANTIZED_DTYPE,
+                      keep_fp32: bool = QUANTIZED_KEEP_FP32,
+                      batch_size: int = CHROMA_WRITE_BATCH_SIZE) -> QuantizedStore:
+    """
+    Export a ChromaDB collection to a quantized store, page by page.
+
+    Args:
+        collection: The ChromaDB collection
+        path: Store directory (replaced if it exists)
+        dtype: One of DTYPES
+        keep_fp32: Also store float32 vectors for rescoring
+        batch_size: Chunks read from the collection per request
+
+    Returns:
+        The opened store
+    """
+    count = collection.count()
+    if count == 0:
+        raise RuntimeError(f"Collection '{collection.name}' is empty; nothing to export.")
+    first = collection.get(include=['embeddings'], limit=1)
+    dim = len(first['embeddings'][0])
+
+    def pages():
+        for offset in range(0, count, batch_size):
+            page = collection.get(include=['embeddings', 'documents', 'metadatas'],
+                                  limit=batch_size, offset=offset)
+            yield page['embeddings'], page['documents'], page['ids'], page['metadatas']
+
+    return QuantizedStore.write(path, pages(), dim, count, dtype=dtype, keep_fp32=keep_fp32,
+                                source=f"chroma:{collection.name}")
+
+
+def _dir_bytes(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+
+
+def chroma_footprint(path=CHROMA_DB_PATH) -> int:
+    """Bytes used by ChromaDB's own files (its SQLite file and segment directories)."""
+    path = Path(path)
+    total = 0
+    for entry in path.iterdir():
+        if entry.name.startswith('chroma.sqlite3'):
+            total += entry.stat().st_size
+        elif entry.is_dir():
+            try:
+                uuid.UUID(entry.name)
+            except ValueError:
+                continue
+            total += _dir_bytes(entry)
+    return total
+
+
+def recall(expected: list, found: list) -> float:
+    """Fraction of the expected ids that were found."""
+    return len(set(expected) & set(found)) / len(expected) if expected else 1.0
+
+
+def compare_with_chroma(path=QUANTIZED_STORE_PATH, queries: int = 100,
+                        k: int = CANDIDATES_TO_RETRIEVE, seed: int = 0) -> dict:
+    """
+    Compare the store with the ChromaDB collection it was exported from.
+
+    Queries are stored chunk embeddings, sampled at random. Recall@k is
+    measured against exact float32 search over the collection's vectors.
+
+    Args:
+        path: Store directory
+        queries: Number of sample queries
+        k: Results per query
+        seed: Sampling seed
+
+    Returns:
+        Dict with sizes, cold-load times and recall figures
+    """
+    import chromadb
+
+    # Cold load + first query, excluding the chromadb import itself
+    start = time.perf_counter()
+    collection = chromadb.PersistentClient(path=CHROMA_DB_PATH).get_collection(name=COLLECTION_NAME)
+    stored = collection.get(include=['embeddings'], limit=1)
+    collection.query(query_embeddings=[stored['embeddings'][0]], n_results=k)
+    chroma_load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    store = QuantizedStore(path)
+    store.search(stored['embeddings'][0], k)
+    store_load = time.perf_counter() - start
+
+    exact = np.empty((len(store), store.meta['dim']), dtype=np.float32)
+    for offset in range(0, len(store), CHROMA_WRITE_BATCH_SIZE):
+        page = collection.get(include=['embeddings'], limit=CHROMA_WRITE_BATCH_SIZE, offset=offset)
+        for chunk_id, embedding in zip(page['ids'], page['embeddings']):
+            exact[store.rows[chunk_id]] = embedding
+    exact = _normalize(exact)
+
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(store), size=min(queries, len(store)), replace=False)
+    recalls = {'quantized': [], 'rescored': [], 'chroma_hnsw': []}
+    for row in sample:
+        query = exact[row]
+        expected = [store.ids[i] for i in top_k(exact @ query, k)]
+        recalls['quantized'].append(recall(expected, [store.ids[i] for i, _ in store.search(query, k, rescore_factor=0)]))
+        if store.fp32 is not None:
+            recalls['rescored'].append(recall(expected, [store.ids[i] for i, _ in store.search(query, k)]))
+        hits = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+        recalls['chroma_hnsw'].append(recall(expected, hits['ids'][0]))
+
+    return {
+        'chunks': len(store),
+        'dtype': store.dtype,
+        'chroma_bytes': chroma_footprint(),
+        'store_bytes': store.size_bytes(),
+        'store_bytes_without_fp32': store.size_bytes(include_fp32=False),
+        'chroma_load_s': chroma_load,
+        'store_load_s': store_load,
+        'k': k,
+        'queries': len(sample),
+        **{f"recall_{name}": float(np.mean(values)) for name, values in recalls.items() if values},
+    }
+
+
+def main():
+    """Command-line entry point for exporting and reporting."""
+    parser = argparse.ArgumentParser(description="Compact quantized copy of the ChromaDB collection.")
+    parser.add_argument("--export", action="store_true", help="export the collection to QUANTIZED_STORE_PATH")
+    parser.add_argument("--report", action="store_true", help="compare size, load time and recall with ChromaDB")
+    parser.add_argument("--dtype", choices=DTYPES, default=QUANTIZED_DTYPE)
+    parser.add_argument("--no-fp32", action="store_true", help="do not keep float32 vectors for rescoring")
+    parser.add_argument("--path", default=QUANTIZED_STORE_PATH, help="store directory")
+    parser.add_argument("--queries", type=int, default=100, help="sample queries for the recall report")
+    args = parser.parse_args()
+
+    if not (args.export or args.report):
+        parser.print_help()
+        return
+
+    if args.export:
+        import chromadb
+
+        collection = chromadb.PersistentClient(path=CHROMA_DB_PATH).get_collection(name=COLLECTION_NAME)
+        start = time.perf_counter()
+        store = export_collection(collection, args.path, dtype=args.dtype, keep_fp32=not args.no_fp32)
+        print(f"Exported {len(store)} chunks ({store.dtype}) to {store.path} "
+              f"in {time.perf_counter() - start:.1f}s ({store.size_bytes() / 1e6:.1f} MB).")
+
+    if args.report:
+        report = compare_with_chroma(args.path, queries=args.queries)
+        mb = 1e6
+        print("=" * 60)
+        print(f"Chunks:                 {report['chunks']} ({report['dtype']})")
+        print(f"ChromaDB size:          {report['chroma_bytes'] / mb:.1f} MB")
+        print(f"Store size:             {report['store_bytes'] / mb:.1f} MB "
+              f"({report['store_bytes_without_fp32'] / mb:.1f} MB without float32 copy)")
+        print(f"ChromaDB load + query:  {report['chroma_load_s'] * 1000:.0f} ms")
+        print(f"Store load + query:     {report['store_load_s'] * 1000:.0f} ms")
+        print(f"Recall@{report['k']} over {report['queries']} queries (vs exact float32):")
+        for name in ('quantized', 'rescored', 'chroma_hnsw'):
+            if f"recall_{name}" in report:
+                print(f"  {name:<20} {report[f'recall_{name}']:.4f}")
+        print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
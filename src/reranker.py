@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Cross-encoder reranker loading for the RAG system.
+Runs RERANKER_MODEL_NAME on one of several CPU inference backends:
+
+- "torch":      full-precision PyTorch (default)
+- "torch-int8": PyTorch with int8 dynamic quantization of the Linear layers
+- "onnx":       exported ONNX graph on onnxruntime (needs `optimum[onnxruntime]`)
+
+Usage:
+    python reranker.py --check [--backend torch-int8]
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from config import (
+    RERANKER_MODEL_NAME,
+    RERANKER_BACKEND,
+    RERANKER_ONNX_FILE,
+    RERANKER_NUM_THREADS,
+    RERANKER_MAX_LENGTH,
+    RERANKER_BATCH_SIZE,
+    DATASET_PATH,
+)
+
+BACKENDS = ("torch", "torch-int8", "onnx")
+
+# Note bundled with the repository, used when DATASET_PATH is missing
+BUNDLED_DATASET_PATH = Path(__file__).resolve().parent.parent / "assets" / "dataset.txt"
+
+
+def load_reranker(backend: str = RERANKER_BACKEND, model_name: str = RERANKER_MODEL_NAME):
+    """
+    Load the cross-encoder on the requested inference backend.
+
+    Args:
+        backend: One of BACKENDS
+        model_name: Hugging Face model id or local path
+
+    Returns:
+        A CrossEncoder whose `predict` accepts lists of [query, passage] pairs
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown reranker backend '{backend}'. Choose one of: {', '.join(BACKENDS)}")
+
+    if backend == "onnx":
+        return _load_onnx(model_name)
+
+    import torch
+    from sentence_transformers.cross_encoder import CrossEncoder
+    if RERANKER_NUM_THREADS:
+        torch.set_num_threads(RERANKER_NUM_THREADS)
+
+    model = CrossEncoder(model_name, device="cpu", max_length=RERANKER_MAX_LENGTH)
+    if backend == "torch-int8":
+        # Older sentence-transformers keep the HF model on `.model`; newer
+        # CrossEncoders are nn.Modules themselves.
+        target = model if isinstance(model, torch.nn.Module) else model.model
+        torch.ao.quantization.quantize_dynamic(
+            target, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+    return model
+
+
+def _load_onnx(model_name: str):
+    """Load the cross-encoder through sentence-transformers' ONNX backend."""
+    from sentence_transformers.cross_encoder import CrossEncoder
+    try:
+        import onnxruntime
+    except ImportError:
+        raise RuntimeError(
+            "The 'onnx' reranker backend needs onnxruntime. "
+            "Install it with: pip install 'optimum[onnxruntime]'"
+        )
+
+    session_options = onnxruntime.SessionOptions()
+    if RERANKER_NUM_THREADS:
+        session_options.intra_op_num_threads = RERANKER_NUM_THREADS
+        session_options.inter_op_num_threads = 1
+
+    model_kwargs = {"provider": "CPUExecutionProvider", "session_options": session_options}
+    if RERANKER_ONNX_FILE:
+        model_kwargs["file_name"] = RERANKER_ONNX_FILE
+
+    try:
+        return CrossEncoder(
+            model_name,
+            backend="onnx",
+            max_length=RERANKER_MAX_LENGTH,
+            model_kwargs=model_kwargs,
+        )
+    except TypeError:
+        raise RuntimeError(
+            "The 'onnx' reranker backend needs sentence-transformers>=4.1 "
+            "(CrossEncoder backend support)."
+        )
+
+
+def _ranks(values) -> list:
+    """Return the 0-based rank of each value (ties broken by position)."""
+    order = sorted(range(len(values)), key=lambda i: values[i])
+    ranks = [0] * len(values)
+    for rank, i in enumerate(order):
+        ranks[i] = rank
+    return ranks
+
+
+def spearman(a, b) -> float:
+    """Spearman rank correlation between two equally long score lists."""
+    n = len(a)
+    if n < 2:
+        return 1.0
+    ra, rb = _ranks(list(a)), _ranks(list(b))
+    d2 = sum((x - y) ** 2 for x, y in zip(ra, rb))
+    return 1 - 6 * d2 / (n * (n * n - 1))
+
+
+def _timed_predict(model, pairs: list, repeats: int):
+    """Run predict `repeats` times; return (scores, best wall time in seconds)."""
+    scores = model.predict(pairs, batch_size=RERANKER_BATCH_SIZE)  # warm-up
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        scores = model.predict(pairs, batch_size=RERANKER_BATCH_SIZE)
+        best = min(best, time.perf_counter() - start)
+    return scores, best
+
+
+def check_backend(backend: str, repeats: int = 3) -> dict:
+    """
+    Compare a backend against the fp32 PyTorch model on the bundled dataset.
+
+    Every evaluation question is paired with every dataset chunk. Both models
+    score the same pairs; the report contains the latency of each and the
+    mean per-question Spearman correlation of their scores.
+
+    Args:
+        backend: The backend to compare against "torch"
+        repeats: Timed runs per model (the best run is reported)
+
+    Returns:
+        Dict with latency, speedup and rank-correlation figures
+    """
+    from obsidian import chunk_by_headers_obsidian
+    from eval_dataset import EVALUATION_DATASET
+
+    dataset_path = Path(DATASET_PATH)
+    if not dataset_path.exists():
+        dataset_path = BUNDLED_DATASET_PATH
+    chunks = [c["content"] for c in chunk_by_headers_obsidian(dataset_path.read_text(encoding="utf-8"))]
+    questions = [item["question"] for item in EVALUATION_DATASET]
+    pairs = [[question, chunk] for question in questions for chunk in chunks]
+
+    print(f"Scoring {len(pairs)} pairs from {dataset_path}...")
+    baseline_scores, baseline_time = _timed_predict(load_reranker("torch"), pairs, repeats)
+    scores, backend_time = _timed_predict(load_reranker(backend), pairs, repeats)
+
+    correlations = []
+    for q in range(len(questions)):
+        rows = slice(q * len(chunks), (q + 1) * len(chunks))
+        correlations.append(spearman(baseline_scores[rows], scores[rows]))
+
+    return {
+        "backend": backend,
+        "pairs": len(pairs),
+        "fp32_ms": baseline_time * 1000,
+        "backend_ms": backend_time * 1000,
+        "speedup": baseline_time / backend_time if backend_time else float("inf"),
+        "spearman_mean": sum(correlations) / len(correlations),
+        "spearman_min": min(correlations),
+    }
+
+
+def main():
+    """Command-line entry point for the backend check."""
+    parser = argparse.ArgumentParser(description="Cross-encoder reranker backends.")
+    parser.add_argument("--backend", choices=BACKENDS, default=RERANKER_BACKEND,
+                        help="backend to check against fp32 PyTorch")
+    parser.add_argument("--check", action="store_true",
+                        help="report latency speedup and rank correlation vs fp32")
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per model")
+    args = parser.parse_args()
+
+    if not args.check:
+        parser.print_help()
+        return
+
+    report = check_backend(args.backend, repeats=args.repeats)
+    print("=" * 60)
+    print(f"Backend:            {report['backend']}")
+    print(f"Pairs scored:       {report['pairs']}")
+    print(f"fp32 latency:       {report['fp32_ms']:.1f} ms")
+    print(f"Backend latency:    {report['backend_ms']:.1f} ms")
+    print(f"Speedup:            {report['speedup']:.2f}x")
+    print(f"Spearman (mean):    {report['spearman_mean']:.4f}")
+    print(f"Spearman (min):     {report['spearman_min']:.4f}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
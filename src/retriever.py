@@ -1,113 +1,519 @@
 """
 Retriever class for the RAG system.
-Handles two-stage retrieval: initial ChromaDB search followed by cross-encoder reranking.
+Handles two-stage retrieval: a first-stage search over one or more shards
+(ChromaDB collections, local datasets or quantized stores, see shards.py)
+followed by cross-encoder reranking.
 """
 
-import ollama
-import chromadb
-from sentence_transformers.cross_encoder import CrossEncoder
-from pathlib import Path
-from obsidian import chunk_by_headers_obsidian
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as ShardTimeoutError
+from typing import NamedTuple
+
+import tracing
+from shards import (
+    VaultShard, QuantizedShard, ChromaShard, default_shard, shards_from_config, merge_hits,
+)
+from metadata_index import query_filters
+from embedder import embed_query, cached_embed_batch
+from lru import LRUCache
+from pipeline import BackgroundTask
+from reranker import load_reranker
+from tracing import span, HistogramSink
 from config import (
-    CHROMA_DB_PATH,
-    EMBEDDING_MODEL,
-    RERANKER_MODEL_NAME,
-    COLLECTION_NAME,
+    RERANKER_BACKEND,
     TOP_N,
     CANDIDATES_TO_RETRIEVE,
-    DATASET_PATH,
+    RERANKER_BATCH_SIZE,
+    RERANK_CACHE_SIZE,
+    RERANK_MODE,
+    CASCADE_HEAD_SIZE,
+    CASCADE_EXTEND_MARGIN,
+    CASCADE_SKIP_MARGIN,
+    QUERY_METADATA_FILTERS,
+    SHARDS,
+    SHARD_TIMEOUT,
+    SHARD_MAX_WORKERS,
 )
 
 
+class Retrieval(NamedTuple):
+    """One query's reranked results, with the ids of the chunks and the query's counters."""
+    results: list  # (document, score) tuples sorted by relevance
+    ids: list      # chunk ids aligned with `results`
+    stats: dict    # candidates, pairs_scored, cache_hits, stage, filtered_to, shards
+
+
 class Retriever:
     """Handles document retrieval and reranking for the RAG system."""
     
-    def __init__(self):
-        """Initialize ChromaDB client, collection, and reranker model."""
+    def __init__(self, reranker=None, background: bool = False, shards: list = None):
+        """
+        Open the shards to search, and load the reranker model.
+        
+        Without `shards`, the SHARDS configured in config.py are used, or else
+        the single default corpus: the local dataset, the quantized store at
+        QUANTIZED_STORE_PATH (when USE_QUANTIZED_STORE is on and it was
+        exported with EMBEDDING_MODEL) or the ChromaDB collection.
+        
+        With several shards, each search fans out to all of them on a thread
+        pool; shards that take longer than SHARD_TIMEOUT are left out of that
+        search, and their partial top-k lists are merged by rank (reciprocal
+        rank fusion) before reranking.
+        
+        With `background=True` the reranker and the shards load on background
+        threads and the constructor returns at once; the first query waits
+        only for the parts it still needs. Loading errors (e.g. a missing
+        collection) are then raised by that query, or by `wait_ready()`.
+        
+        Args:
+            reranker: A loaded reranker with a CrossEncoder-style `predict`
+                      (loaded with `load_reranker()` if omitted)
+            background: Load the models and indexes on background threads
+            shards: Shards to search (see shards.py)
+        """
         print("Initializing Retriever...")
         
-        # Initialize ChromaDB client and collection
-        self.client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-        try:
-            self.collection = self.client.get_collection(name=COLLECTION_NAME)
-            print(f"Loaded existing collection with {self.collection.count()} documents.")
-        except ValueError:
-            raise RuntimeError(
-                f"Collection '{COLLECTION_NAME}' not found. "
-                "Please run ingest.py first to populate the database."
+        if shards is None:
+            shards = shards_from_config(SHARDS, background) if SHARDS else [default_shard(background)]
+        self.shards = list(shards)
+        if not self.shards:
+            raise ValueError("The retriever needs at least one shard to search.")
+        self._executor = None
+        if len(self.shards) > 1:
+            print(f"Searching {len(self.shards)} shards: {', '.join(shard.name for shard in self.shards)}.")
+            self._executor = ThreadPoolExecutor(
+                max_workers=min(SHARD_MAX_WORKERS, len(self.shards)), thread_name_prefix="shard-search"
             )
+        # Recent search latency per shard, and timeouts/errors per shard
+        self.shard_latency = HistogramSink()
+        self.shard_failures = {shard.name: {'timeouts': 0, 'errors': 0} for shard in self.shards}
+        
+        # Loading tasks; shard properties and `reranker_model` wait on them
+        self.loading = [task for shard in self.shards for task in shard.loading]
         
         # Initialize reranker model
-        print("Loading reranker model...")
-        self.reranker_model = CrossEncoder(RERANKER_MODEL_NAME)
-        print("Retriever initialization complete.")
+        if reranker is None:
+            print(f"Loading reranker model ({RERANKER_BACKEND} backend)...")
+            self._reranker = BackgroundTask(load_reranker, name="reranker", background=background)
+        else:
+            self._reranker = BackgroundTask.completed(reranker, name="reranker")
+        self.loading.append(self._reranker)
+        # Cross-encoder scores keyed by (normalized query, chunk id)
+        self.score_cache = LRUCache(RERANK_CACHE_SIZE)
+        if background:
+            print("Retriever initialization continues in the background.")
+        else:
+            for shard in self.shards:
+                if isinstance(shard, ChromaShard):
+                    print(f"Loaded existing collection with {shard.collection.count()} documents.")
+                elif isinstance(shard, QuantizedShard):
+                    print(f"Loaded quantized store with {len(shard.store)} documents.")
+            print("Retriever initialization complete.")
     
-    def _retrieve_candidates(self, query: str, top_n: int = CANDIDATES_TO_RETRIEVE) -> list:
+    @property
+    def reranker_model(self):
+        return self._reranker.result()
+    
+    def wait_ready(self, timeout: float = None):
         """
-        Retrieve candidate documents from ChromaDB using cosine similarity.
+        Wait until every background load has finished.
+        
+        Args:
+            timeout: Maximum seconds to wait per load (None waits indefinitely)
         
+        Raises:
+            The first loading error, e.g. RuntimeError for a missing collection
+        """
+        for task in self.loading:
+            task.result(timeout)
+    
+    def close(self):
+        """Stop the shard search threads (searches still running are not waited for) and vault watchers."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        for shard in self.shards:
+            if isinstance(shard, VaultShard):
+                shard.close()
+    
+    def shard_report(self) -> str:
+        """Format per-shard search latency percentiles, timeouts and errors."""
+        summary = self.shard_latency.summary()
+        lines = [f"{'shard':<18} {'searches':>8} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} "
+                 f"{'timeouts':>9} {'errors':>7}"]
+        for shard in self.shards:
+            s = summary.get(shard.name, {'count': 0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0})
+            failures = self.shard_failures[shard.name]
+            lines.append(
+                f"{shard.name:<18} {s['count']:>8} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} "
+                f"{s['max_ms']:>9.1f} {failures['timeouts']:>9} {failures['errors']:>7}"
+            )
+        return "\n".join(lines)
+
+    def _allowed_ids(self, query: str, tags=None, links_to=None):
+        """
+        Resolve the metadata filter for a query to allowed chunk ids per shard.
+
+        Explicit `tags` / `links_to` filters are applied as given (and may match
+        nothing). Otherwise, with QUERY_METADATA_FILTERS, #tags and [[links]]
+        mentioned in the query are used if they match at least one chunk.
+
         Args:
             query: The search query
-            top_n: Number of candidates to retrieve
-            
+            tags: A tag or list of tags the chunks must carry (any of them)
+            links_to: A note or list of notes the chunks must link to (any of them)
+
         Returns:
-            List of tuples (document, similarity_score)
-        """
-        # Prefer using a local dataset file (chunked by headers) if available.
-        dataset_path = Path(DATASET_PATH)
-        if dataset_path.exists():
-            text = dataset_path.read_text(encoding='utf-8')
-            chunks = chunk_by_headers_obsidian(text)
-            # Return chunk text with a neutral similarity score; the reranker will
-            # compute final relevance. Limit to `top_n` results.
-            return [(c['content'], 1.0) for c in chunks][:top_n]
-
-        # Fallback: ChromaDB search (original behavior)
-        query_embedding = ollama.embed(model=EMBEDDING_MODEL, input=query)['embeddings'][0]
-
-        # Query the collection
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_n
-        )
+            List aligned with `self.shards` of sets of allowed (shard-local)
+            chunk ids, or None to search every chunk
+        """
+        indexes = [shard.metadata_index for shard in self.shards]
+
+        def match(**filters):
+            allowed = [index.match(**filters) for index in indexes]
+            return None if all(ids is None for ids in allowed) else allowed
 
-        # Process results
-        retrieved_chunks = []
-        documents = results.get('documents', [[]])[0]
-        distances = results.get('distances', [[]])[0]
+        def matches_any(allowed):
+            return allowed is not None and any(allowed)
 
-        for doc, dist in zip(documents, distances):
-            similarity = 1 - dist  # Convert distance to similarity
-            retrieved_chunks.append((doc, similarity))
+        allowed = match(tags=tags, links_to=links_to)
+        if allowed is not None or not QUERY_METADATA_FILTERS:
+            return allowed
 
-        return retrieved_chunks
+        query_tags, query_links = query_filters(query)
+        if query_tags or query_links:
+            # A tag or link mentioned in passing must not empty the results
+            allowed = match(tags=query_tags, links_to=query_links)
+            if not matches_any(allowed) and query_tags and query_links:
+                allowed = match(tags=query_tags)
+                if not matches_any(allowed):
+                    allowed = match(links_to=query_links)
+        return allowed if matches_any(allowed) else None
+    
+    def _search(self, query: str, top_n: int = CANDIDATES_TO_RETRIEVE,
+                query_embedding: list = None, allowed: list = None) -> list:
+        """
+        Retrieve candidate chunks for one query from every shard (see `_search_batch`).
+        
+        Args:
+            query: The search query
+            top_n: Number of candidates to retrieve
+            query_embedding: Precomputed query embedding, if already available
+            allowed: Per-shard sets of chunk ids to restrict the search to (see `_allowed_ids`)
+            
+        Returns:
+            List of tuples (chunk_id, document, score), best first
+        """
+        if query_embedding is None:
+            query_embedding = embed_query(query)
+        return self._search_batch([query], top_n, [query_embedding], [allowed])[0][0]
+    
+    def _search_batch(self, queries: list, top_n: int, query_embeddings: list, allowed: list):
+        """
+        Retrieve candidate chunks for several queries from every shard.
+        
+        Each shard searches the whole batch in one task. With several shards
+        the tasks run concurrently, and a shard that has not finished within
+        SHARD_TIMEOUT (or fails) is left out of this batch's results. The
+        per-shard top_n lists are then merged by rank into the global top_n
+        (see `merge_hits`).
+        
+        Locally, vector similarity is fused with BM25 keyword scores by
+        reciprocal rank fusion (unless HYBRID_SEARCH is off), so exact phrases
+        and identifiers are found even when their embeddings are not close.
+        
+        Args:
+            queries: The search queries
+            top_n: Number of candidates to retrieve per query
+            query_embeddings: Embeddings aligned with `queries`
+            allowed: Per-query results of `_allowed_ids`
+            
+        Returns:
+            Tuple (candidates, shard_stats): per-query lists of (chunk_id,
+            document, score) tuples, best first, and a dict of shard name ->
+            search milliseconds, or 'timeout' / 'error'
+        
+        Raises:
+            The first shard error, if every shard failed
+        """
+        jobs = []
+        for i, shard in enumerate(self.shards):
+            shard_allowed = [None if query_allowed is None else query_allowed[i] for query_allowed in allowed]
+            # Queries whose filter matches nothing in this shard are not sent to it
+            active = [q for q, ids in enumerate(shard_allowed) if ids is None or ids]
+            if active:
+                jobs.append((shard, active, shard_allowed))
+        
+        partial = []
+        shard_stats = {}
+        if self._executor is None:
+            for job in jobs:
+                hits, seconds = self._search_shard(*job, queries, query_embeddings, top_n)
+                partial.append(hits)
+                shard_stats[job[0].name] = seconds * 1000
+        else:
+            futures = [
+                (job[0], self._executor.submit(self._search_shard, *job, queries, query_embeddings, top_n))
+                for job in jobs
+            ]
+            deadline = time.perf_counter() + SHARD_TIMEOUT
+            errors = []
+            for shard, future in futures:
+                try:
+                    hits, seconds = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+                except ShardTimeoutError:
+                    self.shard_failures[shard.name]['timeouts'] += 1
+                    shard_stats[shard.name] = 'timeout'
+                    continue
+                except Exception as e:
+                    print(f"Shard '{shard.name}' failed: {e}")
+                    self.shard_failures[shard.name]['errors'] += 1
+                    shard_stats[shard.name] = 'error'
+                    errors.append(e)
+                    continue
+                partial.append(hits)
+                shard_stats[shard.name] = seconds * 1000
+            if errors and len(errors) == len(futures):
+                raise errors[0]
+        
+        candidates = [merge_hits([hits[q] for hits in partial], top_n) for q in range(len(queries))]
+        return candidates, shard_stats
+    
+    def _search_shard(self, shard, active: list, allowed: list, queries: list,
+                      query_embeddings: list, top_n: int):
+        """
+        Search one shard for the `active` queries.
+        
+        Returns:
+            Tuple (per-query hit lists aligned with `queries`, seconds taken);
+            chunk ids are prefixed with the shard name when there are several shards
+        """
+        start = time.perf_counter()
+        hits = shard.search_batch(
+            [queries[q] for q in active], [query_embeddings[q] for q in active],
+            top_n, [allowed[q] for q in active],
+        )
+        seconds = time.perf_counter() - start
+        self.shard_latency.record(shard.name, seconds, {}, None)
+        
+        results = [[] for _ in queries]
+        for q, query_hits in zip(active, hits):
+            if self._executor is not None:
+                query_hits = [(f"{shard.name}/{chunk_id}", doc, score) for chunk_id, doc, score in query_hits]
+            results[q] = query_hits
+        if self._executor is not None:
+            tracing.record(f"shard_search:{shard.name}", seconds, queries=len(active))
+        return results, seconds
+    
+    def _retrieve_candidates(self, query: str, top_n: int = CANDIDATES_TO_RETRIEVE) -> list:
+        """
+        Retrieve candidate documents for a query (see `_search`).
+        
+        Args:
+            query: The search query
+            top_n: Number of candidates to retrieve
+            
+        Returns:
+            List of tuples (document, score)
+        """
+        return [(doc, score) for _, doc, score in self._search(query, top_n)]
     
-    def retrieve_and_rerank(self, query: str, top_n: int = TOP_N) -> list:
+    def retrieve_and_rerank(self, query: str, top_n: int = TOP_N,
+                            tags=None, links_to=None) -> list:
         """
-        Perform two-stage retrieval: ChromaDB search followed by cross-encoder reranking.
+        Perform two-stage retrieval: first-stage search followed by cross-encoder reranking.
         
         Args:
             query: The search query
             top_n: Number of final results to return
+            tags: Only consider chunks carrying one of these tags
+            links_to: Only consider chunks linking to one of these notes
             
         Returns:
             List of tuples (document, reranker_score) sorted by relevance
         """
-        # Stage 1: Retrieve candidates from ChromaDB
-        candidate_docs = self._retrieve_candidates(query, top_n=CANDIDATES_TO_RETRIEVE)
+        return self.retrieve_and_rerank_batch(
+            [query], top_n=top_n, tags=tags, links_to=links_to
+        )[0]
+    
+    def retrieve_and_rerank_batch(self, queries: list, top_n: int = TOP_N,
+                                  query_embeddings: list = None,
+                                  tags=None, links_to=None, with_stats: bool = False) -> list:
+        """
+        Retrieve and rerank several queries at once.
+        
+        Query embeddings are computed in one batch, and every (query, chunk) pair
+        missing from the score cache goes through a single reranker `predict`
+        call, instead of one small forward pass per query.
+        
+        With RERANK_MODE = "cascade", only the first CASCADE_HEAD_SIZE candidates
+        are reranked at first; the rest are scored only if the reranker margin
+        at the top_n cutoff is below CASCADE_EXTEND_MARGIN. When the first-stage
+        margin at the cutoff already separates the top_n (see
+        `first_stage_is_decisive`), only those top_n are reranked (stage
+        'skipped'). Either way every returned score is a reranker score.
         
-        if not candidate_docs:
+        Candidates can be narrowed by metadata before any search or scoring:
+        with `tags` / `links_to`, or by #tags and [[links]] found in a query
+        (see `_allowed_ids`).
+        
+        With `with_stats=True` each query's chunk ids and counters (pairs
+        scored, cache hits, cascade stage, per-shard search times) are
+        returned with its results, so concurrent callers each get their own.
+        
+        Args:
+            queries: The search queries
+            top_n: Number of final results to return per query
+            query_embeddings: Precomputed embeddings aligned with `queries`
+            tags: Only consider chunks carrying one of these tags
+            links_to: Only consider chunks linking to one of these notes
+            with_stats: Return a `Retrieval` per query instead of its results only
+            
+        Returns:
+            List aligned with `queries` of lists of (document, score) tuples
+            sorted by relevance (or of `Retrieval`s, with `with_stats`)
+        """
+        if not queries:
             return []
         
-        # Stage 2: Rerank using cross-encoder
-        candidate_chunks = [doc[0] for doc in candidate_docs]
-        sentence_pairs = [[query, chunk] for chunk in candidate_chunks]
+        # Stage 1: Retrieve candidates for every query
+        if query_embeddings is None:
+            with span("query_embed", queries=len(queries)):
+                query_embeddings = cached_embed_batch(list(queries))
+        allowed = [self._allowed_ids(query, tags, links_to) for query in queries]
+        candidates, shard_stats = self._search_batch(
+            list(queries), CANDIDATES_TO_RETRIEVE, query_embeddings, allowed
+        )
+        keys = [normalize_query(query) for query in queries]
+        cascade = RERANK_MODE == "cascade"
+        stats = [
+            {
+                'candidates': len(query_candidates), 'pairs_scored': 0, 'cache_hits': 0, 'stage': 'full',
+                'filtered_to': None if query_allowed is None else sum(
+                    len(ids) for ids in query_allowed if ids is not None
+                ),
+                'shards': shard_stats,
+            }
+            for query_candidates, query_allowed in zip(candidates, allowed)
+        ]
+        
+        # Stage 2: Rerank (the head of) each candidate list in one batched pass
+        to_score = []
+        for i, query_candidates in enumerate(candidates):
+            if cascade and first_stage_is_decisive(query_candidates, top_n):
+                stats[i]['stage'] = 'skipped'
+                to_score.append(query_candidates[:top_n])
+            elif cascade and len(query_candidates) > CASCADE_HEAD_SIZE:
+                stats[i]['stage'] = 'head'
+                to_score.append(query_candidates[:CASCADE_HEAD_SIZE])
+            else:
+                to_score.append(query_candidates)
+        scores = self._score_pairs(queries, keys, to_score, stats)
         
-        # Get reranker scores
-        reranker_scores = self.reranker_model.predict(sentence_pairs)
+        # Stage 3 (cascade only): extend to the remaining candidates where the
+        # head does not clearly separate the top_n from the rest
+        if cascade:
+            extend = [[] for _ in queries]
+            for i, (key, query_candidates) in enumerate(zip(keys, candidates)):
+                if stats[i]['stage'] != 'head':
+                    continue
+                head_scores = sorted(
+                    (scores[(key, chunk_id)] for chunk_id, _, _ in query_candidates[:CASCADE_HEAD_SIZE]),
+                    reverse=True,
+                )
+                if top_n >= len(head_scores) or head_scores[top_n - 1] - head_scores[top_n] < CASCADE_EXTEND_MARGIN:
+                    stats[i]['stage'] = 'extended'
+                    extend[i] = query_candidates[CASCADE_HEAD_SIZE:]
+            if any(extend):
+                scores.update(self._score_pairs(queries, keys, extend, stats))
         
         # Combine chunks with scores and sort by relevance
-        reranked_results = list(zip(candidate_chunks, reranker_scores))
-        reranked_results.sort(key=lambda x: x[1], reverse=True)
+        results = []
+        for i, (key, query_candidates) in enumerate(zip(keys, candidates)):
+            selected = [
+                (chunk_id, doc, scores[(key, chunk_id)])
+                for chunk_id, doc, _ in query_candidates
+                if (key, chunk_id) in scores
+            ]
+            selected.sort(key=lambda x: x[2], reverse=True)
+            selected = selected[:top_n]
+            results.append(Retrieval(
+                [(doc, score) for _, doc, score in selected],
+                [chunk_id for chunk_id, _, _ in selected],
+                stats[i],
+            ))
+        
+        return results if with_stats else [retrieval.results for retrieval in results]
+    
+    def _score_pairs(self, queries: list, keys: list, candidates: list, stats: list) -> dict:
+        """
+        Score (query, chunk) pairs, using the score cache and one `predict` call.
+        
+        Args:
+            queries: The search queries
+            keys: Normalized queries aligned with `queries`
+            candidates: Per-query lists of (chunk_id, document, score) to score
+            stats: Per-query stats dicts; 'pairs_scored' and 'cache_hits' are
+                   updated (a pair already met earlier in the batch counts as a cache hit)
+            
+        Returns:
+            Dict mapping (normalized query, chunk_id) to reranker score
+        """
+        scores = {}
+        pending = {}
+        for i, (query, key, query_candidates) in enumerate(zip(queries, keys, candidates)):
+            for chunk_id, doc, _ in query_candidates:
+                cache_key = (key, chunk_id)
+                if cache_key in scores or cache_key in pending:
+                    # Scored (or looked up) for an earlier query of this batch
+                    stats[i]['cache_hits'] += 1
+                    continue
+                cached = self.score_cache.get(cache_key)
+                if cached is not None:
+                    scores[cache_key] = cached
+                    stats[i]['cache_hits'] += 1
+                else:
+                    pending[cache_key] = (query, doc)
+                    stats[i]['pairs_scored'] += 1
+        
+        if pending:
+            sentence_pairs = [[query, doc] for query, doc in pending.values()]
+            with span("rerank_predict", pairs=len(sentence_pairs)):
+                reranker_scores = self.reranker_model.predict(
+                    sentence_pairs, batch_size=RERANKER_BATCH_SIZE
+                )
+            for cache_key, score in zip(pending, reranker_scores):
+                scores[cache_key] = float(score)
+                self.score_cache.put(cache_key, float(score))
+        
+        return scores
+
+
+def first_stage_is_decisive(candidates: list, top_n: int) -> bool:
+    """
+    Decide whether first-stage scores alone separate the top_n candidates.
+    
+    The gap is measured against the spread of the candidates' scores, so
+    the test means the same for cosine similarities and for RRF scores,
+    whose values are small and close together.
+    
+    Args:
+        candidates: List of (chunk_id, document, score) sorted by score
+        top_n: Number of results that will be returned
         
-        return reranked_results[:top_n]
+    Returns:
+        True if the gap between the scores at ranks top_n and top_n + 1,
+        relative to the gap between the first and last candidate, is at
+        least CASCADE_SKIP_MARGIN
+    """
+    if CASCADE_SKIP_MARGIN is None or len(candidates) <= top_n:
+        return False
+    spread = candidates[0][2] - candidates[-1][2]
+    if spread <= 0:
+        return False
+    gap = candidates[top_n - 1][2] - candidates[top_n][2]
+    return gap / spread >= CASCADE_SKIP_MARGIN
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query for cache lookups (case and whitespace insensitive)."""
+    return ' '.join(query.lower().split())
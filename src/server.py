@@ -0,0 +1,293 @@
+"""
+Long-lived HTTP query server for the RAG system.
+Loads the Retriever once and serves /retrieve and /answer (streamed) to many
+clients. Concurrent retrieval requests arriving within a short window are
+coalesced into one batched embedding call and one reranker `predict` call.
+
+Usage:
+    python main.py --serve [--host 127.0.0.1] [--port 8000]
+
+Endpoints:
+    POST /retrieve  {"query": "...", "top_n": 3}  -> {"results": [{"document", "score"}], "stage"}
+    POST /answer    {"query": "..."}              -> streamed text/plain answer
+    GET  /health
+"""
+
+import json
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from generator import generate_answer, format_context
+from config import (
+    TOP_N,
+    CANDIDATES_TO_RETRIEVE,
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_BATCH_WINDOW,
+    SERVER_MAX_BATCH,
+    SERVER_QUEUE_SIZE,
+    SERVER_REQUEST_TIMEOUT,
+    SERVER_GENERATE_CONCURRENCY,
+)
+
+
+class ServerBusy(Exception):
+    """Raised when the request queue is full."""
+
+
+class MicroBatchScheduler:
+    """Coalesces concurrent retrieval requests into batched retriever calls.
+
+    Requests wait in a bounded queue. A single worker thread takes the first
+    waiting request, keeps collecting for up to `window` seconds (or until
+    `max_batch` requests), then runs one `retrieve_and_rerank_batch` call per
+    distinct top_n. Requests whose deadline passed while queued are dropped.
+    """
+
+    def __init__(self, retriever, window: float = SERVER_BATCH_WINDOW,
+                 max_batch: int = SERVER_MAX_BATCH, queue_size: int = SERVER_QUEUE_SIZE):
+        """
+        Args:
+            retriever: The shared Retriever
+            window: Seconds to wait for more requests after the first arrives
+            max_batch: Maximum requests per batch
+            queue_size: Maximum waiting requests before new ones are rejected
+        """
+        self.retriever = retriever
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batches = 0
+        self.requests = 0
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+
+    def start(self):
+        """Start the worker thread."""
+        self._thread.start()
+
+    def submit(self, query: str, top_n: int = TOP_N, timeout: float = SERVER_REQUEST_TIMEOUT) -> list:
+        """
+        Queue a retrieval request and wait for its result.
+
+        Args:
+            query: The search query
+            top_n: Number of final results to return
+            timeout: Seconds before the request is abandoned
+
+        Returns:
+            The query's `Retrieval`: (document, score) tuples sorted by
+            relevance, their chunk ids and the query's stats
+
+        Raises:
+            ServerBusy: If the queue is full
+            TimeoutError: If the deadline passes before the result is ready
+        """
+        future = Future()
+        deadline = time.monotonic() + timeout
+        try:
+            self.queue.put_nowait((query, top_n, deadline, future))
+        except queue.Full:
+            raise ServerBusy("Too many pending requests")
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise TimeoutError(f"Request not served within {timeout:.1f}s")
+
+    def _collect(self) -> list:
+        """Block for one request, then gather more within the batching window."""
+        batch = [self.queue.get()]
+        window_end = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = window_end - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            now = time.monotonic()
+            live = []
+            for query, top_n, deadline, future in batch:
+                # Skip requests that were abandoned or expired while queued
+                if deadline < now or not future.set_running_or_notify_cancel():
+                    continue
+                live.append((query, top_n, future))
+            if not live:
+                continue
+
+            self.batches += 1
+            self.requests += len(live)
+            by_top_n = {}
+            for query, top_n, future in live:
+                by_top_n.setdefault(top_n, []).append((query, future))
+
+            for top_n, group in by_top_n.items():
+                try:
+                    results = self.retriever.retrieve_and_rerank_batch(
+                        [query for query, _ in group], top_n=top_n, with_stats=True
+                    )
+                except Exception as e:
+                    for _, future in group:
+                        future.set_exception(e)
+                    continue
+                for (_, future), result in zip(group, results):
+                    future.set_result(result)
+
+
+class RAGRequestHandler(BaseHTTPRequestHandler):
+    """HTTP handler for the query server; `server.app` is the RAGServer."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/health":
+            scheduler = self.server.app.scheduler
+            latency = scheduler.retriever.shard_latency.summary()
+            self._send_json(200, {
+                "status": "ok",
+                "queued": scheduler.queue.qsize(),
+                "batches": scheduler.batches,
+                "requests": scheduler.requests,
+                "shards": {
+                    name: dict(latency.get(name, {}), **failures)
+                    for name, failures in scheduler.retriever.shard_failures.items()
+                },
+            })
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            query = str(body["query"]).strip()
+            top_n = int(body.get("top_n", TOP_N))
+            timeout = float(body.get("timeout", SERVER_REQUEST_TIMEOUT))
+        except (ValueError, KeyError, TypeError, OverflowError):
+            self._send_json(400, {"error": "Expected a JSON body with a 'query' field"})
+            return
+        if not query:
+            self._send_json(400, {"error": "Empty query"})
+            return
+        if top_n < 1:
+            self._send_json(400, {"error": "'top_n' must be at least 1"})
+            return
+        if not math.isfinite(timeout) or timeout <= 0:
+            self._send_json(400, {"error": "'timeout' must be a positive number of seconds"})
+            return
+        # Only CANDIDATES_TO_RETRIEVE candidates are reranked per query
+        top_n = min(top_n, CANDIDATES_TO_RETRIEVE)
+
+        if self.path == "/retrieve":
+            self._retrieve(query, top_n, timeout)
+        elif self.path == "/answer":
+            self._answer(query, top_n, timeout)
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def _retrieve(self, query: str, top_n: int, timeout: float):
+        retrieval = self._submit(query, top_n, timeout)
+        if retrieval is not None:
+            self._send_json(200, {
+                "results": [{"document": doc, "score": float(score)} for doc, score in retrieval.results],
+                "stage": retrieval.stats['stage'],
+            })
+
+    def _answer(self, query: str, top_n: int, timeout: float):
+        start = time.monotonic()
+        retrieval = self._submit(query, top_n, timeout)
+        if retrieval is None:
+            return
+        results = retrieval.results
+        if not results:
+            self._send_json(200, {"answer": None, "error": "No relevant information found"})
+            return
+
+        app = self.server.app
+        if not app.generate_slots.acquire(timeout=max(0.0, timeout - (time.monotonic() - start))):
+            self._send_json(503, {"error": "All generation slots are busy"})
+            return
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for chunk in generate_answer(format_context(results, query), query, stream=True):
+                    self._write_chunk(chunk.encode("utf-8"))
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            except Exception as e:
+                self._write_chunk(f"\n[error generating answer: {e}]".encode("utf-8"))
+            self._write_chunk(b"")
+        finally:
+            app.generate_slots.release()
+
+    def _submit(self, query: str, top_n: int, timeout: float):
+        """Run a request through the scheduler; send an error response and return None on failure."""
+        try:
+            return self.server.app.scheduler.submit(query, top_n=top_n, timeout=timeout)
+        except ServerBusy as e:
+            self._send_json(503, {"error": str(e)})
+        except TimeoutError as e:
+            self._send_json(504, {"error": str(e)})
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+        return None
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Keep the console quiet; errors are reported in responses
+        pass
+
+
+class RAGServer:
+    """Owns the shared Retriever, the scheduler and the HTTP server."""
+
+    def __init__(self, retriever, host: str = SERVER_HOST, port: int = SERVER_PORT):
+        """
+        Args:
+            retriever: The Retriever shared by all requests
+            host: Interface to bind
+            port: TCP port to listen on
+        """
+        self.scheduler = MicroBatchScheduler(retriever)
+        self.generate_slots = threading.BoundedSemaphore(SERVER_GENERATE_CONCURRENCY)
+        self.httpd = ThreadingHTTPServer((host, port), RAGRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.app = self
+
+    def serve_forever(self):
+        """Start the scheduler and serve until interrupted."""
+        self.scheduler.start()
+        host, port = self.httpd.server_address[:2]
+        print(f"Serving on http://{host}:{port} (POST /retrieve, POST /answer, GET /health)")
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+
+    def shutdown(self):
+        """Stop serving (call from another thread)."""
+        self.httpd.shutdown()
@@ -0,0 +1,569 @@
+"""
+Search shards for the RAG system.
+A shard is one searchable corpus: a ChromaDB collection, a local dataset note
+indexed in-process, an exported quantized store, or a watched vault indexed
+in memory. The Retriever queries
+its shards concurrently and merges their candidates (see `merge_hits`).
+
+Every shard offers the same interface:
+    name            shard name (prefixes its chunk ids when there are several)
+    loading         BackgroundTasks still opening the shard
+    metadata_index  tag/link index over the shard's chunks
+    search_batch    first-stage search for several queries at once
+    fingerprint()   identifies the shard's content for evaluation checkpoints
+"""
+
+import hashlib
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from chunk_store import ChunkStore
+from vector_index import VectorIndex
+from bm25 import BM25Index
+from fusion import reciprocal_rank_fusion
+from metadata_index import MetadataIndex
+from embedder import embed_texts
+from pipeline import BackgroundTask
+from quantized_store import QuantizedStore
+from tracing import span
+from vault import chunk_file, relative_source
+from watcher import VaultWatcher
+from config import (
+    CHROMA_DB_PATH,
+    VAULT_PATH,
+    EMBEDDING_MODEL,
+    COLLECTION_NAME,
+    DATASET_PATH,
+    LOCAL_INDEX_PATH,
+    HYBRID_SEARCH,
+    RRF_K,
+    CHUNK_STORE_CHECK_INTERVAL,
+    QUANTIZED_STORE_PATH,
+    USE_QUANTIZED_STORE,
+    WATCH_VAULT,
+    WATCH_INTERVAL,
+)
+
+# Name of the shard built from DATASET_PATH / QUANTIZED_STORE_PATH / COLLECTION_NAME
+DEFAULT_SHARD = "default"
+
+
+class LocalIndex(NamedTuple):
+    """First-stage indexes over one version of the local dataset chunks."""
+    version: int
+    vectors: VectorIndex
+    keywords: BM25Index
+    contents: list
+    ids: list
+    metadata: MetadataIndex
+    rows: dict  # chunk id -> row
+
+
+def search_local_index(local: LocalIndex, queries: list, query_embeddings: list, top_n: int,
+                       allowed: list) -> list:
+    """
+    Search an in-process index; vector similarity is fused with BM25 keyword
+    scores by reciprocal rank fusion unless HYBRID_SEARCH is off.
+
+    Args:
+        local: The index to search
+        queries: The search queries
+        query_embeddings: Embeddings aligned with `queries`
+        top_n: Candidates per query
+        allowed: Per-query sets of chunk ids to restrict the search to (or None)
+
+    Returns:
+        Per-query lists of (chunk_id, document, score), best first; the
+        score is the cosine similarity, or the fused RRF score in hybrid mode
+    """
+    results = []
+    with span("local_search", chunks=len(local.ids), queries=len(queries)):
+        for query, query_embedding, query_allowed in zip(queries, query_embeddings, allowed):
+            rows = None
+            if query_allowed is not None:
+                rows = sorted(local.rows[chunk_id] for chunk_id in query_allowed if chunk_id in local.rows)
+            hits = local.vectors.search(query_embedding, top_n, rows=rows)
+            if HYBRID_SEARCH:
+                keyword_hits = local.keywords.search(
+                    query, top_n, docs=None if rows is None else set(rows)
+                )
+                hits = reciprocal_rank_fusion([hits, keyword_hits])[:top_n]
+            results.append([(local.ids[row], local.contents[row], score) for row, score in hits])
+    return results
+
+
+def _task_name(shard: str, kind: str) -> str:
+    return kind if shard == DEFAULT_SHARD else f"{kind}:{shard}"
+
+
+class LocalShard:
+    """A dataset note chunked by headers and searched in-process."""
+
+    def __init__(self, name: str = DEFAULT_SHARD, path=DATASET_PATH, index_path=LOCAL_INDEX_PATH,
+                 background: bool = False):
+        """
+        Args:
+            name: Shard name
+            path: The markdown/text note to chunk
+            index_path: Where the vector index is saved and reused
+            background: Build (or load) the index on a background thread now;
+                        otherwise it is built by the first search
+        """
+        self.name = name
+        self.index_path = index_path
+        # Parsed dataset chunks, kept in memory and reloaded only on change
+        self.chunk_store = ChunkStore(path)
+        self._local = None  # LocalIndex for the current chunk store version
+        self._lock = threading.Lock()
+        self.loading = []
+        if background:
+            self.loading.append(BackgroundTask(self.index, name=_task_name(name, "local-index")))
+
+    def index(self) -> LocalIndex:
+        """
+        Return the vector and BM25 indexes for the current dataset chunks.
+
+        The indexes are rebuilt only when the chunk store reloads. A saved vector
+        index at `index_path` is reused (memory-mapped) if it was built from
+        the same dataset content and embedding model.
+
+        Returns:
+            LocalIndex whose rows and document ids follow chunk order
+        """
+        version, content_hash, contents, ids, metadatas = self.chunk_store.snapshot()
+        local = self._local
+        if local is not None and local.version == version:
+            return local
+        with self._lock:
+            # Another thread (e.g. the background load) may have built it meanwhile
+            local = self._local
+            if local is not None and local.version == version:
+                return local
+            return self._build_index(version, content_hash, contents, ids, metadatas)
+
+    def _build_index(self, version, content_hash, contents, ids, metadatas) -> LocalIndex:
+        """Build (or load) the indexes for one chunk store snapshot."""
+        meta = {
+            'content_hash': content_hash,
+            'embedding_model': EMBEDDING_MODEL,
+            'count': len(contents),
+        }
+        if VectorIndex.read_meta(self.index_path) == meta:
+            index = VectorIndex.load(self.index_path)
+        else:
+            print(f"Embedding {len(contents)} chunks for the local index of shard '{self.name}'...")
+            embeddings = embed_texts(contents)
+            index = VectorIndex.from_embeddings(embeddings)
+            index.save(self.index_path, meta=meta)
+
+        self._local = LocalIndex(
+            version, index, BM25Index(contents), contents, ids,
+            MetadataIndex.from_metadatas(ids, metadatas),
+            {chunk_id: row for row, chunk_id in enumerate(ids)},
+        )
+        return self._local
+
+    @property
+    def metadata_index(self) -> MetadataIndex:
+        return self.index().metadata
+
+    def fingerprint(self) -> str:
+        return self.chunk_store.snapshot()[1]
+
+    def search_batch(self, queries: list, query_embeddings: list, top_n: int, allowed: list) -> list:
+        """Search the local index (see `search_local_index`)."""
+        return search_local_index(self.index(), queries, query_embeddings, top_n, allowed)
+
+
+class QuantizedShard:
+    """
+    An exported QuantizedStore, searched in-process.
+
+    A re-export (e.g. by ingest.py) swaps in a new version of the store. The
+    shard checks which version the store path points to at most once every
+    `check_interval` seconds, and reopens the store when it changed.
+    """
+
+    def __init__(self, name: str = DEFAULT_SHARD, path=QUANTIZED_STORE_PATH, background: bool = False,
+                 check_interval: float = CHUNK_STORE_CHECK_INTERVAL):
+        """
+        Args:
+            name: Shard name
+            path: Store directory
+            background: Open the store on a background thread
+            check_interval: Minimum number of seconds between checks for a new version
+        """
+        self.name = name
+        self.path = path
+        self.check_interval = check_interval
+        self._task = BackgroundTask(self._open, name=_task_name(name, "quantized-store"),
+                                    background=background)
+        self.loading = [self._task]
+        self._current = None
+        self._last_check = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        """Open the quantized store and index its chunk metadata."""
+        store = QuantizedStore(self.path)
+        return store, store.metadata_index()
+
+    def _state(self) -> tuple:
+        """Return (store, metadata index), reopening the store if a new version was swapped in."""
+        current = self._current or self._task.result()
+        now = time.monotonic()
+        if self._last_check is not None and now - self._last_check < self.check_interval:
+            return current
+        with self._lock:
+            current = self._current or current
+            if self._last_check is not None and now - self._last_check < self.check_interval:
+                return current
+            self._last_check = now
+            if Path(self.path).resolve() == current[0].directory:
+                return current
+            try:
+                self._current = self._open()
+            except (OSError, ValueError) as e:
+                # Keep searching the version already open
+                print(f"Could not reopen quantized store '{self.name}': {e}")
+                return current
+            print(f"Reopened quantized store '{self.name}' ({len(self._current[0])} chunks).")
+            return self._current
+
+    @property
+    def store(self) -> QuantizedStore:
+        return self._state()[0]
+
+    @property
+    def metadata_index(self) -> MetadataIndex:
+        return self._state()[1]
+
+    def fingerprint(self) -> str:
+        # Chunk ids include a hash of their content, so a re-export of edited notes changes it
+        store = self.store
+        ids = sorted(store.ids[row] for row in range(len(store)))
+        digest = hashlib.sha256("\n".join(ids).encode('utf-8')).hexdigest()
+        return f"quantized:{store.dtype}:{digest}"
+
+    def search_batch(self, queries: list, query_embeddings: list, top_n: int, allowed: list) -> list:
+        """Search the store (see `search_local_index`); scores are cosine similarities."""
+        store = self.store
+        results = []
+        with span("quantized_search", chunks=len(store), queries=len(queries)):
+            for query_embedding, query_allowed in zip(query_embeddings, allowed):
+                rows = None
+                if query_allowed is not None:
+                    rows = sorted(store.rows[chunk_id] for chunk_id in query_allowed if chunk_id in store.rows)
+                hits = store.search(query_embedding, top_n, rows=rows)
+                results.append([(store.ids[row], store.texts[row], score) for row, score in hits])
+        return results
+
+
+class ChromaShard:
+    """A ChromaDB collection."""
+
+    def __init__(self, name: str = DEFAULT_SHARD, path=CHROMA_DB_PATH,
+                 collection_name: str = COLLECTION_NAME, background: bool = False):
+        """
+        Args:
+            name: Shard name
+            path: ChromaDB directory
+            collection_name: The collection to search
+            background: Open the collection on a background thread
+        """
+        self.name = name
+        self.path = path
+        self.collection_name = collection_name
+        self._task = BackgroundTask(self._open, name=_task_name(name, "chroma-collection"),
+                                    background=background)
+        self.loading = [self._task]
+
+    def _open(self):
+        """Open the ChromaDB collection and index its chunk metadata."""
+        import chromadb
+
+        # Older chromadb raises ValueError for a missing collection, 1.x NotFoundError
+        not_found = (ValueError, getattr(chromadb.errors, 'NotFoundError', ValueError))
+        client = chromadb.PersistentClient(path=str(self.path))
+        try:
+            collection = client.get_collection(name=self.collection_name)
+        except not_found:
+            raise RuntimeError(
+                f"Collection '{self.collection_name}' not found. "
+                "Please run ingest.py first to populate the database."
+            )
+        stored = collection.get(include=['metadatas'])
+        return collection, MetadataIndex.from_metadatas(stored['ids'], stored['metadatas'])
+
+    @property
+    def collection(self):
+        return self._task.result()[0]
+
+    @property
+    def metadata_index(self) -> MetadataIndex:
+        return self._task.result()[1]
+
+    def fingerprint(self) -> str:
+        # Chunk ids include a hash of their content, so edits change the fingerprint
+        ids = sorted(self.collection.get(include=[])['ids'])
+        return "chroma:" + hashlib.sha256("\n".join(ids).encode('utf-8')).hexdigest()
+
+    def search_batch(self, queries: list, query_embeddings: list, top_n: int, allowed: list) -> list:
+        """
+        Query the collection (see `search_local_index`); scores are
+        cosine similarities. Unfiltered queries go in a single request.
+        """
+        if all(query_allowed is None for query_allowed in allowed):
+            requests = [(list(query_embeddings), None)]
+        else:
+            requests = [
+                ([query_embedding], None if query_allowed is None else sorted(query_allowed))
+                for query_embedding, query_allowed in zip(query_embeddings, allowed)
+            ]
+
+        results = []
+        for embeddings, ids in requests:
+            # Only filtered queries pass `ids`, so unfiltered ones search the whole collection
+            restrict = {} if ids is None else {'ids': ids}
+            with span("chroma_query", n_results=top_n, queries=len(embeddings)):
+                response = self.collection.query(query_embeddings=embeddings, n_results=top_n, **restrict)
+            for query_ids, documents, distances in zip(
+                response.get('ids', []), response.get('documents', []), response.get('distances', [])
+            ):
+                # Convert distance to similarity
+                results.append([(chunk_id, doc, 1 - dist)
+                                for chunk_id, doc, dist in zip(query_ids, documents, distances)])
+        return results
+
+
+class VaultShard:
+    """
+    A vault indexed in memory and re-indexed while notes are edited.
+
+    A background thread polls the vault every `interval` seconds. Changed
+    notes are re-chunked, and only chunks with new ids (new or edited
+    content) are embedded; the others keep their vectors. The next index is
+    built off to the side and swapped in with one reference assignment.
+    Searches read the current index once, so they never wait for a rebuild
+    and never see a half-built index.
+    """
+
+    def __init__(self, name: str = DEFAULT_SHARD, vault=VAULT_PATH, interval: float = WATCH_INTERVAL,
+                 background: bool = False):
+        """
+        Args:
+            name: Shard name
+            vault: The vault directory (or a single note)
+            interval: Seconds between scans for changed notes (None or 0: never re-index)
+            background: Build the first index on a background thread
+        """
+        self.name = name
+        self.vault = Path(vault)
+        self.interval = interval
+        self.watcher = VaultWatcher(vault)
+        self.records = {}  # vault-relative source -> chunk records of that note
+        self.last_refresh = None  # counters of the latest re-index
+        self._current = None  # LocalIndex being searched; replaced, never modified
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._initial = BackgroundTask(self._start, name=_task_name(name, "vault-index"),
+                                       background=background)
+        self.loading = [self._initial]
+
+    def _start(self):
+        """Build the first index, then start watching."""
+        self.refresh()
+        if self.interval:
+            threading.Thread(target=self._watch, name=f"vault-watcher-{self.name}", daemon=True).start()
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Re-indexing vault shard '{self.name}' failed ({e}); retrying in {self.interval}s.")
+
+    def close(self):
+        """Stop watching the vault."""
+        self._stop.set()
+
+    def index(self) -> LocalIndex:
+        """Return the current index (waiting for the first one if needed)."""
+        current = self._current
+        if current is None:
+            self._initial.result()
+            current = self._current
+        return current
+
+    def refresh(self) -> bool:
+        """
+        Re-index the notes changed since the last refresh.
+
+        Returns:
+            True if a new index was swapped in
+        """
+        with self._refresh_lock:
+            changes = self.watcher.scan()
+            current = self._current
+            if current is not None and not changes:
+                return False
+            start = time.perf_counter()
+
+            records = dict(self.records)
+            for source in changes.deleted:
+                records.pop(source, None)
+            for path in changes.changed:
+                source = relative_source(path, self.vault)
+                try:
+                    records[source] = chunk_file(path, self.vault)
+                except OSError:
+                    records.pop(source, None)  # removed since the scan
+
+            chunks = [record for source in sorted(records) for record in records[source]]
+            ids = [record['id'] for record in chunks]
+            contents = [record['document'] for record in chunks]
+            reused = [] if current is None else [row for row, cid in enumerate(ids) if cid in current.rows]
+            reused_rows = set(reused)
+            missing = [row for row in range(len(ids)) if row not in reused_rows]
+
+            if missing:
+                embedded = VectorIndex.from_embeddings(embed_texts([contents[row] for row in missing])).vectors
+                dim = embedded.shape[1]
+            else:
+                dim = current.vectors.vectors.shape[1] if current is not None and len(current.vectors) else 0
+            vectors = np.empty((len(ids), dim), dtype=np.float32)
+            if reused:
+                vectors[reused] = current.vectors.vectors[[current.rows[ids[row]] for row in reused]]
+            if missing:
+                vectors[missing] = embedded
+
+            index = LocalIndex(
+                1 if current is None else current.version + 1,
+                VectorIndex(vectors), BM25Index(contents), contents, ids,
+                MetadataIndex.from_metadatas(ids, [record['metadata'] for record in chunks]),
+                {chunk_id: row for row, chunk_id in enumerate(ids)},
+            )
+            # The swap: searches already running keep the index they started with
+            self._current = index
+            self.records = records
+            self.watcher.accept(changes)
+            self.last_refresh = {
+                'changed_notes': len(changes.changed),
+                'deleted_notes': len(changes.deleted),
+                'chunks': len(ids),
+                'embedded': len(missing),
+                'seconds': time.perf_counter() - start,
+            }
+            if current is not None:
+                print(f"Re-indexed vault shard '{self.name}': {len(changes.changed)} changed and "
+                      f"{len(changes.deleted)} deleted notes, {len(missing)} of {len(ids)} chunks "
+                      f"embedded in {self.last_refresh['seconds']:.2f}s.")
+            return True
+
+    @property
+    def metadata_index(self) -> MetadataIndex:
+        return self.index().metadata
+
+    def fingerprint(self) -> str:
+        # Chunk ids include a hash of their content
+        return "vault:" + hashlib.sha256("\n".join(self.index().ids).encode('utf-8')).hexdigest()
+
+    def search_batch(self, queries: list, query_embeddings: list, top_n: int, allowed: list) -> list:
+        """Search the current index (see `search_local_index`)."""
+        return search_local_index(self.index(), queries, query_embeddings, top_n, allowed)
+
+
+def default_shard(background: bool = False):
+    """
+    Build the single shard searched when no SHARDS are configured.
+
+    With WATCH_VAULT on, VAULT_PATH is indexed in memory and kept up to date
+    (see VaultShard). Otherwise the local dataset at DATASET_PATH is preferred; otherwise the quantized
+    store at QUANTIZED_STORE_PATH when USE_QUANTIZED_STORE is on and it was
+    exported with EMBEDDING_MODEL; otherwise the ChromaDB collection.
+    """
+    if WATCH_VAULT:
+        print(f"Watching vault at {VAULT_PATH} (every {WATCH_INTERVAL}s).")
+        return VaultShard(DEFAULT_SHARD, background=background)
+    if Path(DATASET_PATH).exists():
+        # The local dataset is searched in-process; ChromaDB is not needed.
+        print(f"Using local dataset at {DATASET_PATH}.")
+        return LocalShard(DEFAULT_SHARD, background=background)
+    store_meta = QuantizedStore.read_meta(QUANTIZED_STORE_PATH) if USE_QUANTIZED_STORE else None
+    if store_meta is not None and store_meta.get('embedding_model') == EMBEDDING_MODEL:
+        print(f"Using quantized store at {QUANTIZED_STORE_PATH} ({store_meta['dtype']}).")
+        return QuantizedShard(DEFAULT_SHARD, background=background)
+    return ChromaShard(DEFAULT_SHARD, background=background)
+
+
+def shards_from_config(entries: list, background: bool = False) -> list:
+    """
+    Build shards from SHARDS-style entries.
+
+    Args:
+        entries: Dicts with 'name' and 'type' ("chroma", "local",
+                 "quantized" or "vault"), plus an optional 'path' (ChromaDB
+                 directory, dataset note, store directory or vault),
+                 'collection' (chroma), 'index_path' (local) and 'interval' (vault)
+        background: Open the shards on background threads
+
+    Returns:
+        List of shards
+    """
+    shards = []
+    for entry in entries:
+        name, kind = entry['name'], entry['type']
+        if kind == "chroma":
+            shard = ChromaShard(name, entry.get('path', CHROMA_DB_PATH),
+                                entry.get('collection', COLLECTION_NAME), background=background)
+        elif kind == "local":
+            index_path = entry.get('index_path', Path(LOCAL_INDEX_PATH).with_name(f"local_index_{name}.npy"))
+            shard = LocalShard(name, entry['path'], index_path, background=background)
+        elif kind == "quantized":
+            shard = QuantizedShard(name, entry.get('path', QUANTIZED_STORE_PATH), background=background)
+        elif kind == "vault":
+            shard = VaultShard(name, entry.get('path', VAULT_PATH), entry.get('interval', WATCH_INTERVAL),
+                               background=background)
+        else:
+            raise ValueError(f"Unknown shard type '{kind}' for shard '{name}'. "
+                             "Choose one of: chroma, local, quantized, vault")
+        shards.append(shard)
+    if len({shard.name for shard in shards}) != len(shards):
+        raise ValueError("Shard names must be unique.")
+    return shards
+
+
+def merge_hits(partial_hits: list, top_n: int, k: int = RRF_K) -> list:
+    """
+    Merge per-shard candidate lists into the global top_n.
+
+    Shards score differently (RRF for hybrid local search, cosine similarity
+    elsewhere), so several lists are merged by rank with reciprocal rank
+    fusion rather than by raw score; each shard's own order is kept. Shards
+    can overlap (e.g. a collection and a watched vault of the same notes), so
+    a chunk text found by several shards is kept once, at its best rank. A
+    single list keeps its scores.
+
+    Args:
+        partial_hits: Lists of (chunk_id, document, score), each sorted by score
+        top_n: Number of candidates to keep
+        k: Rank smoothing constant
+
+    Returns:
+        The top_n (chunk_id, document, score) tuples over all lists, best
+        first; with several lists the score is 1 / (k + rank) of the best rank
+    """
+    partial_hits = [hits for hits in partial_hits if hits]
+    if len(partial_hits) <= 1:
+        return list(partial_hits[0][:top_n]) if partial_hits else []
+    best = {}  # document -> (rank, list position, chunk_id)
+    for position, hits in enumerate(partial_hits):
+        for rank, (chunk_id, doc, _) in enumerate(hits, start=1):
+            if doc not in best or rank < best[doc][0]:
+                best[doc] = (rank, position, chunk_id)
+    fused = sorted(best.items(), key=lambda item: item[1][:2])
+    return [(chunk_id, doc, 1.0 / (k + rank)) for doc, (rank, _, chunk_id) in fused[:top_n]]
@@ -0,0 +1,304 @@
+"""
+Lightweight per-stage latency instrumentation for the RAG pipeline.
+
+Stages are wrapped in `with span("stage"):` (or timed elsewhere and passed to
+`record`). Finished spans go to pluggable sinks: an in-memory histogram with
+p50/p95/p99, a JSONL trace file and a Prometheus-text exporter. With no sinks
+installed (the default) `span` returns a shared no-op context manager, so
+instrumented code pays one function call and nothing else.
+
+Stage names used by the pipeline:
+    chunk_load, query_embed, local_search, chroma_query, quantized_search,
+    shard_search:<shard> (with several shards), rerank_predict,
+    prompt_format, llm_first_token, llm_completion
+"""
+
+import json
+import math
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import TRACE_HISTOGRAM_SAMPLES, TRACE_BUCKETS
+
+_sinks = ()
+
+
+class _NoopSpan:
+    """Context manager returned by `span` while tracing is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    """A timed stage; the duration is sent to every sink on exit."""
+
+    __slots__ = ('name', 'attrs', 'start', 'wall_start')
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        _emit(self.name, duration, self.attrs, self.wall_start)
+        return False
+
+    def set(self, **attrs):
+        """Attach attributes (counts, sizes) to the span."""
+        self.attrs.update(attrs)
+
+
+def span(name: str, **attrs):
+    """
+    Time a pipeline stage.
+
+    Usage:
+        with span("rerank_predict", pairs=len(pairs)) as s:
+            ...
+            s.set(cache_hits=hits)
+
+    Args:
+        name: Stage name
+        **attrs: Attributes recorded with the span
+
+    Returns:
+        A context manager (a shared no-op when tracing is disabled)
+    """
+    if not _sinks:
+        return _NOOP
+    return _Span(name, attrs)
+
+
+def record(name: str, seconds: float, **attrs):
+    """
+    Record a duration measured by the caller (e.g. time to first token).
+
+    Args:
+        name: Stage name
+        seconds: Duration in seconds
+        **attrs: Attributes recorded with the span
+    """
+    if _sinks:
+        _emit(name, seconds, attrs, time.time() - seconds)
+
+
+def enabled() -> bool:
+    """Return True if at least one sink is installed."""
+    return bool(_sinks)
+
+
+def enable(*sinks):
+    """Install sinks (in addition to any already installed)."""
+    global _sinks
+    _sinks = _sinks + tuple(sinks)
+
+
+def disable():
+    """Remove every sink, making `span` a no-op again."""
+    global _sinks
+    for sink in _sinks:
+        close = getattr(sink, 'close', None)
+        if close is not None:
+            close()
+    _sinks = ()
+
+
+def _emit(name: str, duration: float, attrs: dict, wall_start: float):
+    for sink in _sinks:
+        sink.record(name, duration, attrs, wall_start)
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile (q in [0, 100]) of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), math.ceil(q / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+class HistogramSink:
+    """Keeps the most recent durations per stage and summarizes percentiles."""
+
+    def __init__(self, max_samples: int = TRACE_HISTOGRAM_SAMPLES):
+        """
+        Args:
+            max_samples: Durations kept per stage (oldest are dropped)
+        """
+        self.max_samples = max_samples
+        self.samples = {}
+        self.counts = {}
+        self.last = {}  # stage -> (duration, attrs) of the latest span
+        self._lock = threading.Lock()
+
+    def record(self, name, duration, attrs, wall_start):
+        with self._lock:
+            if name not in self.samples:
+                self.samples[name] = deque(maxlen=self.max_samples)
+                self.counts[name] = 0
+            self.samples[name].append(duration)
+            self.counts[name] += 1
+            self.last[name] = (duration, attrs)
+
+    def summary(self) -> dict:
+        """
+        Summarize every stage.
+
+        Returns:
+            Dict stage -> {'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'}
+        """
+        with self._lock:
+            snapshot = {name: (self.counts[name], sorted(values)) for name, values in self.samples.items()}
+        summary = {}
+        for name, (count, values) in snapshot.items():
+            summary[name] = {
+                'count': count,
+                'mean_ms': 1000 * sum(values) / len(values),
+                'p50_ms': 1000 * percentile(values, 50),
+                'p95_ms': 1000 * percentile(values, 95),
+                'p99_ms': 1000 * percentile(values, 99),
+                'max_ms': 1000 * values[-1],
+            }
+        return summary
+
+    def report(self) -> str:
+        """Format `summary()` as a table."""
+        lines = [f"{'stage':<18} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+        for name, s in sorted(self.summary().items()):
+            lines.append(
+                f"{name:<18} {s['count']:>7} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} "
+                f"{s['p99_ms']:>9.1f} {s['max_ms']:>9.1f}"
+            )
+        return "\n".join(lines)
+
+    def clear_last(self):
+        """Forget the latest spans (e.g. before handling a new query)."""
+        with self._lock:
+            self.last = {}
+
+
+class JSONLSink:
+    """Appends one JSON object per finished span to a trace file."""
+
+    def __init__(self, path):
+        """
+        Args:
+            path: File to append to
+        """
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def record(self, name, duration, attrs, wall_start):
+        line = json.dumps({
+            'span': name,
+            'start': wall_start,
+            'duration_ms': duration * 1000,
+            'thread': threading.current_thread().name,
+            **attrs,
+        }, default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class PrometheusSink:
+    """Cumulative per-stage histograms rendered in the Prometheus text format."""
+
+    def __init__(self, buckets=TRACE_BUCKETS, metric: str = 'rag_stage_duration_seconds'):
+        """
+        Args:
+            buckets: Bucket upper bounds in seconds
+            metric: Metric name
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.metric = metric
+        self.stages = {}  # stage -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        self._server = None
+
+    def record(self, name, duration, attrs, wall_start):
+        with self._lock:
+            counts = self.stages.get(name)
+            if counts is None:
+                counts = self.stages[name] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += duration
+
+    def render(self) -> str:
+        """Return the metrics in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {self.metric} Duration of RAG pipeline stages.",
+            f"# TYPE {self.metric} histogram",
+        ]
+        with self._lock:
+            stages = {name: list(counts) for name, counts in self.stages.items()}
+        for name, counts in sorted(stages.items()):
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'{self.metric}_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'{self.metric}_bucket{{stage="{name}",le="+Inf"}} {counts[-2]}')
+            lines.append(f'{self.metric}_sum{{stage="{name}"}} {counts[-1]}')
+            lines.append(f'{self.metric}_count{{stage="{name}"}} {counts[-2]}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host: str = "127.0.0.1", port: int = 9100):
+        """
+        Serve `render()` at http://host:port/metrics from a daemon thread.
+
+        Args:
+            host: Interface to bind
+            port: TCP port to listen on
+        """
+        sink = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                data = sink.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,84 @@
+"""
+Obsidian vault traversal and per-file chunking.
+Kept free of heavy imports so chunking can run in worker processes.
+"""
+
+import os
+from collections import Counter
+from pathlib import Path
+
+from obsidian import iter_chunks_obsidian, header_path, chunk_id
+from metadata_index import join_values
+from config import VAULT_EXTENSIONS
+
+
+def iter_vault_files(vault):
+    """
+    Walk a vault directory lazily, yielding note files in a stable order.
+
+    Hidden directories (such as .obsidian and .trash) are skipped. If `vault`
+    is a single file, only that file is yielded.
+
+    Args:
+        vault: Path to the vault directory or a single note
+
+    Yields:
+        Path objects of files whose suffix is in VAULT_EXTENSIONS
+    """
+    vault = Path(vault)
+    if vault.is_file():
+        yield vault
+        return
+    for root, dirs, files in os.walk(vault):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if not name.startswith('.') and os.path.splitext(name)[1].lower() in VAULT_EXTENSIONS:
+                yield Path(root) / name
+
+
+def relative_source(path, vault) -> str:
+    """Return `path` relative to the vault (or its file name for single-file vaults)."""
+    path, vault = Path(path), Path(vault)
+    if vault.is_file():
+        return path.name
+    return path.relative_to(vault).as_posix()
+
+
+def chunk_file(path, vault) -> list:
+    """
+    Chunk one note by headers into ingestion records.
+
+    Chunk ids are derived from the file's vault-relative path, the header
+    path and the content hash, so identical sections in different notes get
+    different ids. Tags, URLs and internal links are stored as newline-joined
+    strings (see `metadata_index.join_values`).
+
+    Args:
+        path: The note file
+        vault: The vault root (or the note itself for single-file vaults)
+
+    Returns:
+        List of dicts with 'id', 'document' and 'metadata' keys
+    """
+    source = relative_source(path, vault)
+
+    records = []
+    occurrences = Counter()
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for chunk in iter_chunks_obsidian(f):
+            headers = header_path(chunk['headers'])
+            path_key = f"{source} > {headers}" if headers else source
+            occurrence = occurrences[(path_key, chunk['content'])]
+            occurrences[(path_key, chunk['content'])] += 1
+            records.append({
+                'id': chunk_id(path_key, chunk['content'], occurrence),
+                'document': chunk['content'],
+                'metadata': {
+                    'source': source,
+                    'header_path': headers,
+                    'tags': join_values(chunk['metadata']['tags']),
+                    'urls': join_values(chunk['metadata']['urls']),
+                    'internal_links': join_values(chunk['metadata']['internal_links']),
+                },
+            })
+    return records
@@ -0,0 +1,137 @@
+"""
+In-process vector index for the RAG system.
+Stores normalized chunk embeddings in one contiguous float32 matrix and ranks
+them with a single matrix-vector product, without needing ChromaDB.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Return the positions of the k highest scores, best first.
+
+    Uses a partial sort (argpartition), so only the top k are fully ordered.
+    """
+    if k >= len(scores):
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class VectorIndex:
+    """Exact cosine-similarity index over a dense float32 matrix."""
+
+    def __init__(self, vectors: np.ndarray):
+        """
+        Args:
+            vectors: (n, dim) float32 matrix of L2-normalized embeddings.
+                     May be a read-only memory map.
+        """
+        if vectors.ndim != 2:
+            raise ValueError(f"Expected a 2-D embedding matrix, got shape {vectors.shape}")
+        self.vectors = vectors
+
+    @classmethod
+    def from_embeddings(cls, embeddings) -> "VectorIndex":
+        """
+        Build an index from raw (unnormalized) embeddings.
+
+        Args:
+            embeddings: Sequence of embedding vectors or a 2-D array
+
+        Returns:
+            A new VectorIndex
+        """
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if vectors.size == 0:
+            vectors = vectors.reshape(0, 0)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors /= norms
+        return cls(vectors)
+
+    @classmethod
+    def load(cls, path, mmap: bool = True) -> "VectorIndex":
+        """
+        Load an index saved with `save`.
+
+        Args:
+            path: Path to the .npy file
+            mmap: Memory-map the file read-only instead of reading it into RAM
+
+        Returns:
+            The loaded VectorIndex
+        """
+        vectors = np.load(path, mmap_mode='r' if mmap else None)
+        return cls(vectors)
+
+    @staticmethod
+    def read_meta(path):
+        """
+        Read the JSON sidecar written next to a saved index.
+
+        Returns:
+            The metadata dict, or None if the index or sidecar is missing
+        """
+        path = Path(path)
+        meta_path = path.with_suffix('.json')
+        if not path.exists() or not meta_path.exists():
+            return None
+        try:
+            return json.loads(meta_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def save(self, path, meta: dict = None):
+        """
+        Save the matrix as a .npy file (loadable with mmap_mode='r').
+
+        Args:
+            path: Destination .npy path
+            meta: Optional JSON-serializable dict written to a .json sidecar
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.save(path, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        if meta is not None:
+            path.with_suffix('.json').write_text(json.dumps(meta), encoding='utf-8')
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    def search(self, query_embedding, k: int, rows=None) -> list:
+        """
+        Find the k rows most similar to the query.
+
+        Args:
+            query_embedding: The query embedding (need not be normalized)
+            k: Number of results to return
+            rows: Optional row indices to restrict the search to; only
+                  those rows are read and scored
+
+        Returns:
+            List of tuples (row_index, cosine_similarity) sorted by similarity
+        """
+        vectors = self.vectors
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.intp)
+            vectors = vectors[rows]
+        n = vectors.shape[0]
+        if n == 0 or k <= 0:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        scores = vectors @ query
+        top = top_k(scores, k)
+
+        if rows is not None:
+            return [(int(rows[i]), float(scores[i])) for i in top]
+        return [(int(i), float(scores[i])) for i in top]
@@ -0,0 +1,64 @@
+"""
+Polling file watcher for the Obsidian vault.
+Detects added, modified and deleted notes by comparing each file's mtime and
+size between scans, so it works the same on every platform without
+OS-specific notification APIs. Used by `shards.VaultShard` to re-index
+edited notes while the system is running.
+"""
+
+import os
+from pathlib import Path
+from typing import NamedTuple
+
+from vault import iter_vault_files, relative_source
+
+
+class VaultChanges(NamedTuple):
+    """Notes that changed since the last accepted scan."""
+    changed: list   # Paths of added or modified notes
+    deleted: list   # vault-relative sources of removed notes
+    signatures: dict  # source -> (mtime_ns, size) for the whole vault
+
+    def __bool__(self) -> bool:
+        return bool(self.changed or self.deleted)
+
+
+class VaultWatcher:
+    """Compares (mtime, size) signatures of the vault's notes between scans."""
+
+    def __init__(self, vault):
+        """
+        Args:
+            vault: The vault directory (or a single note)
+        """
+        self.vault = Path(vault)
+        # Signatures of the last accepted scan; empty, so the first scan reports every note
+        self.signatures = {}
+
+    def scan(self) -> VaultChanges:
+        """
+        Stat every note and compare with the last accepted scan.
+
+        The scan is not remembered until `accept` is called, so changes that
+        failed to be indexed are reported again by the next scan.
+
+        Returns:
+            VaultChanges (falsy if nothing changed)
+        """
+        signatures = {}
+        changed = []
+        for path in iter_vault_files(self.vault):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # removed while scanning
+            source = relative_source(path, self.vault)
+            signatures[source] = (stat.st_mtime_ns, stat.st_size)
+            if self.signatures.get(source) != signatures[source]:
+                changed.append(path)
+        deleted = [source for source in self.signatures if source not in signatures]
+        return VaultChanges(changed, deleted, signatures)
+
+    def accept(self, changes: VaultChanges):
+        """Remember a scan whose changes have been indexed."""
+        self.signatures = changes.signatures